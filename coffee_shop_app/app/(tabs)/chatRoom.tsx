@@ -24,6 +24,7 @@ const ChatRoom = () => {
     const [menuItems, setMenuItems] = useState<Record<string, number>>({});
     const textRef = useRef('');
     const inputRef = useRef<TextInput>(null);
+    const conversationId = useRef(`${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`);
 
     useEffect(() => {
         const loadMenuItems = async () => {
@@ -94,7 +95,7 @@ const ChatRoom = () => {
             inputRef?.current?.clear();
             setIsTyping(true);
 
-            let responseMessage = await callChatBotAPI(InputMessages);
+            let responseMessage = await callChatBotAPI(InputMessages, conversationId.current);
             setIsTyping(false);
             setMessages(prev => [...prev, responseMessage]);
 
@@ -112,7 +112,7 @@ const Home = () => {
                 }
               >
                 <Image
-                  source={{ uri: item.image_url }}
+                  source={{ uri: item.image_list_url ?? item.image_url }}
                   className='w-full h-32 rounded-2xl'
                 />
                 <Text
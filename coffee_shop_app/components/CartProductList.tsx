@@ -18,7 +18,7 @@ const ProductList: React.FC<ProductListProps> = ({ products, quantities, setQuan
     const renderItem = ({ item }: { item: Product }) => (
       <View className="flex-row items-center justify-between mx-7 pb-5 border-b border-gray-100">
         <Image
-          source={{ uri: item.image_url }}
+          source={{ uri: item.image_thumbnail_url ?? item.image_url }}
           className="w-16 h-16 rounded-lg"
         />
         <View className="flex-1 ml-4">
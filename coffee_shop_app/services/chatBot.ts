@@ -2,11 +2,12 @@ import axios from 'axios';
 import { MessageInterface } from '@/types/types';
 import { API_KEY, API_URL } from '@/config/runpodConfigs';
 
-async function callChatBotAPI(messages: MessageInterface[]): Promise<MessageInterface> {
+// conversationId keeps one chat's LLM calls on the same server replica
+async function callChatBotAPI(messages: MessageInterface[], conversationId?: string): Promise<MessageInterface> {
     try {
         console.log("Sending messages to API:", JSON.stringify(messages, null, 2));
         const response = await axios.post(API_URL, {
-            input: { messages }
+            input: { messages, conversation_id: conversationId }
         }, {
             headers: {
                 'Content-Type': 'application/json',
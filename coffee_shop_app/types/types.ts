@@ -4,6 +4,8 @@ export interface Product {
     category: string;
     description: string;
     image_url: string;
+    image_list_url?: string;
+    image_thumbnail_url?: string;
     name: string;
     price: number;
     rating: number;
@@ -5,10 +5,23 @@ from agents import (GuardAgent,
                     RecommendationAgent,
                     AgentProtocol
                     )
+from agents.resilience import request_deadline
+from agents.utils import LLMUnavailableError
+from agents.load_balancer import conversation_scope
+from agents.context_cube import recommendation_scope, RecommendationContext
+from agents.outlet_shards import outlet_scope, get_outlet_catalog_store
+from agents.overload import get_overload_controller, retry_response, SKIP_GUARD, SHED
+from agents.trending import get_trending_counters
+from contextlib import nullcontext
+from agents.log_setup import configure_logging
+from agents.conversation import Conversation
 import os
+import logging
 import pathlib # Import pathlib
 from functools import lru_cache
 
+logger = logging.getLogger("agent_controller")
+
 # Get the directory where the current script is located
 script_dir = pathlib.Path(__file__).parent.resolve()
 
@@ -18,6 +31,8 @@ rec_file2 = script_dir / 'recommendation_objects/popularity_recommendation.csv'
 
 class AgentController():
     def __init__(self):
+        configure_logging()
+
         # Initialize only necessary agents at startup
         self.guard_agent = GuardAgent()
         self.classification_agent = ClassificationAgent()
@@ -28,6 +43,10 @@ class AgentController():
         
         # Add a default agent to handle fallbacks
         self.default_agent = "details_agent"
+
+        # Degrades LLM usage under load (see agents/overload.py); None when OVERLOAD_CONTROL=false
+        self.overload = get_overload_controller()
+        self.catalog_store = get_outlet_catalog_store()
     
     @property
     @lru_cache(maxsize=1)
@@ -48,15 +67,58 @@ class AgentController():
                 self._agent_instances[agent_name] = self.recommendation_agent
         return self._agent_instances.get(agent_name)
     
+    def preload(self):
+        """Creates every agent now instead of on first use, e.g. before forking serving workers."""
+        for agent_name in ("details_agent", "order_taking_agent", "recommendation_agent"):
+            self._get_agent(agent_name)
+
+    def close(self):
+        """Saves what should outlive the process (the trending counts); serving workers call it on exit."""
+        trending = get_trending_counters()
+        if trending is not None:
+            trending.save()
+
     def get_response(self, input):
         # Extract User Input
         job_input = input["input"]
         messages = job_input["messages"]
 
-        # Get GuardAgent's response
-        guard_agent_response = self.guard_agent.get_response(messages)
-        if guard_agent_response["memory"]["guard_decision"] == "not allowed":
-            return guard_agent_response
+        # Every LLM call made for this job shares one deadline instead of a fixed per-call timeout,
+        # and is tagged with the conversation so a balanced pool can keep it on one replica.
+        # An optional "context" ({"outlet_id", "hour", "in_store"}) and "customer_id" tailor
+        # recommendations, and the outlet id picks that outlet's menu and rules when it has its own
+        context = RecommendationContext.from_input(job_input)
+        with request_deadline(job_input.get("deadline_seconds")), \
+                conversation_scope(self._conversation_key(job_input)), \
+                recommendation_scope(context), \
+                outlet_scope(context.outlet_id if context is not None else None), \
+                (self.overload.admit() if self.overload is not None else nullcontext(0)) as level:
+            if level >= SHED:
+                return retry_response()
+            try:
+                return self._route(messages, level)
+            except LLMUnavailableError as e:
+                # Whichever agent's call failed, the guard's included, the turn ends here: a
+                # message is never let through or answered without the LLM's decision
+                logger.warning("No LLM answer for this turn, asking to retry: %s", e)
+                return retry_response()
+
+    def _conversation_key(self, job_input):
+        # Without an id there is no affinity (least-loaded routing): opening messages such as the
+        # app's greeting or "hi" are shared by many conversations and would pin them to one replica
+        conversation_id = job_input.get("conversation_id")
+        return str(conversation_id) if conversation_id else None
+
+    def _route(self, messages, level=0):
+        # One read-only view shared by every agent on this turn instead of a copy per agent
+        messages = Conversation(messages)
+
+        # Get GuardAgent's response; under load, messages naming the menu are let through without it
+        skip_guard = level >= SKIP_GUARD and any(self.catalog_store.current().mentions(messages[-1]["content"]))
+        if not skip_guard:
+            guard_agent_response = self.guard_agent.get_response(messages)
+            if guard_agent_response["memory"]["guard_decision"] == "not allowed":
+                return guard_agent_response
         
         # Get ClassificationAgent's response
         classification_agent_response = self.classification_agent.get_response(messages)
@@ -1,5 +1,7 @@
-from typing import Protocol, List, Dict, Any
+from typing import Protocol, Sequence, Mapping, Dict, Any
 
 class AgentProtocol(Protocol):
-    def get_response(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # messages is a list of message dicts or an agents.conversation.Conversation view; agents
+    # must not modify it
+    def get_response(self, messages: Sequence[Mapping[str, Any]]) -> Dict[str, Any]:
         ...
\ No newline at end of file
@@ -0,0 +1,170 @@
+import csv
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+# Binary layout (little endian), every section 8-byte aligned:
+#   header      MAGIC, then u32 counts (strings, products, rules, popularity rows)
+#   strings     u32 offsets[n_strings + 1] + utf-8 blob; product/category names interned once
+#   products    u32 name_id[n_products]
+#   rules       u32 rule_offsets[n_products + 1] per antecedent, then columns
+#               u32 consequent[n_rules], u32 category_id[n_rules], f64 confidence[n_rules],
+#               each antecedent's slice sorted by confidence descending
+#   popularity  u32 product[n], u32 category_id[n], u32 count[n], sorted by count descending
+MAGIC = b"RECART01"
+HEADER = struct.Struct("<8s4I")
+ARTIFACT_FILE = "recommendations.bin"
+
+
+def _aligned(buffer):
+    buffer += b"\0" * (-len(buffer) % 8)
+    return buffer
+
+
+def convert(apriori_recommendation_path, popular_recommendation_path, output_path):
+    """Writes the compact binary form of an apriori JSON + popularity CSV pair."""
+    with open(apriori_recommendation_path, 'r') as file:
+        apriori = json.load(file)
+    with open(popular_recommendation_path, 'r', newline='') as file:
+        popularity = [(row["product"], row["product_category"], int(row["number_of_transactions"]))
+                      for row in csv.DictReader(file)]
+
+    strings = {}
+
+    def intern(name):
+        return strings.setdefault(name, len(strings))
+
+    products = {}
+
+    def product_id(name):
+        if name not in products:
+            products[name] = len(products)
+            intern(name)
+        return products[name]
+
+    for antecedent, rules in apriori.items():
+        product_id(antecedent)
+        for rule in rules:
+            product_id(rule["product"])
+            intern(rule["product_category"])
+    for name, category, _ in popularity:
+        product_id(name)
+        intern(category)
+
+    rules_by_product = [[] for _ in products]
+    for antecedent, rules in apriori.items():
+        rules_by_product[products[antecedent]] = sorted(rules, key=lambda rule: -rule["confidence"])
+    rule_offsets = np.cumsum([0] + [len(rules) for rules in rules_by_product], dtype=np.uint32)
+    flat_rules = [rule for rules in rules_by_product for rule in rules]
+    popularity.sort(key=lambda row: -row[2])
+
+    encoded = [name.encode() for name in strings]
+    string_offsets = np.cumsum([0] + [len(name) for name in encoded], dtype=np.uint32)
+
+    buffer = bytearray(HEADER.pack(MAGIC, len(strings), len(products), len(flat_rules), len(popularity)))
+    for array in (
+        string_offsets,
+        np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        np.array([strings[name] for name in products], dtype=np.uint32),
+        rule_offsets,
+        np.array([products[rule["product"]] for rule in flat_rules], dtype=np.uint32),
+        np.array([strings[rule["product_category"]] for rule in flat_rules], dtype=np.uint32),
+        np.array([rule["confidence"] for rule in flat_rules], dtype=np.float64),
+        np.array([products[row[0]] for row in popularity], dtype=np.uint32),
+        np.array([strings[row[1]] for row in popularity], dtype=np.uint32),
+        np.array([row[2] for row in popularity], dtype=np.uint32),
+    ):
+        _aligned(buffer)
+        buffer += array.tobytes()
+
+    with open(output_path, 'wb') as file:
+        file.write(bytes(buffer))
+
+
+class RuleView(Mapping):
+    """Read-only {product: [rule dicts]} view over the memory-mapped rule columns.
+
+    Rule dicts are only materialized for the products being looked up.
+    """
+
+    def __init__(self, artifacts):
+        self._artifacts = artifacts
+
+    def __getitem__(self, product):
+        a = self._artifacts
+        product_id = a.product_ids.get(product)
+        if product_id is None:
+            raise KeyError(product)
+        start, end = a.rule_offsets[product_id], a.rule_offsets[product_id + 1]
+        if start == end:
+            raise KeyError(product)
+        return [
+            {"product": a.product_names[consequent], "product_category": a.strings[category], "confidence": float(confidence)}
+            for consequent, category, confidence in zip(
+                a.rule_consequents[start:end].tolist(), a.rule_categories[start:end].tolist(),
+                a.rule_confidences[start:end].tolist())
+        ]
+
+    def __contains__(self, product):
+        product_id = self._artifacts.product_ids.get(product)
+        return product_id is not None and \
+            self._artifacts.rule_offsets[product_id] != self._artifacts.rule_offsets[product_id + 1]
+
+    def __iter__(self):
+        a = self._artifacts
+        return (a.product_names[i] for i in range(len(a.product_names)) if a.rule_offsets[i] != a.rule_offsets[i + 1])
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self._artifacts.rule_offsets)))
+
+
+class CompactArtifacts():
+    """Memory-mapped recommendation artifacts with the same attributes as RecommendationArtifacts.
+
+    The arrays are views onto a shared read-only mapping, so workers forked after loading (or
+    separate processes mapping the same file) share the pages instead of each holding a copy.
+    """
+
+    def __init__(self, path, version=None):
+        self.version = version
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_strings, n_products, n_rules, n_popularity = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compact recommendation artifact")
+
+        self._offset = HEADER.size
+        string_offsets = self._array(np.uint32, n_strings + 1)
+        blob = self._array(np.uint8, int(string_offsets[-1]))
+        name_ids = self._array(np.uint32, n_products)
+        self.rule_offsets = self._array(np.uint32, n_products + 1)
+        self.rule_consequents = self._array(np.uint32, n_rules)
+        self.rule_categories = self._array(np.uint32, n_rules)
+        self.rule_confidences = self._array(np.float64, n_rules)
+        popularity_products = self._array(np.uint32, n_popularity)
+        popularity_categories = self._array(np.uint32, n_popularity)
+        popularity_counts = self._array(np.uint32, n_popularity)
+
+        # The string table is tiny (one entry per distinct name), so decode it once
+        blob = blob.tobytes()
+        self.strings = [blob[string_offsets[i]:string_offsets[i + 1]].decode() for i in range(n_strings)]
+        self.product_names = [self.strings[i] for i in name_ids.tolist()]
+        self.product_ids = {name: i for i, name in enumerate(self.product_names)}
+
+        self.apriori_recommendations = RuleView(self)
+        self.popular_recommendations = pd.DataFrame({
+            "product": [self.product_names[i] for i in popularity_products.tolist()],
+            "product_category": [self.strings[i] for i in popularity_categories.tolist()],
+            "number_of_transactions": popularity_counts,
+        })
+        self.products = self.popular_recommendations['product'].tolist()
+        self.product_categories = self.popular_recommendations['product_category'].tolist()
+
+    def _array(self, dtype, count):
+        self._offset += -self._offset % 8
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._offset)
+        self._offset += array.nbytes
+        return array
@@ -0,0 +1,239 @@
+import os
+import re
+import sys
+import json
+import time
+import pathlib
+import hashlib
+import logging
+import threading
+from .fuzzy_matcher import TrigramIndex
+
+logger = logging.getLogger("catalog")
+
+DEFAULT_PRODUCTS_PATH = pathlib.Path(__file__).resolve().parent.parent.parent / 'products/products.jsonl'
+
+# Other names customers (and the LLM) use for menu items. A product record can add its own
+# with an "aliases" list; aliases of products that are not on the menu are ignored.
+DEFAULT_ALIASES = {
+    "cappucino": "Cappuccino",
+    "capuccino": "Cappuccino",
+    "espresso": "Espresso shot",
+    "expresso": "Espresso shot",
+    "caramel syrup": "Carmel syrup",
+    "vanilla syrup": "Sugar Free Vanilla syrup",
+    "hot chocolate": "Dark chocolate",
+    "savory scone": "Jumbo Savory Scone",
+}
+
+
+def normalize(name):
+    """Lookup key for a product, alias or category name: lowercase, single-spaced."""
+    return " ".join(str(name).lower().split())
+
+
+class Product():
+    """One menu item. Ids are dense positions in the catalog they were loaded with."""
+
+    __slots__ = ("id", "name", "category", "price", "rating", "description", "ingredients", "image_path", "record")
+
+    def __init__(self, product_id, record):
+        self.id = product_id
+        self.name = sys.intern(record["name"])
+        self.category = sys.intern(record.get("category", ""))
+        self.price = float(record.get("price", 0))
+        self.rating = record.get("rating", "")
+        self.description = record.get("description", "")
+        self.ingredients = record.get("ingredients", [])
+        self.image_path = record.get("image_path", "")
+        self.record = record
+
+    def __repr__(self):
+        return f"Product({self.id}, {self.name!r}, RM{self.price:.2f})"
+
+
+class Catalog():
+    """Immutable snapshot of the menu with hash lookups by name, alias, id and category.
+
+    Hot reload builds a new Catalog and swaps the reference, so a request holding one sees
+    consistent names and prices throughout.
+    """
+
+    def __init__(self, records, version=None, aliases=None):
+        self.version = version
+        self.products = []
+        self._by_key = {}
+        self._by_category = {}
+        for record in records:
+            product = Product(len(self.products), record)
+            if normalize(product.name) in self._by_key:
+                logger.warning("Duplicate product '%s' in catalog, keeping the first", product.name)
+                continue
+            self.products.append(product)
+            self._by_key[normalize(product.name)] = product
+            self._by_category.setdefault(normalize(product.category), []).append(product)
+
+        self.aliases = {}
+        alias_pairs = [(alias, product.name) for product in self.products for alias in product.record.get("aliases", [])]
+        alias_pairs += list((aliases or {}).items())
+        for alias, name in alias_pairs:
+            product = self._by_key.get(normalize(name))
+            if product is None:
+                logger.debug("Alias '%s' points at '%s', which is not on the menu", alias, name)
+                continue
+            # Real product names always win over aliases
+            if self._by_key.setdefault(normalize(alias), product) is product:
+                self.aliases[normalize(alias)] = product.name
+
+        self.names = [product.name for product in self.products]
+        self.categories = list(dict.fromkeys(product.category for product in self.products if product.category))
+        self._fuzzy_index = None
+        self._derived = {}
+
+    @classmethod
+    def load(cls, products_path, aliases=DEFAULT_ALIASES):
+        """Reads products.jsonl (blank lines skipped); the version is a hash of the file contents."""
+        with open(products_path, 'rb') as file:
+            content = file.read()
+        records = [json.loads(line) for line in content.decode().splitlines() if line.strip()]
+        return cls(records, hashlib.md5(content).hexdigest()[:12], aliases)
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def get(self, name):
+        """The product for a name or alias, ignoring case and extra whitespace; None if unknown."""
+        if not name:
+            return None
+        return self._by_key.get(normalize(name))
+
+    def resolve(self, name):
+        """(product, score) for a possibly misspelled name or alias; (None, score) if no confident match.
+
+        Exact lookups score 1.0; anything else goes through a trigram index over all lookup keys.
+        """
+        product = self.get(name)
+        if product is not None:
+            return product, 1.0
+        if not name:
+            return None, 0.0
+        if self._fuzzy_index is None:
+            self._fuzzy_index = TrigramIndex(self._by_key)
+        return self._fuzzy_index.resolve(normalize(name))
+
+    def by_id(self, product_id):
+        return self.products[product_id]
+
+    def canonical_name(self, name):
+        product = self.get(name)
+        return product.name if product is not None else None
+
+    def price(self, name, default=None):
+        product = self.get(name)
+        return product.price if product is not None else default
+
+    def in_category(self, category):
+        return list(self._by_category.get(normalize(category), []))
+
+    def derived(self, key, build):
+        """build(catalog), computed once per catalog, for state agents derive from the menu (prompts,
+        match tables). Lives and dies with the catalog, so several menus in use never evict each
+        other's."""
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived.setdefault(key, build(self))
+        return value
+
+    def mentions(self, text):
+        """(product names, categories) named in text by their name, an alias or the category name."""
+        def build(catalog):
+            keys = sorted(catalog._by_key, key=len, reverse=True)
+            categories = sorted(catalog._by_category, key=len, reverse=True)
+            return tuple(re.compile(r"\b(" + "|".join(map(re.escape, words)) + r")s?\b") if words else None
+                         for words in (keys, categories))
+        product_pattern, category_pattern = self.derived("mention_patterns", build)
+        text = normalize(text)
+        products = list(dict.fromkeys(self._by_key[key].name for key in product_pattern.findall(text))) \
+            if product_pattern is not None else []
+        categories = list(dict.fromkeys(self._by_category[key][0].category for key in category_pattern.findall(text))) \
+            if category_pattern is not None else []
+        return products, categories
+
+    def lookup_keys(self):
+        """{normalized name or alias: canonical name} for everything get() resolves."""
+        return {key: product.name for key, product in self._by_key.items()}
+
+
+class CatalogStore():
+    """Holds the current Catalog and reloads it when products.jsonl changes.
+
+    The file's mtime is checked at most once per check_interval seconds from current(), so it
+    can be called on every request. A file that is missing or fails to parse keeps the previous
+    catalog (an empty one at startup) and is retried on the next check.
+    """
+
+    def __init__(self, products_path, check_interval=5.0, aliases=DEFAULT_ALIASES):
+        self.products_path = pathlib.Path(products_path)
+        self.check_interval = check_interval
+        self.aliases = aliases
+        self.catalog = Catalog([], aliases=aliases)
+        self._mtime = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Loads the file if it changed since the last load; returns True if the catalog was replaced."""
+        try:
+            mtime = os.stat(self.products_path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            catalog = Catalog.load(self.products_path, self.aliases)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Could not load menu catalog from %s: %s", self.products_path, e)
+            return False
+        self._mtime = mtime
+        if catalog.version == self.catalog.version:
+            return False
+        # Single reference assignment, so readers see either the old or the new catalog
+        self.catalog = catalog
+        logger.info("Loaded menu catalog %s (%d products)", catalog.version, len(catalog))
+        return True
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._last_check = now
+                self.reload()
+            finally:
+                self._lock.release()
+        return self.catalog
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_catalog_store():
+    """Process-wide store for PRODUCTS_PATH (default: python_code/products/products.jsonl)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CatalogStore(
+                    os.environ.get("PRODUCTS_PATH", DEFAULT_PRODUCTS_PATH),
+                    float(os.environ.get("CATALOG_RELOAD_SECONDS", "5")),
+                )
+    return _store
+
+
+def get_catalog():
+    """The current menu catalog, reloaded if products.jsonl changed."""
+    return get_catalog_store().current()
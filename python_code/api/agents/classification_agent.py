@@ -1,7 +1,8 @@
 from dotenv import load_dotenv
 import os
 import json
-from copy import deepcopy
+from .conversation import Conversation
+from .prompt_builder import PromptBuilder
 from .utils import get_chatbot_response,double_check_json_output
 from openai import OpenAI
 load_dotenv()
@@ -14,11 +15,9 @@ class ClassificationAgent():
             base_url=os.environ.get("RUNPOD_CHATBOT_URL")
         )
         self.model_name = os.environ.get("MODEL_NAME")
-    
-    def get_response(self,messages):
-        messages = deepcopy(messages)
 
-        system_prompt = """
+        # Built once so every call sends the same system prompt bytes (prefix-cache friendly)
+        self.prompt = PromptBuilder("""
             You are a helpful AI assistant for a coffee shop application.
             Your task is to determine what agent should handle the user input. You have 3 agents to choose from:
             1. details_agent: This agent is responsible for answering questions about the coffee shop, like location, delivery places, working hours, details about menue items. Or listing items in the menu items. Or by asking what we have.
@@ -31,13 +30,11 @@ class ClassificationAgent():
             "decision": "details_agent" or "order_taking_agent" or "recommendation_agent". Pick one of those. and only write the word.,
             "message": leave the message empty 
             }
-        """
-        
-        input_messages = [
-            {"role": "system", "content": system_prompt},
-        ]
-
-        input_messages += messages[-3:]
+        """, window=3, budget=800)
+    
+    def get_response(self,messages):
+        messages = Conversation.of(messages)
+        input_messages = self.prompt.build(messages)
 
         chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
         # double check json 
@@ -0,0 +1,133 @@
+"""Serving side of training/context_cubes.py: popularity and apriori rules for one outlet, hour
+bucket and channel.
+
+Cells with too few receipt lines or baskets are relaxed to "any channel", then "any outlet" for
+the same hour bucket; when even that is sparse the caller uses the global tables. The cell for
+every (outlet, hour, channel) and its ranked lists are resolved at load time, so a lookup is a
+couple of dict reads.
+"""
+import logging
+import contextvars
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger("context_cube")
+
+CUBES_FILE = "recommendation_cubes.npz"
+ANY_CHANNEL = 2
+
+# Context of the job being served by the current thread, set by AgentController
+_recommendation_context = contextvars.ContextVar("recommendation_context", default=None)
+
+
+class RecommendationContext():
+    __slots__ = ("outlet_id", "hour", "in_store", "customer_id")
+
+    def __init__(self, outlet_id=None, hour=None, in_store=None, customer_id=None):
+        self.outlet_id = outlet_id
+        self.hour = hour
+        self.in_store = in_store
+        self.customer_id = customer_id
+
+    @classmethod
+    def from_input(cls, job_input):
+        """From a job's "context" ({"outlet_id", "hour", "in_store"}) and "customer_id". None when
+        the job carries neither. The hour is the outlet's local hour as the client sees it; without
+        one the any-hour bucket serves, since the server's clock is not the outlet's."""
+        value = job_input.get("context")
+        customer_id = job_input.get("customer_id")
+        if not isinstance(value, dict):
+            value = None
+        if value is None and customer_id is None:
+            return None
+        try:
+            customer_id = int(customer_id) if customer_id is not None else None
+        except (TypeError, ValueError):
+            logger.warning("Ignoring malformed customer id %r", customer_id)
+            customer_id = None
+        if value is None:
+            return cls(customer_id=customer_id)
+        try:
+            outlet_id = int(value["outlet_id"]) if value.get("outlet_id") is not None else None
+            hour = int(value["hour"]) % 24 if value.get("hour") is not None else None
+        except (TypeError, ValueError):
+            logger.warning("Ignoring malformed recommendation context %r", value)
+            return cls(customer_id=customer_id)
+        in_store = value.get("in_store")
+        return cls(outlet_id, hour, None if in_store is None else bool(in_store), customer_id)
+
+
+@contextmanager
+def recommendation_scope(context):
+    token = _recommendation_context.set(context)
+    try:
+        yield
+    finally:
+        _recommendation_context.reset(token)
+
+
+def current_recommendation_context():
+    return _recommendation_context.get()
+
+
+class ContextCubes():
+    def __init__(self, path, min_lines=200, min_baskets=50):
+        with np.load(path) as data:
+            cubes = {name: data[name] for name in data.files}
+        names = cubes["item_names"].tolist()
+        categories = cubes["item_categories"].tolist()
+        cell_lines, cell_baskets = cubes["cell_lines"], cubes["cell_baskets"]
+        n_outlets, n_buckets, _ = cell_lines.shape
+        self.any_outlet, self.any_bucket = n_outlets - 1, n_buckets - 1
+
+        self.outlet_index = {int(outlet): index for index, outlet in enumerate(cubes["outlet_ids"])}
+        edges = cubes["hour_edges"]
+        self.hour_bucket = [int(np.searchsorted(edges, hour, side="right")) - 1 for hour in range(24)]
+
+        # Ranked lists for the cells dense enough to serve, in the global tables' shapes
+        self._popular = {}
+        self._rules = {}
+        for cell in zip(*np.nonzero((cell_lines >= min_lines) & (cell_baskets >= min_baskets))):
+            cell = tuple(int(index) for index in cell)
+            self._popular[cell] = [(names[item], categories[item]) for item in cubes["popular_order"][cell]
+                                   if item >= 0]
+            rules = {}
+            for antecedent, (items, confidences) in enumerate(zip(cubes["rule_items"][cell],
+                                                                  cubes["rule_confidence"][cell])):
+                consequents = [{"product": names[item], "product_category": categories[item],
+                                "confidence": float(confidence)}
+                               for item, confidence in zip(items, confidences) if item >= 0]
+                if consequents:
+                    rules[names[antecedent]] = consequents
+            self._rules[cell] = rules
+
+        # Requested cell -> first dense cell when relaxing channel, then outlet; None = global tables
+        self._resolved = {}
+        for outlet in range(n_outlets):
+            for bucket in range(n_buckets):
+                for channel in range(3):
+                    candidates = ((outlet, bucket, channel), (outlet, bucket, ANY_CHANNEL),
+                                  (self.any_outlet, bucket, ANY_CHANNEL))
+                    self._resolved[outlet, bucket, channel] = next(
+                        (cell for cell in candidates if cell in self._popular), None)
+        logger.info("Loaded recommendation cubes from %s, %d of %d cells dense enough to serve",
+                    path, len(self._popular), cell_lines.size)
+
+    def cell(self, context):
+        if context is None or (context.outlet_id is None and context.hour is None and context.in_store is None):
+            return None
+        outlet = self.outlet_index.get(context.outlet_id, self.any_outlet)
+        bucket = self.hour_bucket[context.hour] if context.hour is not None else self.any_bucket
+        channel = ANY_CHANNEL if context.in_store is None else 0 if context.in_store else 1
+        return self._resolved[outlet, bucket, channel]
+
+    def popular(self, context):
+        """[(product, category), ...] by lines sold in the context's cell, or None when sparse."""
+        cell = self.cell(context)
+        return None if cell is None else self._popular[cell]
+
+    def rules(self, context):
+        """{product: [{"product", "product_category", "confidence"}, ...]} for the context's cell,
+        or None when sparse."""
+        cell = self.cell(context)
+        return None if cell is None else self._rules[cell]
@@ -0,0 +1,78 @@
+import json
+
+# Role header and separators a chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English), without a tokenizer."""
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def clip_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " ..."
+
+
+def conversation_state(messages, max_intents=3):
+    """Structured state of a conversation, read from the assistant messages' memory.
+
+    Returns the latest order-taking step, order and asked_recommendation_before, and the agents
+    that handled the last max_intents assistant turns (oldest first). Scans backwards and stops
+    as soon as all of it is known, i.e. at the latest order-taking turn once enough intents are
+    seen. A conversation without one is read to the start, a dict lookup per message; the scan is
+    not capped because an order taken many turns ago must still be carried.
+    """
+    state = {"step number": "1", "order": [], "asked_recommendation_before": False, "recent_intents": []}
+    found_order = False
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if message["role"] != "assistant":
+            continue
+        memory = message.get("memory") or {}
+        agent = memory.get("agent")
+        if agent and len(state["recent_intents"]) < max_intents:
+            state["recent_intents"].insert(0, agent)
+        if agent == "order_taking_agent" and not found_order:
+            state["step number"] = memory.get("step number", "1")
+            state["order"] = memory.get("order", [])
+            state["asked_recommendation_before"] = memory.get("asked_recommendation_before", False)
+            found_order = True
+        if found_order and len(state["recent_intents"]) >= max_intents:
+            break
+    return state
+
+
+def summarize_state(messages):
+    """One-line summary of what the omitted part of a conversation established, or "" if nothing."""
+    state = conversation_state(messages)
+    summary = {}
+    if state["order"]:
+        summary["order"] = [{"item": item.get("item"), "quantity": item.get("quantity", 1)}
+                            for item in state["order"] if isinstance(item, dict)]
+        summary["order step"] = state["step number"]
+    intents = [agent for i, agent in enumerate(state["recent_intents"]) if i == 0 or agent != state["recent_intents"][i - 1]]
+    if intents:
+        summary["recent intents"] = intents
+    if not summary:
+        return ""
+    return "Earlier in this conversation: " + json.dumps(summary, separators=(",", ":"))
+
+
+def fit_to_budget(history, budget, final_tokens):
+    """Drops the oldest messages of a history window until it and the final message fit in budget.
+
+    The final message is always kept. Returns the number of messages dropped.
+    """
+    total = final_tokens + sum(message_tokens(history[i]) for i in range(len(history) - 1))
+    dropped = 0
+    while total > budget and dropped < len(history) - 1:
+        total -= message_tokens(history[dropped])
+        dropped += 1
+    return dropped
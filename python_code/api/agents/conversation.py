@@ -0,0 +1,61 @@
+from collections.abc import Sequence
+from types import MappingProxyType
+
+
+class Conversation(Sequence):
+    """Read-only, copy-free view over a list of message dicts.
+
+    Agents used to deepcopy the whole history just to rewrite the last message before sending a
+    window of it to the LLM. A view shares the underlying list instead: slicing and last(n)
+    return views over the same list, and with_last_content() overlays a rewritten final message
+    without touching the original, so a turn allocates the same amount whatever the history
+    length. Messages are returned as read-only mappings.
+    """
+
+    __slots__ = ("_messages", "_start", "_stop", "_last")
+
+    def __init__(self, messages, start=0, stop=None, last=None):
+        self._messages = messages
+        self._start = start
+        self._stop = len(messages) if stop is None else stop
+        self._last = last  # replacement for the final message of this view, if any
+
+    @classmethod
+    def of(cls, messages):
+        """Wraps a list of messages; a Conversation is returned as is."""
+        return messages if isinstance(messages, Conversation) else cls(messages)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            stop = max(start, stop)
+            # The overlay only survives if the slice still ends at the final message
+            last = self._last if stop == len(self) else None
+            return Conversation(self._messages, self._start + start, self._start + stop, last)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("conversation index out of range")
+        if self._last is not None and index == len(self) - 1:
+            return self._last
+        return MappingProxyType(self._messages[self._start + index])
+
+    def last(self, n):
+        """View of the last n messages (all of them if there are fewer)."""
+        return self[-n:] if n > 0 else self[len(self):]
+
+    def with_last_content(self, content):
+        """View with the final message's content replaced; the underlying message is unchanged."""
+        if not len(self):
+            raise IndexError("empty conversation has no last message")
+        last = dict(self[-1])
+        last["content"] = content
+        return Conversation(self._messages, self._start, self._stop, MappingProxyType(last))
+
+    def __repr__(self):
+        return f"Conversation({list(map(dict, self))!r})"
@@ -0,0 +1,220 @@
+import os
+import csv
+import shutil
+import json
+import time
+import pathlib
+import logging
+import itertools
+import threading
+from collections import Counter
+from .artifact_store import convert, ARTIFACT_FILE
+
+logger = logging.getLogger("cooccurrence_model")
+
+APRIORI_FILE = "apriori_recommendations.json"
+POPULARITY_FILE = "popularity_recommendation.csv"
+CURRENT_POINTER = "CURRENT"
+SIZE_SUFFIXES = [" Rg", " Lg", " Sm"]
+
+
+class CooccurrenceModel():
+    """Item and pair basket counts that can be updated one basket at a time.
+
+    Updating costs O(k^2) for a basket of k distinct items and never touches the rest of the
+    model; confidence, lift and popularity are derived from the counts when a snapshot is
+    published, in the same formats the offline trainer writes.
+    """
+
+    def __init__(self):
+        self.n_baskets = 0
+        self.item_counts = Counter()       # baskets containing the item
+        self.pair_counts = Counter()       # baskets containing both items, keyed by sorted pair
+        self.line_counts = Counter()       # (product, category) -> order lines, for popularity
+        self.item_category = {}
+        self.order_log_offset = 0          # bytes of the order log already ingested
+
+    def update(self, lines):
+        """Adds one basket given as a list of (product, category) order lines; False if skipped.
+
+        Lines without a category (products the menu does not know) are left out, since they
+        could never be served under a category filter.
+        """
+        lines = [(product, category) for product, category in lines if category]
+        if len(lines) < 2:
+            # Single-line baskets carry no co-occurrence signal; the trainer drops them too
+            return False
+        for product, category in lines:
+            self.line_counts[(product, category)] += 1
+            self.item_category[product] = self.item_category.get(product) or category
+        items = sorted({product for product, _ in lines})
+        self.n_baskets += 1
+        self.item_counts.update(items)
+        self.pair_counts.update(itertools.combinations(items, 2))
+        return True
+
+    def update_from_receipts(self, receipts_path, product_path, products_to_take=None, chunksize=100_000):
+        """Adds every basket in a receipts CSV batch (same columns as 201904 sales reciepts.csv)."""
+        import pandas as pd
+
+        product = pd.read_csv(product_path, usecols=["product_id", "product_category", "product"])
+        for suffix in SIZE_SUFFIXES:
+            product["product"] = product["product"].str.replace(suffix, "")
+        if products_to_take is not None:
+            product = product[product["product"].isin(products_to_take)]
+        names = dict(zip(product["product_id"], zip(product["product"], product["product_category"])))
+
+        baskets = {}
+        for chunk in pd.read_csv(receipts_path, usecols=["transaction_id", "customer_id", "product_id"],
+                                 chunksize=chunksize):
+            for transaction_id, customer_id, product_id in chunk.itertuples(index=False):
+                line = names.get(product_id)
+                if line is not None:
+                    baskets.setdefault((transaction_id, customer_id), []).append(line)
+        return sum(self.update(lines) for lines in baskets.values())
+
+    def update_from_order_log(self, order_log_path):
+        """Adds the orders appended to the log since the last call."""
+        if not os.path.exists(order_log_path):
+            return 0
+        added = 0
+        with open(order_log_path, 'rb') as file:
+            file.seek(self.order_log_offset)
+            for raw_line in file:
+                if not raw_line.endswith(b"\n"):
+                    break  # partially written line; pick it up next time
+                self.order_log_offset += len(raw_line)
+                order = json.loads(raw_line)
+                # Older log lines carry no categories; fall back to the ones seen in receipts
+                categories = order.get("categories") or [self.item_category.get(item, "") for item in order["items"]]
+                added += self.update(list(zip(order["items"], categories)))
+        return added
+
+    def confidence(self, antecedent, consequent):
+        pair = self.pair_counts[tuple(sorted((antecedent, consequent)))]
+        return pair / self.item_counts[antecedent] if self.item_counts[antecedent] else 0.0
+
+    def apriori_recommendations(self, min_support=0.05, min_lift=1.0):
+        """Single-antecedent rules in the apriori_recommendations.json format."""
+        min_count = min_support * self.n_baskets
+        recommendations = {}
+        for (a, b), count in self.pair_counts.items():
+            if count < min_count:
+                continue
+            for antecedent, consequent in ((a, b), (b, a)):
+                confidence = count / self.item_counts[antecedent]
+                lift = confidence * self.n_baskets / self.item_counts[consequent]
+                if lift >= min_lift:
+                    recommendations.setdefault(antecedent, []).append({
+                        "product": consequent,
+                        "product_category": self.item_category.get(consequent, ""),
+                        "confidence": confidence,
+                    })
+        for rules in recommendations.values():
+            rules.sort(key=lambda rule: (-rule["confidence"], rule["product"]))
+        return recommendations
+
+    def popularity_rows(self):
+        return sorted((product, category, count) for (product, category), count in self.line_counts.items())
+
+    def save(self, state_path):
+        state = {
+            "n_baskets": self.n_baskets,
+            "item_counts": self.item_counts,
+            "pair_counts": [[a, b, count] for (a, b), count in self.pair_counts.items()],
+            "line_counts": [[product, category, count] for (product, category), count in self.line_counts.items()],
+            "item_category": self.item_category,
+            "order_log_offset": self.order_log_offset,
+        }
+        _atomic_write(pathlib.Path(state_path), json.dumps(state))
+
+    @classmethod
+    def load(cls, state_path):
+        model = cls()
+        with open(state_path, 'r') as file:
+            state = json.load(file)
+        model.n_baskets = state["n_baskets"]
+        model.item_counts = Counter(state["item_counts"])
+        model.pair_counts = Counter({(a, b): count for a, b, count in state["pair_counts"]})
+        model.line_counts = Counter({(product, category): count for product, category, count in state["line_counts"]})
+        model.item_category = state["item_category"]
+        model.order_log_offset = state.get("order_log_offset", 0)
+        return model
+
+    def publish_snapshot(self, snapshot_dir, min_support=0.05, min_lift=1.0, keep=3):
+        """Writes a new versioned snapshot directory, atomically repoints CURRENT at it and deletes
+        all but the newest keep versions (the previous ones stay for workers still loading them)."""
+        snapshot_dir = pathlib.Path(snapshot_dir)
+        version = f"v{time.time_ns()}"
+        target = snapshot_dir / version
+        target.mkdir(parents=True)
+        with open(target / APRIORI_FILE, 'w') as file:
+            json.dump(self.apriori_recommendations(min_support, min_lift), file)
+        with open(target / POPULARITY_FILE, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["product", "product_category", "number_of_transactions"])
+            writer.writerows(self.popularity_rows())
+        convert(target / APRIORI_FILE, target / POPULARITY_FILE, target / ARTIFACT_FILE)
+        _atomic_write(snapshot_dir / CURRENT_POINTER, version)
+        logger.info("Published recommendation snapshot %s (%d baskets)", version, self.n_baskets)
+        prune_snapshots(snapshot_dir, keep)
+        return target
+
+
+def prune_snapshots(snapshot_dir, keep):
+    # Versions are v<time_ns>, so name order is publication order
+    versions = sorted((path for path in snapshot_dir.iterdir() if path.is_dir() and path.name.startswith("v")),
+                      key=lambda path: (len(path.name), path.name))
+    for path in versions[:-max(keep, 1)]:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info("Deleted old recommendation snapshot %s", path.name)
+
+
+def _atomic_write(path, content):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+class SnapshotWatcher():
+    """Reports when the CURRENT pointer of a snapshot directory moves to a new version.
+
+    The pointer is stat'ed at most once per check_interval seconds, so callers can poll it on
+    every request.
+    """
+
+    def __init__(self, snapshot_dir, check_interval=5.0):
+        self.snapshot_dir = pathlib.Path(snapshot_dir)
+        self.check_interval = check_interval
+        self.version = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Returns the directory of a snapshot newer than the last one returned, else None."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self._last_check = now
+            try:
+                version = (self.snapshot_dir / CURRENT_POINTER).read_text().strip()
+            except OSError:
+                return None
+            if not version or version == self.version:
+                return None
+            self.version = version
+            return self.snapshot_dir / version
+        finally:
+            self._lock.release()
+
+
+def append_order(order_log_path, items, categories):
+    """Appends one finalized order as a JSON line; O_APPEND keeps concurrent workers' lines whole."""
+    line = json.dumps({"time": time.time(), "items": list(items), "categories": list(categories)}) + "\n"
+    fd = os.open(order_log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
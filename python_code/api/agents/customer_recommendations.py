@@ -0,0 +1,54 @@
+"""Serving side of training/customer_model.py: precomputed top-N products per customer id."""
+import logging
+import numpy as np
+
+logger = logging.getLogger("customer_recommendations")
+
+CUSTOMER_MODEL_FILE = "customer_recommendations.npz"
+# Ids up to this many times the number of customers are looked up in a dense row table,
+# sparser id spaces by binary search over the sorted ids
+DENSE_ID_FACTOR = 4
+
+
+class CustomerRecommendations():
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.customer_ids = data["customer_ids"]
+            self.top_items = data["top_items"]
+            self.item_names = data["item_names"].tolist()
+            self.item_categories = data["item_categories"].tolist()
+
+        self._row_of_customer = None
+        if len(self.customer_ids):
+            max_id = int(self.customer_ids[-1])
+            if self.customer_ids[0] >= 0 and max_id < DENSE_ID_FACTOR * len(self.customer_ids) + 1024:
+                self._row_of_customer = np.full(max_id + 1, -1, dtype=np.int32)
+                self._row_of_customer[self.customer_ids] = np.arange(len(self.customer_ids), dtype=np.int32)
+        logger.info("Loaded recommendations for %d customers from %s (%.1f MB)", len(self.customer_ids), path,
+                    self.nbytes / 1e6)
+
+    @property
+    def nbytes(self):
+        table = self._row_of_customer.nbytes if self._row_of_customer is not None else 0
+        return self.customer_ids.nbytes + self.top_items.nbytes + table
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def _row(self, customer_id):
+        if self._row_of_customer is not None:
+            if 0 <= customer_id < len(self._row_of_customer):
+                return int(self._row_of_customer[customer_id])
+            return -1
+        row = int(np.searchsorted(self.customer_ids, customer_id))
+        return row if row < len(self.customer_ids) and self.customer_ids[row] == customer_id else -1
+
+    def top_n(self, customer_id):
+        """[(product, category), ...] best first, or None for customers the model does not know."""
+        if customer_id is None:
+            return None
+        row = self._row(customer_id)
+        if row < 0:
+            return None
+        return [(self.item_names[item], self.item_categories[item]) for item in self.top_items[row].tolist()
+                if item >= 0]
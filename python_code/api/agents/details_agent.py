@@ -1,13 +1,21 @@
 from dotenv import load_dotenv
 import os
-from .utils import get_chatbot_response,get_embedding
+from .utils import get_chatbot_response
+from .embedding_batcher import get_embedding_batcher
+from .semantic_cache import SemanticCache
+from .lexical_index import LexicalIndex, KnowledgeManifest, KNOWLEDGE_MANIFEST_FILE
+from .outlet_shards import get_outlet_catalog_store
+import logging
 from openai import OpenAI
-from copy import deepcopy
+from .conversation import Conversation
+from .prompt_builder import PromptBuilder, prefix_hash
 from pinecone import Pinecone
 load_dotenv()
 
+logger = logging.getLogger("details_agent")
+
 class DetailsAgent():
-    def __init__(self):
+    def __init__(self, catalog_store=None):
         # Initialize the OpenAI client without any proxy configuration
         self.client = OpenAI(
             api_key=os.environ.get("RUNPOD_TOKEN"),
@@ -18,9 +26,67 @@ class DetailsAgent():
             base_url=os.environ.get("RUNPOD_EMBEDDING_URL")
         )
         self.model_name = os.environ.get("MODEL_NAME")
+        # Concurrent conversations' query embeddings go out as one embeddings.create call
+        self.embedder = get_embedding_batcher(self.embedding_client, self.model_name)
+
+        # Built once so every call sends the same system prompt bytes (prefix-cache friendly)
+        self.prompt = PromptBuilder(""" You are a customer support agent for a coffee shop called Old Kasturi. You should answer every question as if you are waiter and provide the neccessary information to the user regarding their orders """, window=3, budget=2000)
         self.pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
         self.index_name = os.environ.get("PINECONE_INDEX_NAME")
-    
+
+        # Paraphrased FAQ questions reuse a previous answer instead of a retrieval + generation.
+        # When build_vector_database.ipynb uploads changed documents, its manifest drops the
+        # answers built on them; DETAILS_CACHE_TTL_SECONDS optionally expires entries as well
+        ttl_seconds = float(os.environ.get("DETAILS_CACHE_TTL_SECONDS", "0"))
+        self.answer_cache = SemanticCache(
+            similarity_threshold=float(os.environ.get("DETAILS_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.environ.get("DETAILS_CACHE_SIZE", "256")),
+            ttl_seconds=ttl_seconds if ttl_seconds > 0 else None,
+        )
+
+        # Local BM25 index over the same documents as the vector index, built once per menu
+        # catalog (the job's outlet menu when it has one, so names and prices are that outlet's);
+        # retrieval is vector-only while the catalog is unavailable
+        self.top_k = int(os.environ.get("DETAILS_TOP_K", "2"))
+        self.max_top_k = int(os.environ.get("DETAILS_MAX_TOP_K", "6"))
+        self.vector_weight = float(os.environ.get("DETAILS_VECTOR_WEIGHT", "0.7"))
+        self.catalog_store = catalog_store or get_outlet_catalog_store()
+        self.get_lexical_index(self.catalog_store.current())
+        self.knowledge_manifest = KnowledgeManifest(
+            os.environ.get("KNOWLEDGE_MANIFEST_PATH") or self.catalog_store.products_path.parent / KNOWLEDGE_MANIFEST_FILE,
+            float(os.environ.get("CATALOG_RELOAD_SECONDS", "5")),
+        )
+
+    def refresh_answer_cache(self):
+        changed = self.knowledge_manifest.changed_documents()
+        if changed is None:
+            # No earlier manifest to compare with: any cached answer may be stale
+            self.answer_cache.clear()
+        elif changed:
+            self.answer_cache.invalidate_documents(changed)
+
+    def get_lexical_index(self, catalog):
+        def build(catalog):
+            # False rather than None, so a menu without an index is not retried on every call
+            if not len(catalog):
+                return False
+            try:
+                return LexicalIndex.from_catalog(catalog, self.catalog_store.products_path.parent)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not build lexical index, using vector-only retrieval: %s", e)
+                return False
+        return catalog.derived("details_lexical_index", build) or None
+
+    def cache_context_key(self, messages, catalog):
+        # The answer is generated from the earlier window messages and the state summary too, so
+        # a follow-up like "how much is it?" only hits answers given after the same conversation;
+        # the menu version keeps one outlet's (or an old menu's) prices out of another's answers.
+        # This limits sharing to questions asked with the same history, in practice a
+        # conversation's opening question: the answer cannot be told apart from the history it
+        # may refer to before the LLM has read it
+        prompt = self.prompt.build(messages, final_content="")
+        return prefix_hash(str(catalog.version), *(message["content"] for message in prompt[1:]))
+
     def get_closest_results(self,index_name,input_embeddings,top_k=2):
         index = self.pc.Index(index_name)
         
@@ -34,13 +100,54 @@ class DetailsAgent():
 
         return results
 
+    def get_top_k(self,user_message,lexical_index):
+        # Questions naming several categories/items need more than the default number of documents
+        if lexical_index is None:
+            return self.top_k
+        return min(self.max_top_k, max(self.top_k, lexical_index.count_entities(user_message)))
+
+    def hybrid_search(self,user_message,embedding,top_k,lexical_index):
+        """Fuses Pinecone cosine scores with max-normalized BM25 scores. Returns (id, text) pairs."""
+        vector_results = self.get_closest_results(self.index_name,embedding,top_k=top_k*2)
+        scores = {}
+        texts = {}
+        for match in vector_results['matches']:
+            scores[match['id']] = self.vector_weight * match['score']
+            texts[match['id']] = match['metadata']['text']
+
+        if lexical_index is not None:
+            lexical_results = lexical_index.search(user_message,top_k=top_k*2)
+            if lexical_results:
+                best_score = lexical_results[0][1]
+                for doc_id, score in lexical_results:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + (1 - self.vector_weight) * score / best_score
+                    texts.setdefault(doc_id, lexical_index.texts[doc_id])
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [(doc_id, texts[doc_id]) for doc_id in ranked]
+
     def get_response(self,messages):
-        messages = deepcopy(messages)
+        messages = Conversation.of(messages)
 
         user_message = messages[-1]['content']
-        embedding = get_embedding(self.embedding_client,self.model_name,user_message)[0]
-        result = self.get_closest_results(self.index_name,embedding)
-        source_knowledge = "\n".join([x['metadata']['text'].strip()+'\n' for x in result['matches'] ])
+
+        # Exact catalog names skip the embedding call and pull those products' documents directly
+        catalog = self.catalog_store.current()
+        lexical_index = self.get_lexical_index(catalog)
+        mentioned_products = lexical_index.find_products(user_message) if lexical_index is not None else []
+        embedding = None
+        if mentioned_products:
+            documents = [(name, lexical_index.texts[name]) for name in mentioned_products]
+        else:
+            embedding = self.embedder.embed(user_message)
+            self.refresh_answer_cache()
+            context_key = self.cache_context_key(messages, catalog)
+            cached_answer = self.answer_cache.lookup(embedding, context_key)
+            if cached_answer is not None:
+                return self.postprocess(cached_answer)
+            documents = self.hybrid_search(user_message,embedding,self.get_top_k(user_message,lexical_index),lexical_index)
+
+        source_knowledge = "\n".join([text.strip()+'\n' for _, text in documents])
 
         prompt = f"""
         Using the contexts below, answer the query.
@@ -51,11 +158,11 @@ class DetailsAgent():
         Query: {user_message}
         """
 
-        system_prompt = """ You are a customer support agent for a coffee shop called Old Kasturi. You should answer every question as if you are waiter and provide the neccessary information to the user regarding their orders """
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = self.prompt.build(messages, final_content=prompt)
 
         chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        if embedding is not None:
+            self.answer_cache.store(embedding, chatbot_output, context_key, [doc_id for doc_id, _ in documents])
         output = self.postprocess(chatbot_output)
         return output
 
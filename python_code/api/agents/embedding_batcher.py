@@ -0,0 +1,169 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import weakref
+import threading
+import contextvars
+import concurrent.futures
+from .utils import get_embedding
+from .resilience import remaining_time, DeadlineExceededError
+from .metrics import histogram
+
+logger = logging.getLogger("embedding_batcher")
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+QUEUE_DELAY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0]
+
+
+_instances = weakref.WeakSet()
+
+
+def _restart_after_fork():
+    global _batchers_lock
+    _batchers_lock = threading.Lock()
+    for batcher in list(_instances):
+        batcher._start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class EmbeddingBatcher():
+    """Coalesces single-text embedding requests from concurrent conversations into batched calls.
+
+    The first request of a batch waits at most max_wait seconds for others to join it, and a
+    batch is sent as soon as it holds max_batch_size texts; identical texts in a batch are
+    embedded once. Up to max_concurrent_batches calls are in flight at once; while they all
+    are, requests keep queueing and go out together in the next batch. embed() blocks the
+    calling thread, embed_async() awaits on the caller's event loop; both take their result from
+    the same futures.
+    """
+
+    def __init__(self, client, model_name, max_batch_size=32, max_wait=0.005, max_concurrent_batches=4):
+        self.client = client
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+        self._batch_sizes = histogram("embedding_batch_size", BATCH_SIZE_BUCKETS, "Texts per embeddings.create call")
+        self._queue_delays = histogram("embedding_queue_delay_seconds", QUEUE_DELAY_BUCKETS,
+                                       "Time an embedding request waited before its batch was sent")
+        self._start()
+        _instances.add(self)
+
+    def _start(self):
+        # Also called in forked workers, where the parent's threads no longer run
+        self._queue = queue.SimpleQueue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.max_concurrent_batches, thread_name_prefix="embedding-batch")
+        self._slots = threading.Semaphore(self.max_concurrent_batches)
+        self._thread = threading.Thread(target=self._collect_loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queues one text; the returned future resolves to its embedding vector."""
+        future = concurrent.futures.Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed(self, text):
+        """Embedding of text, waiting at most the remaining request deadline."""
+        future = self.submit(text)
+        try:
+            return future.result(timeout=max(0.0, remaining_time()))
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise DeadlineExceededError("Embedding request deadline exceeded")
+
+    async def embed_async(self, text):
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            send_by = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = send_by - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._slots.acquire()
+            # Whatever queued while waiting for a free slot joins this batch
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            self._send_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _send_batch(self, batch):
+        now = time.monotonic()
+        # Requests whose caller gave up (deadline) are dropped before the call
+        batch = [(text, future, queued) for text, future, queued in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self._batch_sizes.observe(len(texts))
+        for _, _, queued in batch:
+            self._queue_delays.observe(now - queued)
+        try:
+            vectors = dict(zip(texts, get_embedding(self.client, self.model_name, texts)))
+        except Exception as e:
+            logger.warning("Embedding batch of %d failed: %r", len(texts), e)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            future.set_result(vectors[text])
+
+
+class DirectEmbedder():
+    """Same interface without batching: one embeddings.create call per text."""
+
+    def __init__(self, client, model_name):
+        self.client = client
+        self.model_name = model_name
+
+    def embed(self, text):
+        return get_embedding(self.client, self.model_name, text)[0]
+
+    async def embed_async(self, text):
+        # asyncio.to_thread is 3.9+; the image runs 3.8. The copied context keeps the conversation tag
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, context.run, self.embed, text)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_embedding_batcher(client, model_name):
+    """Shared batcher per embedding endpoint and model, configured from the environment.
+
+    EMBEDDING_BATCHING      "false" sends one call per text (default true)
+    EMBEDDING_BATCH_WAIT_MS longest a request waits for others to join its batch (5)
+    EMBEDDING_MAX_BATCH     texts per embeddings.create call (32)
+    EMBEDDING_BATCH_CONCURRENCY  batches in flight at once (4)
+    """
+    if os.environ.get("EMBEDDING_BATCHING", "true").lower() != "true":
+        return DirectEmbedder(client, model_name)
+    key = (str(client.base_url), model_name)
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = EmbeddingBatcher(
+                client, model_name,
+                max_batch_size=int(os.environ.get("EMBEDDING_MAX_BATCH", "32")),
+                max_wait=float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "5")) / 1000,
+                max_concurrent_batches=int(os.environ.get("EMBEDDING_BATCH_CONCURRENCY", "4")),
+            )
+        return _batchers[key]
@@ -0,0 +1,85 @@
+from collections import Counter
+
+
+def trigrams(text):
+    """Character trigrams of a normalized name, padded so word starts and ends count."""
+    padded = "  " + text + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_dice(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def covers(words, key_words, min_similarity=0.5):
+    """True if every word has a close (possibly misspelled) counterpart among key_words."""
+    return all(any(word_dice(word, key_word) >= min_similarity for key_word in key_words) for word in words)
+
+
+class TrigramIndex():
+    """Inverted index from character trigrams to names, for resolving misspelled item names.
+
+    A lookup only scores the names sharing at least one trigram with the query, by the Dice
+    coefficient of the two trigram sets (1.0 for identical names). On a menu-sized catalog that
+    is a few dict lookups and well under a millisecond.
+    """
+
+    def __init__(self, names, min_score=0.6, min_margin=0.1):
+        """names maps each normalized key (names and aliases) to the value a match returns."""
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.keys = list(names)
+        self.values = [names[key] for key in self.keys]
+        self.key_words = {}
+        for key in self.keys:
+            self.key_words.setdefault(names[key], []).append(key.split())
+        self.sizes = []
+        self.postings = {}
+        for key_id, key in enumerate(self.keys):
+            grams = trigrams(key)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(key_id)
+
+    def scores(self, query):
+        """(value, score) for every distinct value sharing a trigram with the query, best first."""
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        best = {}
+        for key_id, count in shared.items():
+            score = 2 * count / (len(grams) + self.sizes[key_id])
+            value = self.values[key_id]
+            if score > best.get(value, 0.0):
+                best[value] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)
+
+    def resolve(self, query):
+        """Returns (value, score) for the best match, or (None, score) if it is too weak or ambiguous.
+
+        A match must score at least min_score and beat the runner-up (a different value) by
+        min_margin, so "chocolate" does not silently become one of several chocolate items. Every
+        word of the query must also appear in one of the match's names, so an off-menu "chai latte"
+        does not become a Latte; and when the query's words fit the names of several values
+        ("scone"), only a value that the query names in full ("croisant" for Croissant, not for
+        Almond Croissant) is returned.
+        """
+        ranked = self.scores(query)
+        if not ranked:
+            return None, 0.0
+        value, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score < self.min_score or score - runner_up < self.min_margin:
+            return None, score
+
+        words = query.split()
+        key_words = self.key_words[value]
+        if not any(covers(words, names) for names in key_words):
+            return None, score
+        fitting = sum(any(covers(words, names) for names in self.key_words[other]) for other, _ in ranked)
+        if fitting > 1 and not any(covers(names, words) for names in key_words if covers(words, names)):
+            return None, score
+        return value, score
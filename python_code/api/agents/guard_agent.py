@@ -1,8 +1,8 @@
 from dotenv import load_dotenv
 import os
-import logging
 import json
-from copy import deepcopy
+from .conversation import Conversation
+from .prompt_builder import PromptBuilder
 from .utils import get_chatbot_response,double_check_json_output
 from openai import OpenAI
 load_dotenv()
@@ -15,11 +15,9 @@ class GuardAgent():
             base_url=os.environ.get("RUNPOD_CHATBOT_URL")
         )
         self.model_name = os.environ.get("MODEL_NAME")
-    
-    def get_response(self,messages):
-        messages = deepcopy(messages)
 
-        system_prompt = """
+        # Built once so every call sends the same system prompt bytes (prefix-cache friendly)
+        self.prompt = PromptBuilder("""
             You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
             Your task is to determine whether the user is asking something relevant to the coffee shop or not.
             The user is allowed to:
@@ -38,11 +36,12 @@ class GuardAgent():
             "decision": "allowed" or "not allowed". Pick one of those. and only write the word.
             "message": leave the message empty "" if it's allowed, otherwise write "Sorry, I can't help with that. Can I help you with your order?"
             }
-            """
-        
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+            """, window=3, budget=800)
+    
+    def get_response(self,messages):
+        messages = Conversation.of(messages)
+        input_messages = self.prompt.build(messages)
 
-        logging.warning(f"GuardAgent: Client object before calling get_chatbot_response: {self.client}")
         chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
         chatbot_output = double_check_json_output(self.client,self.model_name,chatbot_output)
         output = self.postprocess(chatbot_output)
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+import pathlib
+import threading
+from collections import Counter
+
+logger = logging.getLogger("lexical_index")
+
+# Written next to products.jsonl by build_vector_database.ipynb after each upload
+KNOWLEDGE_MANIFEST_FILE = "knowledge_index.json"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Too common in coffee shop questions to carry any signal
+STOP_WORDS = frozenset("""
+a an and are as at be can do does for from have how i in is it me of on or our the to what
+which with you your we my any there this that
+""".split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def build_knowledge_documents(catalog, knowledge_dir):
+    """Rebuilds the (id, text) pairs uploaded to the vector index by build_vector_database.ipynb.
+
+    The about-us and menu text files are read from knowledge_dir (next to products.jsonl).
+    """
+    knowledge_dir = pathlib.Path(knowledge_dir)
+    documents = []
+    for product in catalog:
+        text = product.name + " : " + product.description + \
+            " -- Ingredients: " + str(product.ingredients) + \
+            " -- Price: " + str(product.record['price']) + \
+            " -- rating: " + str(product.rating)
+        documents.append(text)
+
+    about_path = knowledge_dir / 'Old_Kasturi_about_us.txt'
+    if about_path.exists():
+        documents.append("Coffee shop Old Kasturi about section: " + about_path.read_text())
+    menu_path = knowledge_dir / 'menu_items_text.txt'
+    if menu_path.exists():
+        documents.append("Menu Items: " + menu_path.read_text())
+
+    return [(text.split(":")[0].strip(), text) for text in documents]
+
+
+def document_fingerprint(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class KnowledgeManifest():
+    """The {document id: text fingerprint} manifest of the uploaded knowledge documents.
+
+    Like CatalogStore, the file's mtime is checked at most once per check_interval seconds, so
+    changed_documents() can be called on every request. A missing or unreadable file keeps the
+    previous manifest.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = pathlib.Path(path)
+        self.check_interval = check_interval
+        self.documents = None
+        self._mtime = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+        # Nothing is cached yet, so the first manifest has nothing to invalidate
+        self.changed_documents()
+
+    def changed_documents(self):
+        """Ids of the documents added, changed or removed since the previous manifest; () when
+        nothing changed, None when there was no previous manifest to compare with."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval or not self._lock.acquire(blocking=False):
+            return ()
+        try:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return ()
+                with open(self.path) as file:
+                    documents = json.load(file)["documents"]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                if self._mtime is not None or not isinstance(e, FileNotFoundError):
+                    logger.error("Could not read knowledge manifest %s: %s", self.path, e)
+                return ()
+            self._mtime = mtime
+            previous, self.documents = self.documents, documents
+            logger.info("Loaded knowledge manifest %s (%d documents)", self.path, len(documents))
+            if previous is None:
+                return None
+            return {doc_id for doc_id in previous.keys() | documents.keys()
+                    if previous.get(doc_id) != documents.get(doc_id)}
+        finally:
+            self._lock.release()
+
+
+class LexicalIndex():
+    """BM25 inverted index over the knowledge documents plus an exact product-name matcher."""
+
+    def __init__(self, documents, product_names, categories=(), k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = [doc_id for doc_id, _ in documents]
+        self.texts = {doc_id: text for doc_id, text in documents}
+
+        # term -> list of (document position, term frequency)
+        self.postings = {}
+        self.doc_lengths = []
+        for position, (_, text) in enumerate(documents):
+            term_counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings.setdefault(term, []).append((position, count))
+
+        document_count = len(documents)
+        self.average_length = sum(self.doc_lengths) / document_count if document_count else 0
+        self.idf = {
+            term: math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+        # One alternation over all names, longest first so "Almond Croissant" wins over "Croissant"
+        self.product_names = {name.lower(): name for name in product_names}
+        self._name_pattern = self._compile_names(self.product_names)
+        self.categories = {category.lower(): category for category in categories}
+        self._category_pattern = self._compile_names(self.categories)
+
+    @classmethod
+    def from_catalog(cls, catalog, knowledge_dir):
+        # Only real names count as exact mentions; an alias like "espresso" is also an ingredient
+        return cls(build_knowledge_documents(catalog, knowledge_dir), catalog.names, catalog.categories)
+
+    @staticmethod
+    def _compile_names(names):
+        if not names:
+            return None
+        alternation = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        return re.compile(r"\b(" + alternation + r")(?:e?s)?\b", re.IGNORECASE)
+
+    def find_products(self, text):
+        """Returns the catalog names mentioned verbatim in the text, in order of appearance."""
+        if self._name_pattern is None:
+            return []
+        found = []
+        for match in self._name_pattern.finditer(text):
+            name = self.product_names[match.group(1).lower()]
+            if name not in found:
+                found.append(name)
+        return found
+
+    def count_entities(self, text):
+        """Number of distinct products and categories named in the text."""
+        entities = set(self.find_products(text))
+        if self._category_pattern is not None:
+            entities.update(match.group(1).lower() for match in self._category_pattern.finditer(text))
+        return len(entities)
+
+    def search(self, query, top_k=5):
+        """Returns up to top_k (document id, BM25 score) pairs, best first."""
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = self.idf[term]
+            for position, term_frequency in postings:
+                length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / self.average_length)
+                scores[position] = scores.get(position, 0.0) + \
+                    idf * term_frequency * (self.k1 + 1) / (term_frequency + length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.doc_ids[position], score) for position, score in ranked]
@@ -0,0 +1,249 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from openai import OpenAI, AsyncOpenAI
+
+logger = logging.getLogger("load_balancer")
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+HEALTH_CHECK_SECONDS = float(os.environ.get("LLM_HEALTH_CHECK_SECONDS", "10"))
+LATENCY_MIN_SAMPLES = 20
+
+# Key of the conversation being served by the current thread, used for endpoint affinity
+_conversation_key = contextvars.ContextVar("llm_conversation_key", default=None)
+
+
+@contextmanager
+def conversation_scope(conversation_key):
+    token = _conversation_key.set(conversation_key)
+    try:
+        yield
+    finally:
+        _conversation_key.reset(token)
+
+
+def current_conversation_key():
+    return _conversation_key.get()
+
+
+class LatencyTracker():
+    """Sliding window of successful call latencies."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile):
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class CircuitBreaker():
+    """Opens after consecutive failures, lets one probe through after reset_seconds."""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        """Like allow_request but without moving an expired open circuit to half-open."""
+        return self.state == "closed" or \
+            (self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds)
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def abandon_probe(self):
+        """Reopens a half-open circuit whose probe ended without a result (e.g. cancelled by the
+        request deadline); the reset time has already passed, so the next request probes again."""
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("Circuit opened after %d consecutive failures", self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class Endpoint():
+    """One OpenAI-compatible server with its load and health state."""
+
+    def __init__(self, base_url, api_key):
+        self.base_url = str(base_url)
+        self.api_key = api_key
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+    def record_success(self, seconds):
+        self.latency.record(seconds)
+        self.ewma_latency = seconds if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * seconds
+        self.breaker.record_success()
+
+    def record_failure(self):
+        # Failing endpoints look slow so routing moves away before the circuit opens
+        self.ewma_latency = 2 * self.ewma_latency if self.ewma_latency else 1.0
+        self.breaker.record_failure()
+
+    def load_score(self):
+        # Expected wait if queued behind everything already outstanding on this endpoint;
+        # endpoints without measurements score 0 so they get tried
+        return (self.outstanding + 1) * (self.ewma_latency or 0.0)
+
+    def __repr__(self):
+        return f"Endpoint({self.base_url!r}, outstanding={self.outstanding}, state={self.breaker.state})"
+
+
+class LoadBalancer():
+    """Routes calls across a pool of endpoints by least outstanding requests weighted by latency.
+
+    Endpoints whose circuit opens are ejected from routing; a background health check probes
+    them and puts them back once they answer. With affinity enabled, calls carrying a
+    conversation key go to the same healthy endpoint (rendezvous hashing) to reuse its
+    prefix cache.
+    """
+
+    def __init__(self, endpoints, affinity=False, health_check_seconds=HEALTH_CHECK_SECONDS):
+        self.endpoints = list(endpoints)
+        self.affinity = affinity
+        self.health_check_seconds = health_check_seconds
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    @classmethod
+    def from_env(cls, urls_variable, api_key=None):
+        """Builds a pool from a comma-separated list of base URLs, or returns None if unset."""
+        urls = [url.strip() for url in os.environ.get(urls_variable, "").split(",") if url.strip()]
+        if not urls:
+            return None
+        api_key = api_key if api_key is not None else os.environ.get("RUNPOD_TOKEN")
+        affinity = os.environ.get("LLM_CONVERSATION_AFFINITY", "false").lower() == "true"
+        balancer = cls([Endpoint(url, api_key) for url in urls], affinity=affinity)
+        if len(balancer.endpoints) > 1:
+            balancer.start_health_checks()
+        return balancer
+
+    def pick(self, affinity_key=None, exclude=()):
+        """Returns the endpoint for the next call, or None if every endpoint is ejected."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude and e.breaker.is_available()]
+            if not candidates:
+                return None
+            if self.affinity and affinity_key is not None:
+                return max(candidates, key=lambda e: hashlib.md5(f"{affinity_key}|{e.base_url}".encode()).digest())
+            return min(candidates, key=Endpoint.load_score)
+
+    @contextmanager
+    def acquire(self, endpoint):
+        with self._lock:
+            endpoint.outstanding += 1
+        try:
+            yield endpoint
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+
+    def start_health_checks(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_check_loop, name="llm-health-check", daemon=True)
+            self._health_thread.start()
+
+    def _health_check_loop(self):
+        while True:
+            time.sleep(self.health_check_seconds)
+            for endpoint in self.endpoints:
+                if endpoint.breaker.state == "closed":
+                    continue
+                try:
+                    endpoint.client.with_options(timeout=self.health_check_seconds / 2).models.list()
+                    logger.info("Endpoint %s passed health check, restoring it", endpoint.base_url)
+                    endpoint.breaker.record_success()
+                except Exception as e:
+                    logger.debug("Endpoint %s still unhealthy: %s", endpoint.base_url, e)
+
+
+_chat_balancer = None
+_embedding_balancer = None
+_balancer_lock = threading.Lock()
+_balancers_loaded = False
+
+
+def _load_balancers():
+    global _chat_balancer, _embedding_balancer, _balancers_loaded
+    with _balancer_lock:
+        if not _balancers_loaded:
+            _chat_balancer = LoadBalancer.from_env("LLM_CHAT_ENDPOINTS")
+            _embedding_balancer = LoadBalancer.from_env("LLM_EMBEDDING_ENDPOINTS")
+            _balancers_loaded = True
+
+
+def _reset_after_fork():
+    # Forked serving workers build their own pools, clients and health-check threads
+    global _chat_balancer, _embedding_balancer, _balancer_lock, _balancers_loaded
+    _chat_balancer = _embedding_balancer = None
+    _balancer_lock = threading.Lock()
+    _balancers_loaded = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_chat_balancer():
+    """Pool configured with LLM_CHAT_ENDPOINTS, or None to use each agent's own client."""
+    _load_balancers()
+    return _chat_balancer
+
+
+def get_embedding_balancer():
+    """Pool configured with LLM_EMBEDDING_ENDPOINTS, or None to use each agent's own client."""
+    _load_balancers()
+    return _embedding_balancer
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from .load_balancer import current_conversation_key
+
+# Loggers that are too chatty at the root level by default; LOG_LEVELS overrides them
+DEFAULT_LOGGER_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "openai": "WARNING", "urllib3": "WARNING"}
+
+# Card numbers before phone numbers, since both are digit runs
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\b(?:\d[ -]?){12,18}\d\b"), "<card>"),
+    (re.compile(r"\+?\d[\d -]{6,}\d"), "<phone>"),
+    (re.compile(r"(?i)(bearer\s+|api[_-]?key[\"'=:\s]+|token[\"'=:\s]+)[\w.-]+"), r"\1<secret>"),
+]
+
+_settings = {"max_chars": 500, "redact": True, "sample_rate": 0.1}
+_listener = None
+
+
+class Payload():
+    """Wraps message content or a JSON-able object passed as a logging argument.
+
+    Serializing, redacting and truncating happen in __str__, i.e. only if the record is emitted,
+    and then on the logging thread. Only wrap values that are not mutated after the call.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str)
+        if _settings["redact"]:
+            for pattern, replacement in REDACTIONS:
+                text = pattern.sub(replacement, text)
+        max_chars = _settings["max_chars"]
+        if max_chars and len(text) > max_chars:
+            text = f"{text[:max_chars]}... [{len(text)} chars]"
+        return text
+
+
+# Arguments that are safe to format later on the logging thread
+_DEFERRABLE = (str, int, float, bool, type(None), Payload)
+
+
+class PayloadSampler(logging.Filter):
+    """Keeps a sample_rate fraction of sub-WARNING records carrying a Payload; tags all records
+    with the conversation they were logged for."""
+
+    def filter(self, record):
+        record.conversation = current_conversation_key() or "-"
+        if record.levelno >= logging.WARNING or not isinstance(record.args, tuple):
+            return True
+        if any(isinstance(arg, Payload) for arg in record.args):
+            return random.random() < _settings["sample_rate"]
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread when it is safe to.
+
+    The stock handler formats every record on the calling thread before enqueueing it.
+    """
+
+    def prepare(self, record):
+        if record.exc_info or record.stack_info or not isinstance(record.args, tuple) or \
+                not all(isinstance(arg, _DEFERRABLE) for arg in record.args):
+            return super().prepare(record)
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "conversation": getattr(record, "conversation", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork; a forked worker gets its own queue and thread
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def parse_logger_levels(spec):
+    """'utils=DEBUG,httpx=WARNING' -> {'utils': 'DEBUG', 'httpx': 'WARNING'}."""
+    levels = {}
+    for entry in (spec or "").split(","):
+        if "=" in entry:
+            name, level = entry.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Routes all logging through a queue drained by one background thread. Safe to call twice.
+
+    LOG_LEVEL          root level (default INFO)
+    LOG_LEVELS         per-logger levels, e.g. "order_taking_agent=DEBUG,utils=WARNING"
+    LOG_FORMAT         "text" (default) or "json"
+    LOG_PAYLOAD_SAMPLE_RATE  fraction of INFO/DEBUG records with message payloads kept (0.1)
+    LOG_PAYLOAD_MAX_CHARS    payloads are truncated to this many characters (500, 0 = no limit)
+    LOG_REDACT         mask emails, phone/card numbers and tokens in payloads (true)
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    _settings["sample_rate"] = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+    _settings["max_chars"] = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "500"))
+    _settings["redact"] = os.environ.get("LOG_REDACT", "true").lower() == "true"
+
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(conversation)s] %(message)s")
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(PayloadSampler())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for name, level in {**DEFAULT_LOGGER_LEVELS, **parse_logger_levels(os.environ.get("LOG_LEVELS"))}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the worker exits
+    atexit.register(_listener.stop)
@@ -0,0 +1,140 @@
+import bisect
+import threading
+
+
+class Histogram():
+    """Counts observations into fixed buckets (upper bounds), plus their sum, thread-safely."""
+
+    def __init__(self, name, buckets, description=""):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """{"buckets": [(upper bound, cumulative count), ...], "count": n, "sum": total}."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + [float("inf")], counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def histogram(name, buckets, description=""):
+    """Process-wide histogram registered under name; the first caller's buckets win."""
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, buckets, description)
+        return _histograms[name]
+
+
+def histograms():
+    with _lock:
+        return dict(_histograms)
+
+
+class Counter():
+    """Monotonic counts per combination of label values, thread-safely."""
+
+    def __init__(self, name, description="", labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **label_values):
+        key = tuple(str(label_values.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+_counters = {}
+
+
+def counter(name, description="", labels=()):
+    """Process-wide counter registered under name."""
+    with _lock:
+        if name not in _counters:
+            _counters[name] = Counter(name, description, labels)
+        return _counters[name]
+
+
+class Gauge():
+    """A value read when metrics are rendered, from a function."""
+
+    def __init__(self, name, function, description=""):
+        self.name = name
+        self.function = function
+        self.description = description
+
+
+_gauges = {}
+
+
+def gauge(name, function, description=""):
+    """Process-wide gauge registered under name; a later registration replaces the function."""
+    with _lock:
+        _gauges[name] = Gauge(name, function, description)
+        return _gauges[name]
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(gauges=None):
+    """Every registered counter, histogram and gauge, plus gauges ({name: (value, description)}), in
+    the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = list(_counters.values())
+        registered = list(_histograms.values())
+        registered_gauges = list(_gauges.values())
+    gauges = {**{item.name: (item.function(), item.description) for item in registered_gauges}, **(gauges or {})}
+    for item in counters:
+        lines.append(f"# HELP {item.name} {item.description}")
+        lines.append(f"# TYPE {item.name} counter")
+        for values, count in sorted(item.snapshot().items()):
+            lines.append(f"{item.name}{_label_text(item.labels, values)} {_number(count)}")
+    for item in registered:
+        snapshot = item.snapshot()
+        lines.append(f"# HELP {item.name} {item.description}")
+        lines.append(f"# TYPE {item.name} histogram")
+        for bound, count in snapshot["buckets"]:
+            lines.append(f'{item.name}_bucket{{le="{_number(bound)}"}} {count}')
+        lines.append(f"{item.name}_sum {_number(snapshot['sum'])}")
+        lines.append(f"{item.name}_count {snapshot['count']}")
+    for name, (value, description) in gauges.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
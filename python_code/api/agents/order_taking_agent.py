@@ -2,19 +2,22 @@ import os
 import json
 import logging
 from .utils import get_chatbot_response, double_check_json_output
+from .outlet_shards import get_outlet_catalog_store
+from .log_setup import Payload
 from openai import OpenAI
 import re
-from copy import deepcopy
+from .conversation import Conversation
+from .prompt_builder import PromptBuilder
+from .context_window import conversation_state
 # from functools import lru_cache # Removed unused import
 from dotenv import load_dotenv
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO) # Keep INFO level for now, can be changed via env var
+# Levels, sampling and redaction are configured centrally (see log_setup.configure_logging)
 logger = logging.getLogger("order_taking_agent")
 
 class OrderTakingAgent():
-    def __init__(self, recommendation_agent):
+    def __init__(self, recommendation_agent, catalog_store=None):
         self.client = OpenAI(
             api_key=os.getenv("RUNPOD_TOKEN"),
             base_url=os.getenv("RUNPOD_CHATBOT_URL"),
@@ -22,83 +25,44 @@ class OrderTakingAgent():
         self.model_name = os.getenv("MODEL_NAME")
 
         self.recommendation_agent = recommendation_agent
-        
-        # Valid menu items (lowercase key -> canonical name)
-        self.menu_items = {
-            "cappuccino": "Cappuccino",
-            "jumbo savory scone": "Jumbo Savory Scone",
-            "latte": "Latte",
-            "chocolate chip biscotti": "Chocolate Chip Biscotti",
-            "espresso shot": "Espresso shot",
-            "hazelnut biscotti": "Hazelnut Biscotti",
-            "chocolate croissant": "Chocolate Croissant",
-            "dark chocolate": "Dark chocolate",
-            "cranberry scone": "Cranberry Scone",
-            "croissant": "Croissant",
-            "almond croissant": "Almond Croissant",
-            "ginger biscotti": "Ginger Biscotti",
-            "oatmeal scone": "Oatmeal Scone",
-            "ginger scone": "Ginger Scone",
-            "chocolate syrup": "Chocolate syrup",
-            "hazelnut syrup": "Hazelnut syrup",
-            "carmel syrup": "Carmel syrup",
-            "sugar free vanilla syrup": "Sugar Free Vanilla syrup",
-            "roti":"ROTI",
-        }
-        
-        # Price lookup (canonical name -> price)
-        self.price_lookup = {
-            "Cappuccino": 14.50,
-            "Jumbo Savory Scone": 13.25,
-            "Latte": 14.75,
-            "Chocolate Chip Biscotti": 12.50,
-            "Espresso shot": 12.00,
-            "Hazelnut Biscotti": 12.75,
-            "Chocolate Croissant": 13.75,
-            "Dark chocolate": 15.00,
-            "Cranberry Scone": 13.50,
-            "Croissant": 13.25,
-            "Almond Croissant": 14.00,
-            "Ginger Biscotti": 12.50,
-            "Oatmeal Scone": 13.25,
-            "Ginger Scone": 13.50,
-            "Chocolate syrup": 11.50,
-            "Hazelnut syrup": 11.50,
-            "Carmel syrup": 11.50,
-            "Sugar Free Vanilla syrup": 11.50,
-            "ROTI": 5.50
-        }
-        
-        self._quantity_pattern_cache = {} # Cache for compiled regex
-        
-        # Pre-processed menu keys sorted by length (desc) for matching
-        self._all_matches = {**self.menu_items}
-        self._sorted_matches = sorted(self._all_matches.keys(), key=len, reverse=True)
-        
-        self._system_prompt = None # Cache for system prompt
 
-    # Method removed as it's no longer used after extract_potential_items refactor
-    # def _get_quantity_pattern(self, item_key):
-    #     if item_key not in self._quantity_pattern_cache:
-    #         self._quantity_pattern_cache[item_key] = re.compile(r'(\d+)\s+(?:' + re.escape(item_key) + ')')
-    #     return self._quantity_pattern_cache[item_key]
+        # Valid items and prices come from the menu catalog of the job's outlet (the shared one
+        # by default), so price changes in products.jsonl apply without a restart
+        self.catalog_store = catalog_store or get_outlet_catalog_store()
+
+
+        self.max_message_history = 10
+        self.context_tokens = 2000 # Budget for history plus the enriched message
+
+    @property
+    def menu_items(self):
+        """Lowercase name or alias -> canonical name."""
+        return self.catalog_store.current().lookup_keys()
 
-    # Method removed as it's no longer used after extract_potential_items refactor
-    # def _extract_quantity(self, text, item_key):
-    #     # Use cached compiled regex pattern
-    #     pattern = self._get_quantity_pattern(item_key)
-    #     match = pattern.search(text)
-    #     return int(match.group(1)) if match else 1
+    @property
+    def price_lookup(self):
+        """Canonical name -> price."""
+        return {product.name: product.price for product in self.catalog_store.current()}
+
+    @staticmethod
+    def _matches(catalog):
+        """(menu keys (names and aliases) longest first, key -> canonical name), once per catalog."""
+        def build(catalog):
+            all_matches = catalog.lookup_keys()
+            return sorted(all_matches.keys(), key=len, reverse=True), all_matches
+        return catalog.derived("order_taking_matches", build)
 
     def extract_potential_items(self, message_text):
         """Extracts potential menu items and quantities from user message using a more robust method."""
+        catalog = self.catalog_store.current()
+        sorted_matches, all_matches = self._matches(catalog)
         message_text_lower = message_text.lower()
         matched_items = {}
         processed_indices = set()
         word_to_num = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10} # Add more if needed
 
         # Iterate through menu keys, longest first to prioritize specific matches
-        for key in self._sorted_matches:
+        for key in sorted_matches:
             # Pattern to find the item key, possibly pluralized, bounded by spaces or start/end of string.
             key_pattern = re.compile(r'(?:^|\s|\W)' + re.escape(key) + r'(?:s)?(?:$|\s|\W)', re.IGNORECASE) # Use \W for non-word boundaries
 
@@ -110,15 +74,15 @@ class OrderTakingAgent():
 
                 # Check if this span overlaps with an already processed span
                 if any(i in processed_indices for i in range(item_start, item_end)):
-                    logger.debug(f"Skipping overlapping match for '{key}' at span ({item_start}, {item_end})")
+                    logger.debug("Skipping overlapping match for '%s' at span (%d, %d)", key, item_start, item_end)
                     continue # Skip overlapping matches
 
-                item_name = self._all_matches[key] # Get canonical name
+                item_name = all_matches[key] # Get canonical name
 
                 # Look backwards from the item start for a quantity
                 search_window_start = max(0, item_start - 20) # Look back up to 20 chars
                 preceding_text = message_text_lower[search_window_start:item_start].strip()
-                logger.debug(f"Item: '{key}', Preceding text: '{preceding_text}'")
+                logger.debug("Item: '%s', Preceding text: '%s'", key, preceding_text)
 
                 quantity = 1 # Default quantity
                 # Try to find a number (digits) at the end of the preceding text
@@ -130,29 +94,26 @@ class OrderTakingAgent():
 
                 if qty_match_digits:
                     quantity = int(qty_match_digits.group(1))
-                    logger.debug(f"Found quantity (digits): {quantity} for '{key}'")
+                    logger.debug("Found quantity (digits): %d for '%s'", quantity, key)
                 elif qty_match_words:
                     quantity = word_to_num.get(qty_match_words.group(1).lower(), 1)
-                    logger.debug(f"Found quantity (word): {quantity} for '{key}'")
+                    logger.debug("Found quantity (word): %d for '%s'", quantity, key)
                 elif qty_match_article:
                     quantity = 1
-                    logger.debug(f"Found quantity (article): {quantity} for '{key}'")
+                    logger.debug("Found quantity (article): %d for '%s'", quantity, key)
                 else:
-                     logger.debug(f"No specific quantity found for '{key}', defaulting to 1.")
+                     logger.debug("No specific quantity found for '%s', defaulting to 1.", key)
 
 
                 # Add or update quantity in matched_items
                 matched_items[item_name] = matched_items.get(item_name, 0) + quantity
-                logger.debug(f"Updated matched_items: {matched_items}")
-
                 # Mark item span as processed
                 processed_indices.update(range(item_start, item_end))
-                logger.debug(f"Processed indices updated: {processed_indices}")
 
         # Create the final items list
         potential_items = []
         for item_name, quantity in matched_items.items():
-            price_per_unit = self.price_lookup.get(item_name, 10.00) # Use default price if lookup fails
+            price_per_unit = catalog.price(item_name, 10.00) # Use default price if lookup fails
             price = price_per_unit * quantity
             potential_items.append({
                 "item": item_name,
@@ -161,7 +122,7 @@ class OrderTakingAgent():
             })
 
         if potential_items:
-             logger.debug(f"Extracted: {json.dumps(potential_items)}")
+             logger.debug("Extracted: %s", Payload(potential_items))
 
         return potential_items
 
@@ -171,12 +132,13 @@ class OrderTakingAgent():
         """Update the order with new items, merging similar items and avoiding duplicates"""
         if not current_order:
             current_order = []
+        catalog = self.catalog_store.current()
             
         # Process new items, merging with existing ones
         for new_item in new_items:
             # Basic validation: ensure new_item is a dict with 'item' key
             if not isinstance(new_item, dict) or "item" not in new_item:
-                logger.warning(f"Skipping invalid new_item structure: {new_item}")
+                logger.warning("Skipping invalid new_item structure: %s", Payload(new_item))
                 continue
 
             # Normalize item name for comparison
@@ -190,7 +152,7 @@ class OrderTakingAgent():
                     # Update quantity
                     existing["quantity"] = existing.get("quantity", 1) + new_item.get("quantity", 1)
                     # Update price based on new quantity
-                    price_per_unit = self.price_lookup.get(existing["item"], 10.00)
+                    price_per_unit = catalog.price(existing["item"], 10.00)
                     existing["price"] = price_per_unit * existing["quantity"]
                     found = True
                     break
@@ -204,18 +166,26 @@ class OrderTakingAgent():
 
     @property
     def system_prompt(self):
-        if self._system_prompt is None:
-            self._system_prompt = """
+        return self.prompt.system_message["content"]
+
+    @property
+    def prompt(self):
+        # Byte-identical for a given catalog version, so the server can keep it in its prefix cache
+        return self.catalog_store.current().derived(("order_taking_prompt", self.max_message_history,
+                                                     self.context_tokens), self._build_prompt)
+
+    def _build_prompt(self, catalog):
+        menu = "\n".join(f"            - {product.name}: RM{product.price:.2f}" for product in catalog)
+        system_prompt = """
             You are a customer support Bot for "Old Kasturi" coffee shop.
 
             Key Instructions:
             - DO NOT ask about payment methods (cash/card) or tell the user to go to the counter/pickup location.
             - Maintain the complete order history. Update quantities for existing items, don't duplicate. Add new items. Never delete unless asked.
-            - Handle typos/misspellings (e.g., "scavy scone" -> "savory scone").
             - Use the "order" and "step number" from the memory section in the user message to track progress.
 
             Task Flow:
-            1. Take the order, validate items against the menu (use internal price list).
+            1. Take the order, validate items against the menu below.
             2. If invalid items, inform user and repeat valid order.
             3. Ask if anything else is needed. If yes, repeat from step 1.
             4. If no, finalize: list items/prices, calculate total, thank user, and end conversation.
@@ -229,101 +199,79 @@ class OrderTakingAgent():
             }
 
             IMPORTANT: You MUST return ONLY the JSON structure above. Do NOT include any introductory text, explanations, apologies, or any other text outside of the JSON object itself. Your entire response must be the valid JSON object.
-        """
-        return self._system_prompt
+
+            Menu (item: unit price):
+        """ + menu + "\n"
+        return PromptBuilder(system_prompt, window=self.max_message_history,
+                             budget=self.context_tokens, summarize=False)
 
     def get_response(self, messages):
-        messages = deepcopy(messages)
+        messages = Conversation.of(messages)
         logger.debug("Processing request with %d messages", len(messages))
 
-        logger.info(f"Raw user message content: {messages[-1]['content']}") # <-- ADDED FOR DEBUGGING
-        step_number = "1"
-        asked_recommendation_before = False
-        current_order = []
-
-        # Look back through recent messages for last order state
-        max_message_history = 10
-        for message_index in range(len(messages) - 1, max(0, len(messages) - max_message_history - 1), -1):
-            message = messages[message_index]
-            if message["role"] == "assistant" and message.get("memory", {}).get("agent") == "order_taking_agent":
-                step_number = message["memory"].get("step number", "1")
-                order = message["memory"].get("order", [])
-                asked_recommendation_before = message["memory"].get("asked_recommendation_before", False)
-                if order:
-                    current_order = order
-                    logger.debug(f"Found prior order state: {json.dumps(current_order)}")
-                    break
+        logger.debug("Raw user message content: %s", Payload(messages[-1]['content']))
+        # Last order state from the whole conversation, not just the history window sent to the
+        # LLM; the enriched message below carries it as the rolling summary of older turns
+        state = conversation_state(messages)
+        step_number = state["step number"]
+        asked_recommendation_before = state["asked_recommendation_before"]
+        current_order = state["order"]
+        if current_order:
+            logger.debug("Found prior order state: %s", Payload(current_order))
 
-        # --- Get Previous State (Keep this part) ---
-        # (Code from lines 240-252 finds previous order state)
-        logger.debug(f"Previous order state found: {json.dumps(current_order)}")
-
-        # --- DO NOT Update Order Before LLM Call ---
-        # REMOVED: Item extraction and pre-emptive order update
-        # user_message = messages[-1]['content'].lower()
-        # try:
-        #     potential_items = self.extract_potential_items(user_message)
-        #     if potential_items:
-        #         current_order = self.update_order(current_order, potential_items)
-        #         logger.debug(f"Order after extraction/update: {json.dumps(current_order)}")
-        # except Exception as e:
-        #     logger.error(f"Error extracting items: {str(e)}")
+        # The order is only updated from the LLM's answer, never before the call
 
         # --- Prepare Input for LLM ---
-        # Send the PREVIOUS order state to the LLM
+        # Send the PREVIOUS order state to the LLM, after the user's text so that everything up to
+        # the per-turn state stays a cacheable prefix
         last_order_taking_status = f"""
         PREVIOUS step number: {step_number}
         PREVIOUS order: {json.dumps(current_order)}
         """
-        # Combine previous state with the LATEST user message
-        enriched_message = last_order_taking_status + " \n User message: " + messages[-1]['content']
-        # Replace last message content with enriched version for LLM context
-        messages[-1]['content'] = enriched_message
-        logger.info(f"Enriched message for LLM: {enriched_message}") # <-- Changed to INFO
+        # Combine the LATEST user message with the previous state
+        enriched_message = "User message: " + messages[-1]['content'] + " \n" + last_order_taking_status
+        logger.debug("Enriched message for LLM: %s", Payload(enriched_message))
 
-        # Limit message history sent to LLM (Keep this part)
-        input_messages = [{"role": "system", "content": self.system_prompt}] + messages[-min(max_message_history, len(messages)):]
+        # Limit message history sent to LLM; the enriched version is overlaid on the last message
+        input_messages = self.prompt.build(messages, final_content=enriched_message)
 
-        logger.debug(f"Sending messages to LLM: {json.dumps(input_messages)}")
+        logger.debug("Sending %d messages to LLM", len(input_messages))
         chatbot_output = get_chatbot_response(self.client, self.model_name, input_messages, temperature=0.1)
-        logger.info(f"RAW LLM output received: {chatbot_output}") # <-- Log raw output
-
-        # REMOVED call to double_check_json_output
-        # logger.debug(f"Output after JSON check: {chatbot_output}") # REMOVED
+        logger.info("RAW LLM output received: %s", Payload(chatbot_output))  # sampled
 
         # Pass raw output directly to postprocess
-        return self.postprocess(chatbot_output, messages, asked_recommendation_before, current_order)
+        response = self.postprocess(chatbot_output, messages, asked_recommendation_before, current_order)
+
+        # An order reaching the final step is fed once to the trending counters and the
+        # incremental recommendation model
+        memory = response.get("memory", {})
+        if memory.get("step number") == "4" and step_number != "4" and memory.get("order"):
+            self.recommendation_agent.record_order(memory["order"])
+        return response
 
     def postprocess(self, output_str, messages, asked_recommendation_before, current_order=[]):
         """Processes the LLM output, validates order, and formats the final response."""
-        logger.info(f"Postprocessing raw LLM output: {output_str}") # <-- Changed to INFO
-
         # Attempt to extract JSON object if LLM included extra text
         json_match = re.search(r'({[\s\S]*})', output_str)
         if json_match:
             output_str = json_match.group(0)
-            logger.debug(f"Extracted JSON part: {output_str}")
+            logger.debug("Extracted JSON part: %s", Payload(output_str))
         else:
             logger.warning("Could not find JSON object in LLM output.")
             # Proceed with original string, likely causing JSONDecodeError below
 
         output = {}
         try:
-            # REMOVED: Attempt to fix common JSON syntax errors
-
             # Attempt to parse the (potentially extracted) JSON string
-            logger.info(f"Attempting to parse JSON string: {output_str}") # <-- ADDED FOR DEBUGGING
             output = json.loads(output_str)
-            logger.info(f"Successfully parsed JSON. Parsed data type: {type(output)}") # <-- ADDED FOR DEBUGGING
             # Basic validation for essential keys from LLM
             if not all(k in output for k in ["step number", "order", "response"]):
-                 logger.warning(f"Parsed JSON missing essential keys: {output_str}")
+                 logger.warning("Parsed JSON missing essential keys: %s", Payload(output_str))
                  # Let it fall through to the exception handler to use fallback
                  raise json.JSONDecodeError("Parsed JSON missing essential keys", output_str, 0)
-            logger.info("JSON parsing and key validation successful.") # <-- ADDED FOR DEBUGGING
 
         except json.JSONDecodeError as e:
-            logger.warning(f"JSONDecodeError in postprocess: {e}. Using fallback.")
+            logger.warning("JSONDecodeError in postprocess: %s. Using fallback.", e)
             # Simplified fallback
             return {
                 "role": "assistant",
@@ -347,39 +295,30 @@ class OrderTakingAgent():
             logger.debug("LLM order field is a string. Attempting to parse.")
             try:
                 llm_order = json.loads(llm_order) # Try parsing the string
-                logger.debug(f"Successfully parsed string into list: {llm_order}")
+                logger.debug("Successfully parsed string into list: %s", Payload(llm_order))
             except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse LLM order string: {e}. Resetting order.")
+                logger.warning("Failed to parse LLM order string: %s. Resetting order.", e)
                 llm_order = [] # Reset if parsing fails
         # --- END: Handle if LLM returns order as a string ---
-        logger.info(f"LLM proposed order (before validation): {json.dumps(llm_order)}") # <-- ADDED FOR DEBUGGING
+        logger.debug("LLM proposed order (before validation): %s", Payload(llm_order))
 
+        catalog = self.catalog_store.current()
         if isinstance(llm_order, list):
             for item in llm_order: # Iterate through the LLM's proposed order (now guaranteed to be a list or reset to [])
                 if isinstance(item, dict) and "item" in item:
                     item_name_from_llm = item.get("item")
-                    canonical_name = None # Variable to store the correct key from price_lookup
-
-                    # Case-insensitive check against price_lookup keys
-                    if item_name_from_llm: # Ensure we have a name
-                        item_name_lower = item_name_from_llm.lower()
-                        logger.debug(f"Validating LLM item: '{item_name_from_llm}' (lowercase: '{item_name_lower}')") # DEBUG ADDED
-                        for lookup_key in self.price_lookup:
-                            logger.debug(f"  Comparing with price_lookup key: '{lookup_key}' (lowercase: '{lookup_key.lower()}')") # DEBUG ADDED
-                            if lookup_key.lower() == item_name_lower:
-                                canonical_name = lookup_key # Found match, store the canonical key
-                                logger.debug(f"  Found match! Canonical name: '{canonical_name}'") # DEBUG ADDED
-                                break
-                        # DEBUG ADDED - Log if no match found after loop
-                        if not canonical_name:
-                            logger.debug(f"  No match found for '{item_name_from_llm}' in price_lookup keys.")
+                    # Name/alias lookup in the catalog, falling back to the fuzzy index for misspellings
+                    product, score = catalog.resolve(item_name_from_llm) if isinstance(item_name_from_llm, str) else (None, 0.0)
+                    canonical_name = product.name if product is not None else None
+                    if product is not None and score < 1.0:
+                        logger.info("Resolved misspelled item '%s' to '%s' (score %.2f)", item_name_from_llm, canonical_name, score)
 
                     if canonical_name: # If a match was found (case-insensitive)
                         try:
                             quantity = int(item.get("quantity", 1))
                         except (ValueError, TypeError):
                             quantity = 1
-                        price_per_unit = self.price_lookup[canonical_name] # Use canonical name for lookup
+                        price_per_unit = product.price
                         # Create validated item structure with canonical name and recalculated price
                         validated_item = {
                             "item": canonical_name, # Use the canonical name in the final order
@@ -389,16 +328,16 @@ class OrderTakingAgent():
                         temp_validated_order.append(validated_item)
                     else:
                         # Log if item not found even with case-insensitive check
-                        logger.warning(f"Item '{item_name_from_llm}' not found in price_lookup (case-insensitive). Removing.")
+                        logger.warning("Item '%s' not found in menu catalog %s (best score %.2f). Removing.", item_name_from_llm, catalog.version, score)
                 else:
                     # Log if item structure from LLM is invalid
-                    logger.warning(f"Invalid item structure in LLM order: {item}. Skipping.")
+                    logger.warning("Invalid item structure in LLM order: %s. Skipping.", Payload(item))
         else:
              # Log if the order structure from LLM is not a list
-             logger.warning(f"LLM order is not a list: {llm_order}. Resetting.")
+             logger.warning("LLM order is not a list: %s. Resetting.", Payload(llm_order))
              temp_validated_order = [] # Indented under else
         validated_order = temp_validated_order # This now holds the LLM's order after our validation - Outside else
-        logger.info(f"Validated order (after internal checks): {json.dumps(validated_order)}") # <-- ADDED FOR DEBUGGING - Outside else
+        logger.debug("Validated order (after internal checks): %s", Payload(validated_order))
 
 
         # --- Final Output Assembly ---
@@ -418,5 +357,5 @@ class OrderTakingAgent():
         allowed_keys = {"chain of thought", "step number", "order", "response", "memory", "role"}
         final_output = {k: v for k, v in output.items() if k in allowed_keys}
 
-        logger.info(f"Final output: {json.dumps(final_output)}") # <-- Changed to INFO
+        logger.info("Final output: %s", Payload(final_output))  # sampled
         return final_output
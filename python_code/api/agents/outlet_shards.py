@@ -0,0 +1,211 @@
+"""Per-outlet menus and recommendation artifacts, loaded on first use and evicted least recently
+used under a memory cap.
+
+    OUTLET_SHARDS_DIR/<outlet_id>/products.jsonl           the outlet's menu and prices
+    OUTLET_SHARDS_DIR/<outlet_id>/recommendations.bin      its rules and popularity (compact), or
+    OUTLET_SHARDS_DIR/<outlet_id>/apriori_recommendations.json + popularity_recommendation.csv
+
+Either part may be missing; jobs for that outlet then use the shared one, as do jobs without an
+outlet id or for an outlet without a directory. A shard's size is its files' size on disk
+(compact artifacts are memory-mapped, so that is close to what they hold). A hit costs a dict
+read and a counter bump; only loads and evictions take the lock.
+"""
+import os
+import time
+import pathlib
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from .catalog import Catalog, get_catalog_store
+from .artifact_store import CompactArtifacts, ARTIFACT_FILE
+from .cooccurrence_model import APRIORI_FILE, POPULARITY_FILE
+from .metrics import counter
+
+logger = logging.getLogger("outlet_shards")
+
+PRODUCTS_FILE = "products.jsonl"
+
+# Outlet of the job being served by the current thread, set by AgentController
+_outlet_id = contextvars.ContextVar("outlet_id", default=None)
+
+
+@contextmanager
+def outlet_scope(outlet_id):
+    token = _outlet_id.set(None if outlet_id is None else str(outlet_id))
+    try:
+        yield
+    finally:
+        _outlet_id.reset(token)
+
+
+def current_outlet_id():
+    return _outlet_id.get()
+
+
+class OutletShard():
+    __slots__ = ("outlet_id", "catalog", "artifacts", "nbytes", "last_used")
+
+    def __init__(self, outlet_id, catalog, artifacts, nbytes):
+        self.outlet_id = outlet_id
+        self.catalog = catalog
+        self.artifacts = artifacts
+        self.nbytes = nbytes
+        self.last_used = 0
+
+
+class OutletShards():
+    def __init__(self, root, max_bytes=256 << 20, rescan_seconds=30.0):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self._shards = {}
+        self._available = frozenset()
+        self._last_scan = float("-inf")
+        self._clock = itertools.count(1)
+        self._lock = threading.Lock()
+        self._loads = counter("outlet_shard_loads_total", "Outlet shards loaded")
+        self._evictions = counter("outlet_shard_evictions_total", "Outlet shards evicted to stay under the cap")
+        self._scan()
+
+    def _scan(self):
+        self._last_scan = time.monotonic()
+        try:
+            self._available = frozenset(path.name for path in self.root.iterdir() if path.is_dir())
+        except OSError as e:
+            logger.error("Could not list outlet shards in %s: %s", self.root, e)
+
+    def get(self, outlet_id):
+        """The outlet's shard, loading it on first use; None when the outlet has no shard."""
+        if outlet_id is None:
+            return None
+        shard = self._shards.get(outlet_id)
+        if shard is None:
+            shard = self._load(outlet_id)
+            if shard is None:
+                return None
+        shard.last_used = next(self._clock)
+        return shard
+
+    def preload(self, outlet_ids):
+        for outlet_id in outlet_ids:
+            if self.get(str(outlet_id)) is None:
+                logger.warning("No shard to preload for outlet %s in %s", outlet_id, self.root)
+
+    def _load(self, outlet_id):
+        if outlet_id not in self._available:
+            if time.monotonic() - self._last_scan < self.rescan_seconds:
+                return None
+            with self._lock:
+                self._scan()
+            if outlet_id not in self._available:
+                return None
+
+        with self._lock:
+            # Another thread may have loaded it while this one waited
+            shard = self._shards.get(outlet_id)
+            if shard is not None:
+                return shard
+            directory = self.root / outlet_id
+            try:
+                shard = self._read(outlet_id, directory)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Could not load outlet shard %s: %s", directory, e)
+                return None
+            self._shards[outlet_id] = shard
+            self._loads.inc()
+            self._evict(keep=outlet_id)
+        logger.info("Loaded outlet shard %s (%.1f MB, %d loaded)", outlet_id, shard.nbytes / 1e6, len(self._shards))
+        return shard
+
+    def _read(self, outlet_id, directory):
+        catalog = artifacts = None
+        paths = []
+        if (directory / PRODUCTS_FILE).exists():
+            catalog = Catalog.load(directory / PRODUCTS_FILE)
+            paths.append(directory / PRODUCTS_FILE)
+        if (directory / ARTIFACT_FILE).exists():
+            artifacts = CompactArtifacts(directory / ARTIFACT_FILE, f"outlet-{outlet_id}")
+            paths.append(directory / ARTIFACT_FILE)
+        elif (directory / APRIORI_FILE).exists() and (directory / POPULARITY_FILE).exists():
+            # Imported here: recommendation_agent imports this module
+            from .recommendation_agent import RecommendationArtifacts
+            artifacts = RecommendationArtifacts(directory / APRIORI_FILE, directory / POPULARITY_FILE,
+                                                f"outlet-{outlet_id}")
+            paths += [directory / APRIORI_FILE, directory / POPULARITY_FILE]
+        return OutletShard(outlet_id, catalog, artifacts, sum(os.path.getsize(path) for path in paths))
+
+    def _evict(self, keep):
+        total = sum(shard.nbytes for shard in self._shards.values())
+        while total > self.max_bytes and len(self._shards) > 1:
+            outlet_id = min((shard for shard in self._shards.values() if shard.outlet_id != keep),
+                            key=lambda shard: shard.last_used).outlet_id
+            evicted = self._shards.pop(outlet_id)
+            total -= evicted.nbytes
+            self._evictions.inc()
+            logger.info("Evicted outlet shard %s (%.1f MB)", outlet_id, evicted.nbytes / 1e6)
+
+    def stats(self):
+        shards = list(self._shards.values())
+        return {"loaded": len(shards), "bytes": sum(shard.nbytes for shard in shards),
+                "available": len(self._available)}
+
+
+class OutletCatalogStore():
+    """CatalogStore for agents: the current job's outlet menu when it has one, else the shared one."""
+
+    def __init__(self, shards, default_store):
+        self.shards = shards
+        self.default_store = default_store
+
+    @property
+    def products_path(self):
+        return self.default_store.products_path
+
+    def current(self):
+        shard = self.shards.get(_outlet_id.get())
+        if shard is not None and shard.catalog is not None:
+            return shard.catalog
+        return self.default_store.current()
+
+
+_shards = None
+_shards_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The parent's locks may have been held by threads that do not exist in the child
+    global _shards_lock
+    _shards_lock = threading.Lock()
+    if _shards is not None:
+        _shards._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_outlet_shards():
+    """Process-wide shards, or None when OUTLET_SHARDS_DIR is not set.
+
+    OUTLET_SHARD_CACHE_MB   cap on the loaded shards' size (256)
+    OUTLET_PRELOAD          comma-separated outlet ids loaded up front, e.g. the busiest ones
+    """
+    global _shards
+    root = os.environ.get("OUTLET_SHARDS_DIR")
+    if not root:
+        return None
+    with _shards_lock:
+        if _shards is None:
+            _shards = OutletShards(root, int(float(os.environ.get("OUTLET_SHARD_CACHE_MB", "256")) * (1 << 20)))
+            _shards.preload(outlet_id.strip() for outlet_id in os.environ.get("OUTLET_PRELOAD", "").split(",")
+                            if outlet_id.strip())
+        return _shards
+
+
+def get_outlet_catalog_store():
+    """Catalog store routed by the job's outlet when outlet shards are configured, else the shared one."""
+    shards = get_outlet_shards()
+    if shards is None:
+        return get_catalog_store()
+    return OutletCatalogStore(shards, get_catalog_store())
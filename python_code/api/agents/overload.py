@@ -0,0 +1,178 @@
+"""Overload control: steps LLM usage down as jobs pile up or the LLM slows down, and back up
+once the pressure is gone.
+
+Pressure is the larger of jobs in flight / OVERLOAD_MAX_INFLIGHT and the smoothed LLM call
+latency / OVERLOAD_LATENCY_SECONDS. Each level adds to the ones below it:
+
+    1 SHORT_GENERATION      replies are capped at OVERLOAD_MAX_TOKENS
+    2 SKIP_GUARD            messages naming menu items or categories skip the LLM guard
+    3 TEMPLATED_REPLIES     recommendations are classified from the menu words in the message and
+                            rendered from the catalog, without LLM calls
+    4 SHED                  jobs get an immediate "please retry" reply
+
+Levels go up as soon as the pressure crosses their threshold and come down after the pressure
+has stayed below OVERLOAD_RECOVERY_RATIO x the threshold for OVERLOAD_COOLDOWN_SECONDS. The
+latency signal fades while no calls are made, so a shedding process recovers on its own. A job
+keeps the level it was admitted at.
+"""
+import os
+import math
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from .metrics import counter, gauge
+
+logger = logging.getLogger("overload")
+
+NORMAL, SHORT_GENERATION, SKIP_GUARD, TEMPLATED_REPLIES, SHED = range(5)
+LEVEL_NAMES = ["normal", "short_generation", "skip_guard", "templated_replies", "shed"]
+# Pressure at which each level from SHORT_GENERATION up is entered
+DEFAULT_THRESHOLDS = (0.5, 0.7, 0.85, 1.0)
+
+RETRY_MESSAGE = "Sorry, we're very busy right now. Please try again in a moment."
+
+# Level the current job was admitted at
+_job_level = contextvars.ContextVar("overload_level", default=NORMAL)
+
+
+def current_level():
+    return _job_level.get()
+
+
+class OverloadController():
+    def __init__(self, max_inflight=16, latency_seconds=5.0, thresholds=DEFAULT_THRESHOLDS,
+                 recovery_ratio=0.8, cooldown_seconds=10.0, max_tokens=512, latency_alpha=0.2,
+                 latency_fade_seconds=10.0):
+        self.max_inflight = max_inflight
+        self.latency_seconds = latency_seconds
+        self.thresholds = thresholds
+        self.recovery_ratio = recovery_ratio
+        self.cooldown_seconds = cooldown_seconds
+        self.max_tokens = max_tokens
+        self.latency_alpha = latency_alpha
+        self.latency_fade_seconds = latency_fade_seconds
+        # Extra jobs waiting outside the controller (e.g. queued by the HTTP server), if known
+        self.inflight_source = None
+
+        self.level = NORMAL
+        self.inflight = 0
+        self._latency = 0.0
+        self._latency_time = time.monotonic()
+        self._calm_since = None
+        self._lock = threading.Lock()
+
+        self._transitions = counter("overload_level_transitions_total", "Overload level changes", ("from", "to"))
+        self._shed = counter("overload_shed_total", "Jobs answered with a retry reply")
+        gauge("overload_level", lambda: self.level, "Current degradation level, 0 (normal) to 4 (shedding)")
+        gauge("overload_pressure", lambda: round(self.pressure(), 3), "Overload pressure, 1.0 = at the limit")
+        gauge("overload_llm_latency_seconds", lambda: round(self.latency(), 3), "Smoothed LLM call latency")
+
+    def latency(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self._latency * math.exp(-(now - self._latency_time) / self.latency_fade_seconds)
+
+    def record_latency(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._latency = self.latency_alpha * seconds + (1 - self.latency_alpha) * self.latency(now)
+            self._latency_time = now
+            self._update(now)
+
+    def pressure(self, now=None):
+        inflight = self.inflight
+        if self.inflight_source is not None:
+            inflight = max(inflight, self.inflight_source())
+        return max(inflight / self.max_inflight, self.latency(now) / self.latency_seconds)
+
+    def _update(self, now):
+        pressure = self.pressure(now)
+        target = sum(pressure >= threshold for threshold in self.thresholds)
+        if target > self.level:
+            self._move(target)
+            self._calm_since = None
+            return
+        # A level is kept until the pressure is well below its threshold
+        needed = sum(pressure >= threshold * self.recovery_ratio for threshold in self.thresholds)
+        if needed >= self.level:
+            self._calm_since = None
+            return
+        if self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.cooldown_seconds:
+            self._move(needed)
+            self._calm_since = None
+
+    def _move(self, level):
+        log = logger.warning if level > self.level else logger.info
+        log("Overload level %s -> %s (pressure %.2f, %d in flight, LLM latency %.2fs)", LEVEL_NAMES[self.level],
+            LEVEL_NAMES[level], self.pressure(), self.inflight, self.latency())
+        self._transitions.inc(**{"from": LEVEL_NAMES[self.level], "to": LEVEL_NAMES[level]})
+        self.level = level
+
+    @contextmanager
+    def admit(self):
+        """Counts the job as in flight for the block and yields the level it runs at."""
+        now = time.monotonic()
+        with self._lock:
+            self._update(now)
+            level = self.level
+            self.inflight += 1
+        if level == SHED:
+            self._shed.inc()
+        token = _job_level.set(level)
+        try:
+            yield level
+        finally:
+            _job_level.reset(token)
+            with self._lock:
+                self.inflight -= 1
+
+    def generation_budget(self, max_tokens):
+        return min(max_tokens, self.max_tokens) if current_level() >= SHORT_GENERATION else max_tokens
+
+
+def retry_response():
+    return {"role": "assistant", "content": RETRY_MESSAGE, "memory": {"agent": "overload", "retry": True}}
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Each worker process controls its own load; the parent's lock may have been held mid-update
+    global _controller, _controller_lock
+    _controller_lock = threading.Lock()
+    if _controller is not None:
+        _controller._lock = threading.Lock()
+        _controller.inflight = 0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_overload_controller():
+    """Process-wide controller configured from the environment, or None when OVERLOAD_CONTROL=false.
+
+    OVERLOAD_MAX_INFLIGHT       jobs in flight at pressure 1.0 (16)
+    OVERLOAD_LATENCY_SECONDS    smoothed LLM call latency at pressure 1.0 (5)
+    OVERLOAD_COOLDOWN_SECONDS   time below a level's threshold before stepping down (10)
+    OVERLOAD_RECOVERY_RATIO     share of the threshold the pressure must fall under to step down (0.8)
+    OVERLOAD_MAX_TOKENS         generation budget from SHORT_GENERATION up (512)
+    """
+    global _controller
+    if os.environ.get("OVERLOAD_CONTROL", "true").lower() != "true":
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = OverloadController(
+                    max_inflight=int(os.environ.get("OVERLOAD_MAX_INFLIGHT", "16")),
+                    latency_seconds=float(os.environ.get("OVERLOAD_LATENCY_SECONDS", "5")),
+                    recovery_ratio=float(os.environ.get("OVERLOAD_RECOVERY_RATIO", "0.8")),
+                    cooldown_seconds=float(os.environ.get("OVERLOAD_COOLDOWN_SECONDS", "10")),
+                    max_tokens=int(os.environ.get("OVERLOAD_MAX_TOKENS", "512")),
+                )
+    return _controller
@@ -0,0 +1,75 @@
+import os
+import hashlib
+import textwrap
+from .conversation import Conversation
+from .context_window import (MESSAGE_OVERHEAD_TOKENS, estimate_tokens, message_tokens, clip_to_tokens,
+                             summarize_state, fit_to_budget)
+
+
+def static_prompt(text):
+    """Dedented, stripped form of a prompt literal, so the same prompt is always the same bytes."""
+    return textwrap.dedent(text).strip() + "\n"
+
+
+def prefix_hash(*parts):
+    return hashlib.sha1("\0".join(parts).encode()).hexdigest()[:16]
+
+
+def anchored_window(conversation, window, step):
+    """The last `window` to `window + step - 1` messages, starting at a multiple of `step`.
+
+    A plain last-n window slides by two messages (user + reply) every turn, so the history part
+    of the prompt never repeats and the server can only reuse the system prompt from its prefix
+    cache. Anchoring the start keeps it fixed for about step / 2 turns; each of those turns
+    resends the previous turn's prompt plus the new messages, which the server prefills from
+    cache.
+    """
+    conversation = Conversation.of(conversation)
+    start = max(0, (len(conversation) - window) // step * step)
+    return conversation[start:]
+
+
+class PromptBuilder():
+    """Assembles [system prompt, history window, final message] for one agent.
+
+    The system message is built once and reused as the same object, anything that varies per
+    turn goes into the final message, and the history window is anchored (see anchored_window).
+    Short windows are not worth anchoring: a turn adds two of their three messages anyway, so
+    they keep sliding (step 1) and only longer ones use PROMPT_WINDOW_STEP.
+
+    With a budget (tokens for the history plus the final message), older history messages are
+    clipped to a quarter of it and the oldest ones dropped until the rest fits. Whatever the
+    window or the budget leaves out is replaced by a one-line summary of the conversation state
+    (order, step, recent intents) appended to the final message, so prompt size stays bounded
+    however long the chat runs. Agents that already send that state pass summarize=False.
+    """
+
+    def __init__(self, system_prompt, window=3, step=None, budget=None, summarize=True):
+        self.system_message = {"role": "system", "content": static_prompt(system_prompt)}
+        self.window = window
+        if step is None:
+            step = int(os.environ.get("PROMPT_WINDOW_STEP", "8")) if window > 4 else 1
+        self.step = step
+        self.budget = budget
+        self.summarize = summarize
+
+    def build(self, messages, final_content=None):
+        messages = Conversation.of(messages)
+        window = anchored_window(messages, self.window, self.step)
+        final = window[-1]["content"] if final_content is None else final_content
+        summary = summarize_state(messages) if self.summarize and len(messages) > 1 else ""
+
+        history = list(window)
+        if self.budget is not None:
+            max_message_tokens = self.budget // 4
+            for index in range(len(history) - 1):
+                if message_tokens(history[index]) > max_message_tokens:
+                    history[index] = dict(history[index], content=clip_to_tokens(history[index]["content"], max_message_tokens))
+            final_tokens = estimate_tokens(final + summary) + MESSAGE_OVERHEAD_TOKENS
+            history = history[fit_to_budget(history, self.budget, final_tokens):]
+
+        if summary and len(history) < len(messages):
+            final = final + "\n" + summary
+        if final is not history[-1]["content"]:
+            history[-1] = dict(history[-1], content=final)
+        return [self.system_message, *history]
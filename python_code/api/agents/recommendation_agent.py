@@ -2,45 +2,230 @@ import json
 import pandas as pd
 import os
 import logging
-from .utils import get_chatbot_response, double_check_json_output
+from .utils import get_chatbot_response, double_check_json_output, LLMUnavailableError
+from .recommendation_renderer import RecommendationRenderer
+from .cooccurrence_model import SnapshotWatcher, append_order, APRIORI_FILE, POPULARITY_FILE
+from .artifact_store import CompactArtifacts, ARTIFACT_FILE
+from .outlet_shards import get_outlet_shards, get_outlet_catalog_store, current_outlet_id
+from .context_cube import ContextCubes, current_recommendation_context, CUBES_FILE
+from .customer_recommendations import CustomerRecommendations, CUSTOMER_MODEL_FILE
+from .trending import get_trending_counters
+from .overload import current_level, TEMPLATED_REPLIES
+import threading
+import pathlib
+import weakref
 from openai import OpenAI
-from copy import deepcopy
+from .conversation import Conversation
+from .prompt_builder import PromptBuilder
 from dotenv import load_dotenv
-from difflib import get_close_matches
 import re
 load_dotenv()
 
+logger = logging.getLogger("recommendation_agent")
+
+
+class RecommendationArtifacts():
+    """Everything loaded from one apriori/popularity pair; replaced as a whole on hot reload."""
+
+    def __init__(self,apriori_recommendation_path,popular_recommendation_path,version=None):
+        with open(apriori_recommendation_path, 'r') as file:
+            self.apriori_recommendations = json.load(file)
+
+        self.popular_recommendations = pd.read_csv(popular_recommendation_path)
+        self.products = self.popular_recommendations['product'].tolist()
+        self.product_categories = self.popular_recommendations['product_category'].tolist()
+        self.version = version
+
 
 class RecommendationAgent():
-    def __init__(self,apriori_recommendation_path,popular_recommendation_path):
+    def __init__(self,apriori_recommendation_path,popular_recommendation_path,catalog_store=None,use_llm_rendering=None):
         # Initialize the OpenAI client without any proxy configuration
         self.client = OpenAI(
             api_key=os.environ.get("RUNPOD_TOKEN"),
             base_url=os.environ.get("RUNPOD_CHATBOT_URL")
         )
         self.model_name = os.environ.get("MODEL_NAME")
+        self.catalog_store = catalog_store or get_outlet_catalog_store()
+        # Outlets with their own rules and popularity (OUTLET_SHARDS_DIR) use them instead of the shared ones
+        self.outlet_shards = get_outlet_shards()
 
-        with open(apriori_recommendation_path, 'r') as file:
-            self.apriori_recommendations = json.load(file)
+        # Static prompts are built once so every call sends the same bytes (prefix-cache friendly)
+        self._classification_prompts = weakref.WeakKeyDictionary()
+        self.recommendation_prompt = PromptBuilder("""
+        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
+        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
 
-        self.popular_recommendations = pd.read_csv(popular_recommendation_path)
-        self.products = self.popular_recommendations['product'].tolist()
-        self.product_categories = self.popular_recommendations['product_category'].tolist()
+        I will provide what items you should recommend to the user based on their order in the user message. 
+        """, window=3, budget=800)
+        self.order_recommendation_prompt = PromptBuilder("""
+        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
+        your task is to recommend items to the user based on their order.
+
+        I will provide what items you should recommend to the user based on their order in the user message. 
+        """, window=3, budget=800)
+
+        # RECOMMENDATION_ARTIFACTS points at the memory-mapped form written by convert_artifacts.py
+        compact_path = os.environ.get("RECOMMENDATION_ARTIFACTS")
+        if compact_path:
+            self.artifacts = CompactArtifacts(compact_path)
+        else:
+            self.artifacts = RecommendationArtifacts(apriori_recommendation_path,popular_recommendation_path)
+
+        # Snapshots published by update_recommendations.py are picked up without a restart,
+        # and finalized orders are appended to the log it ingests
+        snapshot_dir = os.environ.get("RECOMMENDATION_SNAPSHOT_DIR")
+        self.snapshot_watcher = None
+        if snapshot_dir:
+            self.snapshot_watcher = SnapshotWatcher(snapshot_dir, float(os.environ.get("RECOMMENDATION_RELOAD_SECONDS", "5")))
+            snapshot_path = self.snapshot_watcher.poll()
+            if snapshot_path is not None:
+                self._load_snapshot(snapshot_path)
+        self.order_log_path = os.environ.get("RECOMMENDATION_ORDER_LOG")
+
+        # Per outlet x hour bucket tables (training/context_cubes.py), used when a job has a context
+        cubes_path = pathlib.Path(os.environ.get("RECOMMENDATION_CUBES") or
+                                  pathlib.Path(apriori_recommendation_path).parent / CUBES_FILE)
+        self.context_cubes = None
+        if cubes_path.exists():
+            try:
+                self.context_cubes = ContextCubes(cubes_path,
+                                                  int(os.environ.get("RECOMMENDATION_CUBE_MIN_LINES", "200")),
+                                                  int(os.environ.get("RECOMMENDATION_CUBE_MIN_BASKETS", "50")))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Failed to load recommendation cubes %s: %s", cubes_path, e)
+
+        # Precomputed top-N per customer (training/customer_model.py), for jobs with a customer_id
+        customers_path = pathlib.Path(os.environ.get("RECOMMENDATION_CUSTOMER_MODEL") or
+                                      pathlib.Path(apriori_recommendation_path).parent / CUSTOMER_MODEL_FILE)
+        self.customer_recommendations = None
+        if customers_path.exists():
+            try:
+                self.customer_recommendations = CustomerRecommendations(customers_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Failed to load customer recommendations %s: %s", customers_path, e)
+
+        # Decayed counts of recent orders rank popular items once a scope has TRENDING_MIN_LINES
+        self.trending = get_trending_counters()
+        self.trending_min_lines = float(os.environ.get("TRENDING_MIN_LINES", "20"))
+
+        # Replies are rendered from the catalog's product records unless LLM rendering is requested
+        # (or the catalog could not be loaded, see use_renderer)
+        if use_llm_rendering is None:
+            use_llm_rendering = os.environ.get("RECOMMENDATION_LLM_RENDERING", "false").lower() == "true"
+        self.use_llm_rendering = use_llm_rendering
+        # Also used with LLM rendering on, when the overload controller asks for templated replies
+        self.renderer = RecommendationRenderer(self.catalog_store)
     
-    def get_apriori_recommendation(self,products,top_k=5):
+    @property
+    def apriori_recommendations(self):
+        return self.current_artifacts().apriori_recommendations
+
+    @property
+    def popular_recommendations(self):
+        return self.current_artifacts().popular_recommendations
+
+    @property
+    def products(self):
+        return self.current_artifacts().products
+
+    @property
+    def product_categories(self):
+        return self.current_artifacts().product_categories
+
+    def refresh_artifacts(self):
+        """Starts loading a newer snapshot in the background; requests keep using the current one.
+        Returns the artifacts for the job's outlet."""
+        if self.snapshot_watcher is not None:
+            snapshot_path = self.snapshot_watcher.poll()
+            if snapshot_path is not None:
+                threading.Thread(target=self._load_snapshot, args=(snapshot_path,), daemon=True).start()
+        return self.current_artifacts()
+
+    def current_artifacts(self):
+        if self.outlet_shards is not None:
+            shard = self.outlet_shards.get(current_outlet_id())
+            if shard is not None and shard.artifacts is not None:
+                return shard.artifacts
+        return self.artifacts
+
+    def _load_snapshot(self,snapshot_path):
+        try:
+            if (snapshot_path / ARTIFACT_FILE).exists():
+                artifacts = CompactArtifacts(snapshot_path / ARTIFACT_FILE, snapshot_path.name)
+            else:
+                artifacts = RecommendationArtifacts(snapshot_path / APRIORI_FILE, snapshot_path / POPULARITY_FILE, snapshot_path.name)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load recommendation snapshot %s: %s", snapshot_path, e)
+            return
+        # Single reference assignment, so readers see either the old or the new artifacts
+        self.artifacts = artifacts
+        logger.info("Loaded recommendation snapshot %s", snapshot_path.name)
+
+    def use_renderer(self):
+        if self.use_llm_rendering and current_level() < TEMPLATED_REPLIES:
+            return False
+        return len(self.catalog_store.current()) > 0
+
+    def on_menu(self,products):
+        """Drops recommended products that are no longer on the menu (kept as-is without a catalog)."""
+        catalog = self.catalog_store.current()
+        if not len(catalog):
+            return products
+        return [product for product in products if product in catalog]
+
+    def record_order(self,order):
+        """Feeds a finalized order ([{"item", "quantity", ...}, ...]) to the trending counters and
+        logs its items and their menu categories for the incremental co-occurrence model."""
+        if not order:
+            return
+        catalog = self.catalog_store.current()
+        lines = []
+        for line in order:
+            product = catalog.get(line["item"])
+            lines.append((line["item"], product.category if product is not None else "", line.get("quantity", 1)))
+        if self.trending is not None:
+            context = current_recommendation_context()
+            self.trending.record(lines, context.outlet_id if context is not None else None)
+        if self.order_log_path:
+            try:
+                append_order(self.order_log_path, [item for item, _, _ in lines],
+                             [category for _, category, _ in lines])
+            except OSError as e:
+                logger.warning("Could not append order to %s: %s", self.order_log_path, e)
+
+    def _context_tables(self,context):
+        """(popular, rules) of the cube cell for context, or (None, None) to use the global tables.
+        context defaults to the one of the job being served."""
+        if self.context_cubes is None:
+            return None, None
+        if context is None:
+            context = current_recommendation_context()
+        return self.context_cubes.popular(context), self.context_cubes.rules(context)
+
+    def get_apriori_recommendation(self,products,top_k=5,context=None):
+        apriori_recommendations = self.refresh_artifacts().apriori_recommendations
+        _, context_rules = self._context_tables(context)
+        catalog = self.catalog_store.current()
         recommendation_list = []
         for product in products:
-            if product in self.apriori_recommendations:
-                recommendation_list += self.apriori_recommendations[product]
+            # The LLM and order history may not use the exact spelling the artifacts were trained on
+            resolved, _ = catalog.resolve(product)
+            product = resolved.name if resolved is not None else product
+            # Rules mined for the outlet and time of day first, the global ones for products without any
+            if context_rules is not None and product in context_rules:
+                recommendation_list += context_rules[product]
+            elif product in apriori_recommendations:
+                recommendation_list += apriori_recommendations[product]
         
         # Sort recommendation list by "confidence"
         recommendation_list = sorted(recommendation_list,key=lambda x: x['confidence'],reverse=True)
+        on_menu = set(self.on_menu([recommendation['product'] for recommendation in recommendation_list]))
 
         recommendations = []
         recommendations_per_category = {}
         for recommendation in recommendation_list:
             # If Duplicated recommendations then skip
-            if recommendation in recommendations:
+            if recommendation in recommendations or recommendation['product'] not in on_menu:
                 continue 
 
             # Limit 2 recommendations per category
@@ -61,89 +246,159 @@ class RecommendationAgent():
 
         return recommendations 
 
-    def get_popular_recommendation(self,product_categories=None,top_k=5):
-        recommendations_df = self.popular_recommendations
+    def get_personal_recommendation(self,product_categories=None,top_k=5,customer_id=None):
+        """Products picked for this customer, [] when the customer is unknown. customer_id
+        defaults to the one of the job being served."""
+        if self.customer_recommendations is None:
+            return []
+        if customer_id is None:
+            context = current_recommendation_context()
+            customer_id = context.customer_id if context is not None else None
+        personal = self.customer_recommendations.top_n(customer_id)
+        if not personal:
+            return []
+
+        if type(product_categories) == str:
+            product_categories = [product_categories]
+        return self.on_menu([product for product, category in personal
+                             if not product_categories or category in product_categories])[:top_k]
+
+    def get_trending_recommendation(self,product_categories=None,top_k=5,context=None):
+        """Products ordered most recently (decayed), [] while the outlet and categories have seen
+        fewer than TRENDING_MIN_LINES recent lines."""
+        if self.trending is None:
+            return []
+        if type(product_categories) == str:
+            product_categories = [product_categories]
+        if context is None:
+            context = current_recommendation_context()
+        trending, recent_lines = self.trending.top(context.outlet_id if context is not None else None,
+                                                   product_categories or None)
+        if recent_lines < self.trending_min_lines:
+            return []
+        return self.on_menu([product for product, _ in trending])[:top_k]
+
+    def get_popular_recommendation(self,product_categories=None,top_k=5,context=None):
+        recommendations_df = self.refresh_artifacts().popular_recommendations
         
         if type(product_categories) == str:
             product_categories = [product_categories]
 
+        # What sells now first, topped up with what sold at this outlet and time of day, else the global counts
+        trending = self.get_trending_recommendation(product_categories,top_k,context)
+        if len(trending) >= top_k:
+            return trending
+
+        context_popular, _ = self._context_tables(context)
+        if context_popular is not None:
+            recommendations = self.on_menu([product for product, category in context_popular
+                                            if product_categories is None or category in product_categories])
+            if recommendations:
+                return list(dict.fromkeys(trending + recommendations))[:top_k]
+
         if product_categories is not None:
-            recommendations_df = self.popular_recommendations[self.popular_recommendations['product_category'].isin(product_categories)]
+            recommendations_df = recommendations_df[recommendations_df['product_category'].isin(product_categories)]
         recommendations_df = recommendations_df.sort_values(by='number_of_transactions',ascending=False)
         
         if recommendations_df.shape[0] == 0:
-            return []
-
-        recommendations = recommendations_df['product'].tolist()[:top_k]
-        return recommendations
-
-    def recommendation_classification(self,messages):
-        system_prompt = """ You are a helpful AI assistant for a coffee shop application which serves drinks and pastries. We have 3 types of recommendations:
-
-        1. Apriori Recommendations: These are recommendations based on the user's order history. We recommend items that are frequently bought together with the items in the user's order.
-        2. Popular Recommendations: These are recommendations based on the popularity of items in the coffee shop. We recommend items that are popular among customers.
-        3. Popular Recommendations by Category: Here the user asks to recommend them product in a category. Like what coffee do you recommend me to get?. We recommend items that are popular in the category of the user's requested category.
+            return trending
+
+        recommendations = self.on_menu(recommendations_df['product'].tolist())
+        return list(dict.fromkeys(trending + recommendations))[:top_k]
+
+    def classification_prompt(self):
+        # The item and category lists only change with the artifacts, so the prompt is built once
+        # per loaded artifacts object (one per outlet shard) and stays byte-identical between calls
+        artifacts = self.current_artifacts()
+        prompt = self._classification_prompts.get(artifacts)
+        if prompt is None:
+            system_prompt = """ You are a helpful AI assistant for a coffee shop application which serves drinks and pastries. We have 3 types of recommendations:
+
+            1. Apriori Recommendations: These are recommendations based on the user's order history. We recommend items that are frequently bought together with the items in the user's order.
+            2. Popular Recommendations: These are recommendations based on the popularity of items in the coffee shop. We recommend items that are popular among customers.
+            3. Popular Recommendations by Category: Here the user asks to recommend them product in a category. Like what coffee do you recommend me to get?. We recommend items that are popular in the category of the user's requested category.
         
-        Here is the list of items in the coffee shop:
-        """+ ",".join(self.products) + """
-        Here is the list of Categories we have in the coffee shop:
-        """ + ",".join(self.product_categories) + """
-
-        Your task is to determine which type of recommendation to provide based on the user's message.
-
-        Your output should be in a structured json format like so. Each key is a string and each value is a string. Make sure to follow the format exactly:
-        {
-        "chain of thought": "Write down your critical thinking about what type of recommendation is this input relevant to.",
-        "recommendation_type": "apriori" or "popular" or "popular by category". Pick one of those and only write the word.
-        "parameters": "This is a  python list. It's either a list of of items for apriori recommendations or a list of categories for popular by category recommendations. Leave it empty for popular recommendations. Make sure to use the exact strings from the list of items and categories above."
-        }
-        """
+            Here is the list of items in the coffee shop:
+            """+ ",".join(artifacts.products) + """
+            Here is the list of Categories we have in the coffee shop:
+            """ + ",".join(dict.fromkeys(artifacts.product_categories)) + """
+
+            Your task is to determine which type of recommendation to provide based on the user's message.
+
+            Your output should be in a structured json format like so. Each key is a string and each value is a string. Make sure to follow the format exactly:
+            {
+            "chain of thought": "Write down your critical thinking about what type of recommendation is this input relevant to.",
+            "recommendation_type": "apriori" or "popular" or "popular by category". Pick one of those and only write the word.
+            "parameters": "This is a  python list. It's either a list of of items for apriori recommendations or a list of categories for popular by category recommendations. Leave it empty for popular recommendations. Make sure to use the exact strings from the list of items and categories above."
+            }
+            """
+            prompt = self._classification_prompts.setdefault(artifacts, PromptBuilder(system_prompt, window=3, budget=800))
+        return prompt
+
+    def quick_classification(self,messages):
+        """Classification from the menu items and categories the message names, without the LLM."""
+        products, categories = self.catalog_store.current().mentions(messages[-1]['content'])
+        if products:
+            return {"recommendation_type": "apriori", "parameters": products}
+        if categories:
+            return {"recommendation_type": "popular by category", "parameters": categories}
+        return {"recommendation_type": "popular", "parameters": []}
 
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+    def recommendation_classification(self,messages):
+        messages = Conversation.of(messages)
+        if current_level() >= TEMPLATED_REPLIES:
+            return self.quick_classification(messages)
+        input_messages = self.classification_prompt().build(messages)
 
-        chatbot_output = get_chatbot_response(self.client, self.model_name, input_messages)
+        try:
+            chatbot_output = get_chatbot_response(self.client, self.model_name, input_messages)
+        except LLMUnavailableError:
+            return self.quick_classification(messages)
         # Use the improved double_check_json_output to ensure valid JSON
         chatbot_output = double_check_json_output(self.client, self.model_name, chatbot_output)
         output = self.postprocess_classfication(chatbot_output)
         return output
 
     def get_response(self,messages):
-        messages = deepcopy(messages)
+        messages = Conversation.of(messages)
 
         recommendation_classification = self.recommendation_classification(messages)
         recommendation_type = recommendation_classification['recommendation_type']
         recommendations = []
+        # Known customers get their own picks; everyone else the popular ones
         if recommendation_type == "apriori":
             recommendations = self.get_apriori_recommendation(recommendation_classification['parameters'])
         elif recommendation_type == "popular":
-            recommendations = self.get_popular_recommendation()
+            recommendations = self.get_personal_recommendation() or self.get_popular_recommendation()
         elif recommendation_type == "popular by category":
-            recommendations = self.get_popular_recommendation(recommendation_classification['parameters'])
+            categories = recommendation_classification['parameters']
+            recommendations = self.get_personal_recommendation(categories) or self.get_popular_recommendation(categories)
         
-        logging.warning(f"DEBUG: Raw recommendations before final prompt: {recommendations}") # Using warning level for visibility
+        logger.debug("Raw recommendations before final prompt: %s", recommendations)
         if recommendations == []:
             return {"role": "assistant", "content":"Sorry, I can't help with that. Can I help you with your order?"}
         
+        if self.use_renderer():
+            return self.postprocess(self.renderer.render(recommendations))
+
         # Respond to User
         recommendations_str = ", ".join(recommendations)
         
-        system_prompt = f"""
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their input message. And respond in a friendly but concise way. And put it an unordered list with a very small description.
-
-        I will provide what items you should recommend to the user based on their order in the user message. 
-        """
-
         prompt = f"""
         {messages[-1]['content']}
 
         Please recommend me those items exactly: {recommendations_str}
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = self.recommendation_prompt.build(messages, final_content=prompt)
 
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        try:
+            chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        except LLMUnavailableError:
+            # The templated reply needs only the catalog
+            if not len(self.catalog_store.current()):
+                raise
+            return self.postprocess(self.renderer.render(recommendations))
         output = self.postprocess(chatbot_output)
 
         return output
@@ -167,19 +422,16 @@ class RecommendationAgent():
         return dict_output
 
     def get_recommendations_from_order(self,messages,order):
+        messages = Conversation.of(messages)
         products = []
         for product in order:
             products.append(product['item'])
 
-        recommendations = self.get_apriori_recommendation(products)
-        recommendations_str = ", ".join(recommendations)
+        recommendations = self.get_apriori_recommendation(products) or self.get_personal_recommendation()
+        if self.use_renderer() and recommendations:
+            return self.postprocess(self.renderer.render(recommendations, from_order=True))
 
-        system_prompt = f"""
-        You are a helpful AI assistant for a coffee shop application which serves drinks and pastries.
-        your task is to recommend items to the user based on their order.
-
-        I will provide what items you should recommend to the user based on their order in the user message. 
-        """
+        recommendations_str = ", ".join(recommendations)
 
         prompt = f"""
         {messages[-1]['content']}
@@ -187,10 +439,14 @@ class RecommendationAgent():
         Please recommend me those items exactly: {recommendations_str}
         """
 
-        messages[-1]['content'] = prompt
-        input_messages = [{"role": "system", "content": system_prompt}] + messages[-3:]
+        input_messages = self.order_recommendation_prompt.build(messages, final_content=prompt)
 
-        chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        try:
+            chatbot_output =get_chatbot_response(self.client,self.model_name,input_messages)
+        except LLMUnavailableError:
+            if not len(self.catalog_store.current()) or not recommendations:
+                raise
+            return self.postprocess(self.renderer.render(recommendations, from_order=True))
         output = self.postprocess(chatbot_output)
 
         return output
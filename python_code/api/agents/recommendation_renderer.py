@@ -0,0 +1,71 @@
+import logging
+from .catalog import get_catalog_store
+
+logger = logging.getLogger("recommendation_renderer")
+
+DEFAULT_HEADER_TEMPLATE = "Here are some items I think you'll enjoy:"
+DEFAULT_ORDER_HEADER_TEMPLATE = "Customers who ordered the same items often also get:"
+DEFAULT_ITEM_TEMPLATE = "- **{name}** (RM{price:.2f}, rated {rating}/5): {short_description}"
+DEFAULT_UNKNOWN_ITEM_TEMPLATE = "- **{name}**"
+DEFAULT_FOOTER_TEMPLATE = "Would you like to add any of these to your order?"
+
+
+def shorten_description(description, max_chars=90):
+    """Keeps the first sentence of a description, cut at a word boundary if still too long."""
+    description = " ".join(description.split())
+    first_sentence = description.split(". ")[0].rstrip(".")
+    if len(first_sentence) <= max_chars:
+        return first_sentence + "."
+    cut = first_sentence[:max_chars].rsplit(" ", 1)[0].rstrip(",;:")
+    return cut + "..."
+
+
+class RecommendationRenderer():
+    """Builds recommendation replies from product records without calling the LLM."""
+
+    def __init__(self,
+                 catalog_store=None,
+                 header_template=DEFAULT_HEADER_TEMPLATE,
+                 order_header_template=DEFAULT_ORDER_HEADER_TEMPLATE,
+                 item_template=DEFAULT_ITEM_TEMPLATE,
+                 unknown_item_template=DEFAULT_UNKNOWN_ITEM_TEMPLATE,
+                 footer_template=DEFAULT_FOOTER_TEMPLATE,
+                 max_description_chars=90):
+        self.catalog_store = catalog_store or get_catalog_store()
+        self.header_template = header_template
+        self.order_header_template = order_header_template
+        self.item_template = item_template
+        self.unknown_item_template = unknown_item_template
+        self.footer_template = footer_template
+        self.max_description_chars = max_description_chars
+
+    def _fields(self):
+        # Precompute the per-product template fields once per catalog so rendering is a
+        # dict lookup + format
+        def build(catalog):
+            return {
+                product.name: {
+                    "name": product.name,
+                    "category": product.category,
+                    "price": product.price,
+                    "rating": product.rating,
+                    "short_description": shorten_description(product.description, self.max_description_chars),
+                }
+                for product in catalog
+            }
+        return self.catalog_store.current().derived(("renderer_fields", self.max_description_chars), build)
+
+    def render_item(self, product_name):
+        fields = self._fields().get(product_name)
+        if fields is None:
+            logger.debug("No product record for '%s', rendering name only", product_name)
+            return self.unknown_item_template.format(name=product_name)
+        return self.item_template.format(**fields)
+
+    def render(self, recommendations, from_order=False):
+        header = self.order_header_template if from_order else self.header_template
+        lines = [header]
+        lines += [self.render_item(product_name) for product_name in recommendations]
+        if self.footer_template:
+            lines.append(self.footer_template)
+        return "\n".join(lines)
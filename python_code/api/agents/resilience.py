@@ -0,0 +1,188 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import contextmanager
+from .load_balancer import Endpoint, LoadBalancer, get_chat_balancer, current_conversation_key
+
+logger = logging.getLogger("resilience")
+
+MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "3"))
+ATTEMPT_TIMEOUT = float(os.environ.get("LLM_ATTEMPT_TIMEOUT", "30"))
+DEFAULT_DEADLINE = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "60"))
+HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+# Absolute time.monotonic() deadline of the request being served by the current thread
+_deadline = contextvars.ContextVar("llm_request_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+@contextmanager
+def request_deadline(seconds=None):
+    """Bounds every LLM call made inside the block by one shared deadline."""
+    token = _deadline.set(time.monotonic() + (seconds if seconds is not None else DEFAULT_DEADLINE))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    deadline = _deadline.get()
+    if deadline is None:
+        return DEFAULT_DEADLINE
+    return deadline - time.monotonic()
+
+
+class ResilientCaller():
+    """Runs chat completions on a background event loop with hedging, retries and circuit breaking.
+
+    Callers stay synchronous: they block on a future for at most the remaining request deadline,
+    while backoff sleeps and hedged duplicates only cost a coroutine on the shared loop. Calls are
+    routed through the LLM_CHAT_ENDPOINTS pool when configured, otherwise to the agent's own client.
+    """
+
+    def __init__(self):
+        self._balancers = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-event-loop", daemon=True)
+        self._thread.start()
+
+    def _get_balancer(self, client):
+        pool = get_chat_balancer()
+        if pool is not None:
+            return pool
+        key = str(client.base_url)
+        with self._lock:
+            if key not in self._balancers:
+                self._balancers[key] = LoadBalancer([Endpoint(client.base_url, client.api_key)])
+            return self._balancers[key]
+
+    def chat_completion(self, client, affinity_key=None, **request):
+        """Returns the completion for request or raises once retries or the deadline are exhausted.
+
+        affinity_key defaults to the current conversation key.
+        """
+        balancer = self._get_balancer(client)
+        deadline = time.monotonic() + remaining_time()
+        if affinity_key is None:
+            affinity_key = current_conversation_key()
+        call = self._call_with_retries(balancer, request, deadline, affinity_key)
+        future = asyncio.run_coroutine_threadsafe(call, self._loop)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise DeadlineExceededError("LLM request deadline exceeded")
+
+    async def _call_with_retries(self, balancer, request, deadline, affinity_key):
+        backoff = 1.0
+        last_error = None
+        failed = set()
+        for attempt in range(MAX_ATTEMPTS):
+            # Prefer an endpoint that has not failed this request yet
+            endpoint = balancer.pick(affinity_key, exclude=failed) or balancer.pick(affinity_key)
+            # Checked before allow_request, which may turn the endpoint's call into its half-open probe
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if endpoint is None or not endpoint.breaker.allow_request():
+                raise CircuitOpenError("No healthy LLM endpoint available")
+            try:
+                return await self._hedged_call(balancer, endpoint, request, min(ATTEMPT_TIMEOUT, remaining))
+            except Exception as e:
+                last_error = e
+                failed.add(endpoint)
+                logger.warning("API call to %s failed (attempt %d/%d): %s", endpoint.base_url, attempt + 1, MAX_ATTEMPTS, e)
+
+            # Full-jitter backoff that never sleeps past the deadline
+            sleep_for = min(random.uniform(0, backoff), deadline - time.monotonic())
+            if attempt < MAX_ATTEMPTS - 1 and sleep_for > 0:
+                await asyncio.sleep(sleep_for)
+            backoff *= 2
+        raise last_error or DeadlineExceededError("LLM request deadline exceeded")
+
+    async def _timed_call(self, balancer, endpoint, request, timeout):
+        with balancer.acquire(endpoint):
+            start = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    endpoint.async_client.chat.completions.create(**request, timeout=timeout), timeout)
+            except asyncio.CancelledError:
+                # Neither a success nor a failure, but a half-open circuit must not wait forever
+                endpoint.breaker.abandon_probe()
+                raise
+            except Exception:
+                endpoint.record_failure()
+                raise
+            endpoint.record_success(time.monotonic() - start)
+            return response
+
+    async def _hedged_call(self, balancer, endpoint, request, timeout):
+        primary = asyncio.ensure_future(self._timed_call(balancer, endpoint, request, timeout))
+        hedge_delay = endpoint.latency.percentile(HEDGE_PERCENTILE)
+        if hedge_delay is None:
+            return await primary
+        hedge_delay = max(hedge_delay, HEDGE_MIN_DELAY)
+        if hedge_delay >= timeout:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        # The duplicate goes to another replica when the pool has one
+        hedge_endpoint = balancer.pick(exclude={endpoint}) or endpoint
+        if not hedge_endpoint.breaker.allow_request():
+            return await primary
+        logger.debug("Hedging request to %s after %.2fs", hedge_endpoint.base_url, hedge_delay)
+        remaining = timeout - hedge_delay
+        pending = {primary, asyncio.ensure_future(self._timed_call(balancer, hedge_endpoint, request, remaining))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancelling the losing task closes its HTTP connection
+            for task in pending:
+                task.cancel()
+
+
+_caller = None
+_caller_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The event loop thread does not survive a fork; a worker starts its own on first use
+    global _caller, _caller_lock
+    _caller = None
+    _caller_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_resilient_caller():
+    global _caller
+    with _caller_lock:
+        if _caller is None:
+            _caller = ResilientCaller()
+        return _caller
@@ -0,0 +1,113 @@
+import time
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger("semantic_cache")
+
+
+class SemanticCache():
+    """Bounded answer cache keyed by query embedding similarity and an exact context key.
+
+    Each entry keeps the normalized query embedding, the context key (whatever besides the query
+    shaped the answer, e.g. the earlier messages in the prompt), the ids of the documents the
+    answer was generated from, the time it was stored and the answer. A lookup is one
+    matrix-vector product over all cached embeddings; only entries with the same context key,
+    younger than ttl_seconds (when set), can hit. invalidate_documents drops the entries built
+    on changed documents. The least recently used entry is evicted when full.
+    """
+
+    def __init__(self, similarity_threshold=0.92, max_entries=256, ttl_seconds=None):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._embeddings = None  # (max_entries, dim) float32, allocated on first store
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._entries = [None] * max_entries  # (context_key, document_ids, stored_at, answer) per slot
+        self._size = 0
+        self._clock = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding, context_key=None):
+        """Returns the cached answer closest to the embedding with the same context key, or None
+        if none is close enough."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._size == 0 or self._embeddings.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = self._embeddings[:self._size] @ query
+            candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+            for slot in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+                slot = int(slot)
+                entry_key, _, stored_at, answer = self._entries[slot]
+                if entry_key != context_key:
+                    continue
+                if self.ttl_seconds is not None and now - stored_at > self.ttl_seconds:
+                    continue
+                self._clock += 1
+                self._last_used[slot] = self._clock
+                self.hits += 1
+                logger.debug("Semantic cache hit (similarity %.3f)", similarities[slot])
+                return answer
+            self.misses += 1
+            return None
+
+    def store(self, embedding, answer, context_key=None, document_ids=()):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._embeddings is None or self._embeddings.shape[1] != vector.shape[0]:
+                self._embeddings = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used[:self._size]))
+
+            self._clock += 1
+            self._embeddings[slot] = vector
+            self._entries[slot] = (context_key, frozenset(document_ids), time.monotonic(), answer)
+            self._last_used[slot] = self._clock
+
+    def invalidate_documents(self, document_ids):
+        """Drops the entries whose answer used any of the documents; returns how many."""
+        document_ids = set(document_ids)
+        with self._lock:
+            slot = dropped = 0
+            while slot < self._size:
+                if self._entries[slot][1].isdisjoint(document_ids):
+                    slot += 1
+                    continue
+                # The last entry takes the freed slot, so live entries stay in [0, size)
+                last = self._size - 1
+                self._embeddings[slot] = self._embeddings[last]
+                self._last_used[slot] = self._last_used[last]
+                self._entries[slot] = self._entries[last]
+                self._entries[last] = None
+                self._size -= 1
+                dropped += 1
+        if dropped:
+            logger.info("Dropped %d cached answers built on changed documents", dropped)
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._size = 0
+
+    def __len__(self):
+        return self._size
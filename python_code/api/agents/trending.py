@@ -0,0 +1,308 @@
+"""Time-decayed "trending now" counts of ordered products, in fixed memory.
+
+Order lines go into one count-min sketch keyed by (outlet, category, product), plus a top-k
+table per (outlet, category) scope; "any outlet" and "any category" are scopes too. Decay is
+forward decay: a line at time t adds exp(t / tau) (relative to a reference time) and every
+estimate is scaled by exp(-now / tau) when read, so old counts fade without touching the
+counters, and the order inside a top-k table never changes with time. Counters are rescaled
+before the weights grow large.
+
+The counts are saved to a local snapshot file now and then, and on exit, so a restart resumes
+them. A save merges only the lines this process recorded since its last save into the file,
+under a file lock: with several worker processes each serves its own counts, the snapshot
+gets everyone's, and a process that recorded nothing (e.g. the parent of the workers) never
+writes.
+"""
+import os
+import json
+import math
+import fcntl
+import time
+import array
+import heapq
+import atexit
+import hashlib
+import logging
+import pathlib
+import threading
+import functools
+import numpy as np
+
+logger = logging.getLogger("trending")
+
+ANY = "*"
+# Rescale the counters once the newest weight reaches e^RESCALE_EXPONENT
+RESCALE_EXPONENT = 30.0
+
+
+@functools.lru_cache(maxsize=8192)
+def _sketch_columns(key, depth, width):
+    digest = hashlib.blake2b(key.encode(), digest_size=4 * depth).digest()
+    return tuple(int.from_bytes(digest[4 * row:4 * row + 4], "little") % width for row in range(depth))
+
+
+class CountMinSketch():
+    """depth x width counters; estimates never undercount and overcount by a share of the total
+    that shrinks with width. Updates are conservative (only the minimal counters grow).
+
+    Rows are plain float arrays: a handful of scalar updates is cheaper than numpy indexing.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array.array("d", bytes(8 * width)) for _ in range(depth)]
+
+    def add(self, key, amount):
+        """Adds amount to key and returns its new estimate."""
+        columns = _sketch_columns(key, self.depth, self.width)
+        estimate = min(row[column] for row, column in zip(self.rows, columns)) + amount
+        for row, column in zip(self.rows, columns):
+            if row[column] < estimate:
+                row[column] = estimate
+        return estimate
+
+    def estimate(self, key):
+        return min(row[column] for row, column in zip(self.rows, _sketch_columns(key, self.depth, self.width)))
+
+    def scale(self, factor):
+        for row in self.rows:
+            np.frombuffer(row, dtype=np.float64)[:] *= factor
+
+    def to_array(self):
+        return np.array([np.frombuffer(row, dtype=np.float64) for row in self.rows])
+
+    def load_array(self, counts):
+        self.rows = [array.array("d", counts[row].astype(np.float64).tobytes()) for row in range(self.depth)]
+
+
+class TopK():
+    """The k keys with the highest scores seen; scores of a key only grow. A min-heap with
+    stale entries skipped lazily finds the key to evict."""
+
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+        self._heap = []
+
+    def offer(self, key, score):
+        if key not in self.scores and len(self.scores) >= self.k:
+            self._drop_stale()
+            if score <= self._heap[0][0]:
+                return
+            _, evicted = heapq.heappop(self._heap)
+            del self.scores[evicted]
+        self.scores[key] = score
+        heapq.heappush(self._heap, (score, key))
+        if len(self._heap) > 4 * self.k:
+            self._rebuild()
+
+    def _drop_stale(self):
+        while self.scores.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _rebuild(self):
+        self._heap = [(score, key) for key, score in self.scores.items()]
+        heapq.heapify(self._heap)
+
+    def scale(self, factor):
+        self.scores = {key: score * factor for key, score in self.scores.items()}
+        self._rebuild()
+
+    def ranked(self):
+        return sorted(self.scores.items(), key=lambda entry: (-entry[1], entry[0]))
+
+
+class TrendingCounters():
+    def __init__(self, half_life_seconds=3600.0, width=2048, depth=4, k=20, max_scopes=256,
+                 snapshot_path=None, snapshot_seconds=60.0):
+        self.tau = half_life_seconds / math.log(2)
+        self.k = k
+        self.max_scopes = max_scopes
+        self.sketch = CountMinSketch(width, depth)
+        self.tables = {}                  # (outlet, category) -> TopK of products
+        self.totals = {}                  # (outlet, category) -> decayed lines, same reference time
+        self.reference_time = time.time()
+        self.snapshot_path = pathlib.Path(snapshot_path) if snapshot_path else None
+        self.snapshot_seconds = snapshot_seconds
+        self._last_snapshot = time.monotonic()
+        self._lock = threading.Lock()
+        # Lines recorded since the last save, relative to the same reference time
+        self._unsaved = CountMinSketch(width, depth)
+        self._unsaved_totals = {}
+        self._unsaved_keys = set()        # (outlet, category, product)
+
+        if self.snapshot_path is not None:
+            if self.snapshot_path.exists():
+                self._load(self.snapshot_path)
+            atexit.register(self.save)
+
+    def _weight(self, now):
+        return math.exp((now - self.reference_time) / self.tau)
+
+    def record(self, lines, outlet_id=None, now=None):
+        """Counts one order given as (product, category, quantity) lines."""
+        now = time.time() if now is None else now
+        outlet = ANY if outlet_id is None else str(outlet_id)
+        with self._lock:
+            if (now - self.reference_time) / self.tau > RESCALE_EXPONENT:
+                self._rescale(now)
+            weight = self._weight(now)
+            for product, category, quantity in lines:
+                amount = weight * max(int(quantity), 1)
+                for scope in {(outlet, category), (outlet, ANY), (ANY, category), (ANY, ANY)}:
+                    table = self.tables.get(scope)
+                    if table is None:
+                        if len(self.tables) >= self.max_scopes:
+                            continue
+                        table = self.tables[scope] = TopK(self.k)
+                    key = "\x1f".join((scope[0], scope[1], product))
+                    table.offer(product, self.sketch.add(key, amount))
+                    self.totals[scope] = self.totals.get(scope, 0.0) + amount
+                    if self.snapshot_path is not None:
+                        self._unsaved.add(key, amount)
+                        self._unsaved_totals[scope] = self._unsaved_totals.get(scope, 0.0) + amount
+                        self._unsaved_keys.add((scope[0], scope[1], product))
+        if self.snapshot_path is not None and time.monotonic() - self._last_snapshot >= self.snapshot_seconds:
+            self.save()
+
+    def _rescale(self, now):
+        factor = 1.0 / self._weight(now)
+        self.sketch.scale(factor)
+        self._unsaved.scale(factor)
+        for table in self.tables.values():
+            table.scale(factor)
+        self.totals = {scope: total * factor for scope, total in self.totals.items()}
+        self._unsaved_totals = {scope: total * factor for scope, total in self._unsaved_totals.items()}
+        self.reference_time = now
+
+    def top(self, outlet_id=None, categories=None, k=None, now=None):
+        """[(product, decayed order lines), ...] trending in the outlet (any outlet when None or
+        untracked) and categories (all when None), best first, and the scope's decayed total."""
+        now = time.time() if now is None else now
+        outlet = ANY if outlet_id is None else str(outlet_id)
+        with self._lock:
+            if (outlet, ANY) not in self.tables:
+                outlet = ANY
+            scopes = [(outlet, category) for category in categories] if categories else [(outlet, ANY)]
+            decay = 1.0 / self._weight(now)
+            ranked = {}
+            total = 0.0
+            for scope in scopes:
+                table = self.tables.get(scope)
+                if table is not None:
+                    ranked.update(table.scores)
+                    total += self.totals.get(scope, 0.0)
+        ranked = sorted(ranked.items(), key=lambda entry: (-entry[1], entry[0]))[:k or self.k]
+        return [(product, score * decay) for product, score in ranked], total * decay
+
+    def save(self):
+        """Adds the lines recorded since the last save to the snapshot file."""
+        if self.snapshot_path is None:
+            return
+        with self._lock:
+            self._last_snapshot = time.monotonic()
+            if not self._unsaved_keys:
+                return
+            unsaved = (self._unsaved.to_array(), self._unsaved_totals, self._unsaved_keys, self.reference_time)
+            self._unsaved = CountMinSketch(self.sketch.width, self.sketch.depth)
+            self._unsaved_totals = {}
+            self._unsaved_keys = set()
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.snapshot_path.with_name(self.snapshot_path.name + ".lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                merged = TrendingCounters(self.tau * math.log(2), self.sketch.width, self.sketch.depth,
+                                          self.k, self.max_scopes)
+                if self.snapshot_path.exists():
+                    merged._load(self.snapshot_path)
+                merged._merge(*unsaved)
+                merged._write(self.snapshot_path)
+        except OSError as e:
+            logger.warning("Could not save trending snapshot %s: %s", self.snapshot_path, e)
+
+    def _merge(self, counts, totals, keys, reference_time):
+        # Weights relative to reference_time, moved to ours; the newer reference keeps them small
+        if reference_time > self.reference_time:
+            self._rescale(reference_time)
+        factor = math.exp((reference_time - self.reference_time) / self.tau)
+        self.sketch.load_array(self.sketch.to_array() + counts * factor)
+        for scope, total in totals.items():
+            self.totals[scope] = self.totals.get(scope, 0.0) + total * factor
+        for outlet, category, product in keys:
+            table = self.tables.get((outlet, category))
+            if table is None:
+                if len(self.tables) >= self.max_scopes:
+                    continue
+                table = self.tables[(outlet, category)] = TopK(self.k)
+            table.offer(product, self.sketch.estimate("\x1f".join((outlet, category, product))))
+
+    def _write(self, path):
+        state = {
+            "reference_time": self.reference_time,
+            "tau": self.tau,
+            "k": self.k,
+            "scopes": [[outlet, category, self.totals.get((outlet, category), 0.0), table.ranked()]
+                       for (outlet, category), table in self.tables.items()],
+        }
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as file:
+            np.savez(file, counts=self.sketch.to_array(), state=np.array(json.dumps(state)))
+        os.replace(tmp_path, path)
+
+    def _load(self, path):
+        try:
+            with np.load(path) as data:
+                counts = data["counts"]
+                state = json.loads(str(data["state"]))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable trending snapshot %s: %s", path, e)
+            return
+        if counts.shape != (self.sketch.depth, self.sketch.width):
+            logger.warning("Ignoring trending snapshot %s with a %s sketch, configured for %s",
+                           path, counts.shape, (self.sketch.depth, self.sketch.width))
+            return
+        # Counts saved with another half-life are still counts; they just keep decaying at ours
+        self.sketch.load_array(counts)
+        self.reference_time = state["reference_time"]
+        for outlet, category, total, ranked in state["scopes"][:self.max_scopes]:
+            table = self.tables[(outlet, category)] = TopK(self.k)
+            for product, score in ranked[:self.k]:
+                table.offer(product, score)
+            self.totals[(outlet, category)] = total
+        logger.info("Resumed trending counts from %s (%d scopes)", path, len(self.tables))
+
+
+_trending = None
+_trending_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The parent's lock may have been held by a thread that does not exist in the child
+    global _trending_lock
+    _trending_lock = threading.Lock()
+    if _trending is not None:
+        _trending._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_trending_counters():
+    """Process-wide counters configured from the environment, or None when TRENDING=false.
+
+    TRENDING_HALF_LIFE_MINUTES  time for a count to lose half its weight (60)
+    TRENDING_SNAPSHOT           local file the counts are saved to and resumed from (none)
+    TRENDING_SNAPSHOT_SECONDS   interval between saves while orders come in (60)
+    """
+    global _trending
+    if os.environ.get("TRENDING", "true").lower() != "true":
+        return None
+    with _trending_lock:
+        if _trending is None:
+            _trending = TrendingCounters(
+                half_life_seconds=float(os.environ.get("TRENDING_HALF_LIFE_MINUTES", "60")) * 60,
+                snapshot_path=os.environ.get("TRENDING_SNAPSHOT") or None,
+                snapshot_seconds=float(os.environ.get("TRENDING_SNAPSHOT_SECONDS", "60")),
+            )
+        return _trending
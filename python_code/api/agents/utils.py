@@ -3,10 +3,19 @@ import re
 import time
 import logging
 from functools import lru_cache
+from .resilience import get_resilient_caller
+from .load_balancer import get_embedding_balancer, current_conversation_key
+from .log_setup import Payload
+from .overload import get_overload_controller
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("utils")
 
+
+class LLMUnavailableError(Exception):
+    """Raised by get_chatbot_response when the LLM gave no answer: every attempt failed, no
+    endpoint's circuit was closed or the request's deadline passed."""
+
+
 def get_chatbot_response(client, model_name, messages, temperature=0):
     input_messages = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
 
@@ -20,37 +29,56 @@ def get_chatbot_response(client, model_name, messages, temperature=0):
     # Clamp response tokens to a reasonable range, increasing upper limit
     # Old: max(512, min(max_response_tokens, 2048))
     max_response_tokens = max(512, min(max_response_tokens, 8192)) # Increased upper clamp to 8192
-    logger.debug(f"Calculated max_response_tokens: {max_response_tokens}") # Add log
+    # Under load the overload controller shortens generations, and the latency of each call feeds it
+    overload = get_overload_controller()
+    if overload is not None:
+        max_response_tokens = overload.generation_budget(max_response_tokens)
+    logger.debug("Calculated max_response_tokens: %d", max_response_tokens)
 
-    # Retry mechanism
-    max_retries = 3
-    retry_delay = 1.0
-    
-    for attempt in range(max_retries):
+    # Every call of a conversation (guard, classification, agent) goes to the same endpoint, whose
+    # prefix cache then holds each agent's system prompt and the conversation's history
+    affinity_key = current_conversation_key()
+
+    # Hedging, retries with backoff and the per-endpoint circuit breaker live in the resilient caller;
+    # the whole call is bounded by the deadline of the request being served
+    try:
+        start = time.monotonic()
         try:
-            response = client.chat.completions.create(
+            response = get_resilient_caller().chat_completion(
+                client,
+                affinity_key=affinity_key,
                 model="meta-llama/Llama-3.1-8B-Instruct",
                 messages=input_messages,
                 temperature=temperature,
                 top_p=0.8,
                 max_tokens=max_response_tokens,
-                timeout=30,
             )
-            logger.info(f"Raw API Response (Attempt {attempt + 1}): {response}") # Log the raw response
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.warning(f"API call failed (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2 # Exponential backoff
-            else:
-                logger.error(f"API call failed after {max_retries} attempts.")
-                # Return default error structure
-                return '{"decision": "allowed", "message": "Sorry, I encountered a temporary issue. Please try again.", "chain_of_thought": "Error in API call after retries"}'
+        finally:
+            # Calls that time out or fail count too: an LLM that stops answering is load to shed
+            if overload is not None:
+                overload.record_latency(time.monotonic() - start)
+        logger.debug("Raw API Response: %s", Payload(response))
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.error("API call failed: %r", e)
+        raise LLMUnavailableError(repr(e)) from e
 
 
 def get_embedding(embedding_client, model_name, text_input):
-    output = embedding_client.embeddings.create(input=text_input, model=model_name)
+    # Spread embedding calls over the LLM_EMBEDDING_ENDPOINTS pool when one is configured
+    balancer = get_embedding_balancer()
+    endpoint = balancer.pick() if balancer is not None else None
+    if endpoint is None:
+        output = embedding_client.embeddings.create(input=text_input, model=model_name)
+    else:
+        with balancer.acquire(endpoint):
+            start = time.monotonic()
+            try:
+                output = endpoint.client.embeddings.create(input=text_input, model=model_name)
+            except Exception:
+                endpoint.record_failure()
+                raise
+            endpoint.record_success(time.monotonic() - start)
     
     return [embedding_object.embedding for embedding_object in output.data]
 
@@ -69,7 +97,7 @@ def double_check_json_output(client, model_name, json_string):
     """Validates if a string is valid JSON, attempts regex extraction if not."""
     # Strip leading/trailing whitespace before any validation
     json_string = json_string.strip()
-    logger.debug(f"Checking JSON (stripped): {json_string}")
+    logger.debug("Checking JSON (stripped): %s", Payload(json_string))
     _, is_valid = _validate_json_string(json_string)
     if is_valid:
         # Already valid JSON
@@ -0,0 +1,79 @@
+"""Measures CPU time and log volume per request under the serving logging setup and a plain one.
+
+    python benchmark_logging.py [--requests 5000] [--levels INFO WARNING]
+
+Each mode runs in its own process: jobs go through AgentController (guard, classification,
+order taking) in one thread, with the LLM replaced by the stand-in from benchmark_prompts.
+"queue" is configure_logging() (queue handler, payloads formatted lazily on the listener
+thread, sampled and redacted); "eager" is a StreamHandler on the root logger that formats every
+record on the request thread, as logging.basicConfig does. CPU time is the whole process's, so
+formatting on the listener thread counts too; log volume is what reaches stderr.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+os.environ.setdefault("RUNPOD_TOKEN", "benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+os.environ.setdefault("OVERLOAD_CONTROL", "false")
+
+FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+
+def run_child(mode, requests):
+    """Runs the jobs in this process and prints {"cpu_us": ...} on stdout; logs go to stderr."""
+    import logging
+    import agent_controller
+    from agents import log_setup
+    from benchmark_workers import install_stand_in, make_job
+
+    if mode == "eager":
+        agent_controller.configure_logging = lambda: None
+        logging.basicConfig(level=os.environ["LOG_LEVEL"], format=FORMAT, stream=sys.stderr)
+    os.environ["BENCHMARK_LLM_LATENCY_MS"] = "0"
+    install_stand_in()
+    controller = agent_controller.AgentController()
+    for index in range(50):
+        controller.get_response(make_job(index))
+
+    start = time.process_time()
+    for index in range(requests):
+        controller.get_response(make_job(index))
+    if log_setup._listener is not None:
+        # Drains the queue, so records still waiting to be formatted are counted
+        log_setup._listener.stop()
+    cpu = time.process_time() - start
+    print(json.dumps({"cpu_us": cpu / requests * 1e6}))
+
+
+def measure(mode, level, requests):
+    env = dict(os.environ, LOG_LEVEL=level)
+    result = subprocess.run([sys.executable, __file__, "--child", mode, "--requests", str(requests)],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    stats = json.loads(result.stdout.decode().strip().splitlines()[-1])
+    stats["log_bytes"] = len(result.stderr) / requests
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--levels", nargs="+", default=["INFO", "WARNING"])
+    parser.add_argument("--child", choices=["queue", "eager"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.requests)
+        return
+    print(f"{'level':8} {'mode':6} {'CPU us/request':>15} {'log bytes/request':>18}")
+    for level in args.levels:
+        for mode in ("eager", "queue"):
+            stats = measure(mode, level, args.requests)
+            print(f"{level:8} {mode:6} {stats['cpu_us']:15.0f} {stats['log_bytes']:18.0f}")
+
+
+if __name__ == "__main__":
+    main()
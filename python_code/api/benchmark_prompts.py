@@ -0,0 +1,126 @@
+"""Compares prompt windows against a prefix-caching stand-in for the inference server.
+
+    python benchmark_prompts.py [--conversations 50] [--turns 10]
+
+Each conversation turn runs the guard, classification and order-taking agents with the LLM
+replaced by a local stand-in. The stand-in keeps a paged prefix cache like vLLM's automatic
+prefix caching (prompt tokens hashed in fixed-size blocks, a block reused only if every block
+before it matched) and charges time to first token as a fixed overhead plus prefill time for
+the uncached tokens. "sliding" sends the last-n window the agents used to send, "anchored" the
+PromptBuilder window. Tokens are approximated by words and punctuation.
+"""
+import os
+import re
+import json
+import random
+import argparse
+import hashlib
+
+os.environ.setdefault("RUNPOD_TOKEN", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import agents.utils as utils
+import agents.prompt_builder as prompt_builder
+from agents.conversation import Conversation
+from agents import GuardAgent, ClassificationAgent, OrderTakingAgent, RecommendationAgent
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class PrefixCacheServer():
+    def __init__(self, block_size=16, base_ms=15.0, prefill_ms_per_token=0.25):
+        self.block_size = block_size
+        self.base_ms = base_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.blocks = set()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.ttft_ms = []
+
+    def prefill(self, messages):
+        # Roughly what a chat template renders: role header then content, per message
+        tokens = []
+        for message in messages:
+            tokens += ["<|" + message["role"] + "|>"] + TOKEN_PATTERN.findall(message["content"])
+        cached = 0
+        chain = hashlib.sha1()
+        for start in range(0, len(tokens) - self.block_size + 1, self.block_size):
+            chain.update("\0".join(tokens[start:start + self.block_size]).encode())
+            key = chain.hexdigest()
+            if key in self.blocks and cached == start:
+                cached += self.block_size
+            self.blocks.add(key)
+        self.prompt_tokens += len(tokens)
+        self.cached_tokens += cached
+        self.ttft_ms.append(self.base_ms + (len(tokens) - cached) * self.prefill_ms_per_token)
+
+
+class StandInCaller():
+    """Replaces the resilient caller: records the prompt on the stand-in and answers in the
+    format the calling agent expects."""
+
+    def __init__(self, server):
+        self.server = server
+        self.rng = random.Random(0)
+
+    def chat_completion(self, client, affinity_key=None, **request):
+        messages = request["messages"]
+        self.server.prefill(messages)
+        system = messages[0]["content"]
+        if "relevant to the coffee shop" in system:
+            content = {"chain of thought": "It is about the coffee shop.", "decision": "allowed", "message": ""}
+        elif "what agent should handle" in system:
+            content = {"chain of thought": "The user is ordering.", "decision": "order_taking_agent", "message": ""}
+        else:
+            item = self.rng.choice(["Latte", "Cappuccino", "Croissant", "Ginger Scone"])
+            content = {"chain of thought": "Adding the item to the order. " * 5, "step number": "2",
+                       "order": [{"item": item, "quantity": 1}],
+                       "response": f"I've added a {item} to your order. " + "Here is your order so far with the prices of each item and the running total. " * 3 + "Would you like anything else?"}
+        choice = type("Choice", (), {"message": type("Message", (), {"content": json.dumps(content)})})
+        return type("Response", (), {"choices": [choice]})
+
+
+def run(mode, conversations, turns):
+    server = PrefixCacheServer()
+    utils.get_resilient_caller = lambda: StandInCaller(server)
+    if mode == "sliding":
+        prompt_builder.anchored_window = lambda conversation, window, step: Conversation.of(conversation).last(window)
+    else:
+        prompt_builder.anchored_window = anchored_window
+
+    recommendation_agent = RecommendationAgent(
+        os.path.join(script_dir, 'recommendation_objects/apriori_recommendations.json'),
+        os.path.join(script_dir, 'recommendation_objects/popularity_recommendation.csv'))
+    agents = [GuardAgent(), ClassificationAgent(), OrderTakingAgent(recommendation_agent)]
+    rng = random.Random(42)
+    for _ in range(conversations):
+        messages = []
+        for _ in range(turns):
+            messages.append({"role": "user", "content": f"Can I also get {rng.randint(1, 3)} of the " +
+                             rng.choice(["latte", "cappuccino", "croissant", "ginger scone"]) + " please?"})
+            for agent in agents:
+                response = agent.get_response(messages)
+            messages.append({"role": "assistant", "content": response["response"], "memory": response["memory"]})
+    return server
+
+
+anchored_window = prompt_builder.anchored_window
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{'window':>9} {'prompt tok':>11} {'cached %':>9} {'mean TTFT ms':>13} {'p95 TTFT ms':>12}")
+    for mode in ("sliding", "anchored"):
+        server = run(mode, args.conversations, args.turns)
+        ttft = sorted(server.ttft_ms)
+        print(f"{mode:>9} {server.prompt_tokens:>11} {100 * server.cached_tokens / server.prompt_tokens:>9.1f} "
+              f"{sum(ttft) / len(ttft):>13.1f} {ttft[int(0.95 * (len(ttft) - 1))]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
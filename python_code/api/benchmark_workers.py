@@ -0,0 +1,114 @@
+"""Compares pre-forked workers sharing preloaded agents with independently started workers.
+
+    python benchmark_workers.py [--workers 4] [--jobs 400] [--latency-ms 20]
+
+Both modes run the same WorkerPool, once with preload (agents built in the parent, workers
+forked from it) and once without (workers spawned fresh, each building its own agents, like N
+separate processes). The LLM is replaced by a local stand-in that answers after a fixed
+latency, so jobs exercise routing, prompt assembly, JSON parsing and order validation. Memory
+per worker is read from /proc: RSS counts shared pages in full, PSS splits them between the
+processes sharing them, and private memory is what each worker holds alone.
+"""
+import os
+import time
+import argparse
+
+os.environ.setdefault("RUNPOD_TOKEN", "benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from worker_pool import WorkerPool
+from agent_controller import AgentController
+
+
+class _NoPrefixCache():
+    def prefill(self, messages):
+        pass
+
+
+def install_stand_in():
+    """Worker initializer: LLM calls go to the stand-in from benchmark_prompts, after a delay."""
+    import agents.utils as utils
+    from benchmark_prompts import StandInCaller
+    latency = float(os.environ["BENCHMARK_LLM_LATENCY_MS"]) / 1000
+
+    class SlowStandIn(StandInCaller):
+        def chat_completion(self, client, affinity_key=None, **request):
+            time.sleep(latency)
+            return super().chat_completion(client, affinity_key, **request)
+
+    caller = SlowStandIn(_NoPrefixCache())
+    utils.get_resilient_caller = lambda: caller
+
+
+def memory_kb(pid):
+    """(rss, pss, private) in kB from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Pss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read().rsplit(")", 1)[1].split()
+    return (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def make_job(index):
+    messages = []
+    for turn in range(index % 4):
+        messages.append({"role": "user", "content": f"Can I get {turn + 1} latte please?"})
+        messages.append({"role": "assistant", "content": "Added a Latte to your order. Anything else?",
+                         "memory": {"agent": "order_taking_agent", "step number": "2",
+                                    "order": [{"item": "Latte", "quantity": turn + 1, "price": "RM4.75"}]}})
+    messages.append({"role": "user", "content": "And a chocolate croissant, thanks"})
+    return {"input": {"messages": messages, "conversation_id": f"benchmark-{index}"}}
+
+
+def run(preload, workers, jobs):
+    pool = WorkerPool(AgentController, workers, preload=preload, initializer=install_stand_in)
+    # Warm up every worker (first jobs also build lazily created state)
+    for future in [pool.submit(make_job(i)) for i in range(pool.capacity * 2)]:
+        future.result()
+    pids = pool.stats()["pids"]
+    cpu_before = sum(cpu_seconds(pid) for pid in pids)
+
+    start = time.monotonic()
+    for future in [pool.submit(make_job(i)) for i in range(jobs)]:
+        future.result()
+    elapsed = time.monotonic() - start
+
+    cpu = sum(cpu_seconds(pid) for pid in pids) - cpu_before
+    memory = [memory_kb(pid) for pid in pids]
+    pool.close()
+    return {
+        "jobs/s": jobs / elapsed,
+        "jobs/cpu-s": jobs / cpu if cpu else float("inf"),
+        "rss": sum(m[0] for m in memory) / len(memory) / 1024,
+        "pss": sum(m[1] for m in memory) / len(memory) / 1024,
+        "private": sum(m[2] for m in memory) / len(memory) / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args(argv)
+    # Read by install_stand_in in the workers
+    os.environ["BENCHMARK_LLM_LATENCY_MS"] = str(args.latency_ms)
+
+    print(f"{'mode':>12} {'jobs/s':>8} {'jobs/cpu-s':>11} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>11}   (per worker)")
+    for mode, preload in (("independent", False), ("preforked", True)):
+        result = run(preload, args.workers, args.jobs)
+        print(f"{mode:>12} {result['jobs/s']:>8.1f} {result['jobs/cpu-s']:>11.1f} {result['rss']:>8.1f} "
+              f"{result['pss']:>8.1f} {result['private']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Converts the recommendation JSON/CSV artifacts to the compact memory-mappable format.
+
+    python convert_artifacts.py                       # writes recommendation_objects/recommendations.bin
+    python convert_artifacts.py --benchmark --workers 8 [--synthetic-products 5000]
+
+Serve it with RECOMMENDATION_ARTIFACTS=recommendation_objects/recommendations.bin.
+The benchmark loads each format in N forked workers and reports load time and the memory
+each worker adds (PSS, which splits shared pages between the processes mapping them).
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import pathlib
+import random
+import tempfile
+import time
+from agents.artifact_store import convert, CompactArtifacts, ARTIFACT_FILE
+from agents.recommendation_agent import RecommendationArtifacts
+
+script_dir = pathlib.Path(__file__).parent.resolve()
+
+
+def _pss_kib():
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure(load, workers):
+    """Forks workers that each load the artifacts; returns (mean load seconds, mean PSS delta KiB)."""
+    pipes = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        if os.fork() == 0:
+            os.close(read_fd)
+            gc.collect()
+            before = _pss_kib()
+            start = time.perf_counter()
+            artifacts = load()
+            artifacts.apriori_recommendations.get("Latte")
+            elapsed = time.perf_counter() - start
+            time.sleep(0.5)  # keep every worker alive while the others measure
+            os.write(write_fd, f"{elapsed} {_pss_kib() - before}".encode())
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append(read_fd)
+
+    results = []
+    for read_fd in pipes:
+        results.append([float(value) for value in os.read(read_fd, 64).split()])
+        os.close(read_fd)
+    for _ in pipes:
+        os.wait()
+    return sum(r[0] for r in results) / workers, sum(r[1] for r in results) / workers
+
+
+def write_synthetic_artifacts(directory, n_products, rules_per_product=40):
+    """A catalog-sized stand-in for growth: n_products items with rules_per_product rules each."""
+    names = [f"Product {i}" for i in range(n_products)]
+    categories = [f"Category {i % 25}" for i in range(n_products)]
+    apriori = {
+        name: [{"product": names[j], "product_category": categories[j], "confidence": random.random()}
+               for j in random.sample(range(n_products), rules_per_product)]
+        for name in names
+    }
+    apriori_path = pathlib.Path(directory) / "apriori_recommendations.json"
+    popularity_path = pathlib.Path(directory) / "popularity_recommendation.csv"
+    with open(apriori_path, 'w') as file:
+        json.dump(apriori, file)
+    with open(popularity_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["product", "product_category", "number_of_transactions"])
+        writer.writerows((name, category, random.randint(1, 1000)) for name, category in zip(names, categories))
+    return apriori_path, popularity_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apriori", default=script_dir / "recommendation_objects/apriori_recommendations.json")
+    parser.add_argument("--popularity", default=script_dir / "recommendation_objects/popularity_recommendation.csv")
+    parser.add_argument("--output", default=script_dir / "recommendation_objects" / ARTIFACT_FILE)
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--synthetic-products", type=int, help="benchmark on generated artifacts of this size")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_products:
+        directory = tempfile.mkdtemp()
+        args.apriori, args.popularity = write_synthetic_artifacts(directory, args.synthetic_products)
+        args.output = pathlib.Path(directory) / ARTIFACT_FILE
+
+    convert(args.apriori, args.popularity, args.output)
+    print(f"Wrote {args.output}: {os.path.getsize(args.output)} bytes "
+          f"(JSON {os.path.getsize(args.apriori)} + CSV {os.path.getsize(args.popularity)} bytes)")
+
+    if args.benchmark:
+        formats = {
+            "json+csv": lambda: RecommendationArtifacts(args.apriori, args.popularity),
+            "compact": lambda: CompactArtifacts(args.output),
+        }
+        print(f"{'format':>10} {'load ms':>8} {'PSS KiB/worker':>15}")
+        for load in formats.values():
+            load()  # warm up lazy imports in the parent so workers only measure the artifacts
+        for name, load in formats.items():
+            seconds, pss = _measure(load, args.workers)
+            print(f"{name:>10} {seconds * 1000:>8.2f} {pss:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
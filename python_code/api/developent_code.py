@@ -5,6 +5,7 @@ from agents import (GuardAgent,
                     RecommendationAgent,
                     AgentProtocol
                     )
+from agents.log_setup import configure_logging
 import os
 import pathlib # Import pathlib
 
@@ -16,6 +17,7 @@ rec_file1 = script_dir / 'recommendation_objects/apriori_recommendations.json'
 rec_file2 = script_dir / 'recommendation_objects/popularity_recommendation.csv'
 
 def main():
+    configure_logging()
     guard_agent = GuardAgent()
     classification_agent = ClassificationAgent()
     recommendation_agent = RecommendationAgent(rec_file1, rec_file2)
@@ -0,0 +1,328 @@
+"""Standalone HTTP server for the agents, for always-warm hosts instead of RunPod serverless.
+
+    POST /, /run or /runsync   {"input": {"messages": [...]}} -> {"id", "status", "output"}
+    GET  /health               200 while the process is serving (liveness)
+    GET  /ready                200 once the agents are loaded, 503 while loading or draining
+    GET  /metrics              Prometheus text format
+
+Connections are HTTP/1.1 keep-alive (HTTP/1.0 ones when they ask for it). Pipelined requests on a connection are handled
+concurrently and answered in order. Jobs beyond HTTP_MAX_INFLIGHT are refused with a 503 instead
+of queueing without bound. Each connection reads at most HTTP_MAX_PIPELINE requests ahead of
+its responses. SIGTERM stops accepting, drains in-flight jobs and exits.
+"""
+import os
+import json
+import time
+import uuid
+import signal
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from agents.log_setup import configure_logging
+from agents.metrics import counter, histogram, render_prometheus
+from agents.overload import get_overload_controller, retry_response, SHED
+
+logger = logging.getLogger("http_server")
+
+REQUEST_SECONDS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+JOB_PATHS = ("/", "/run", "/runsync")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request():
+    __slots__ = ("method", "path", "version", "headers", "body")
+
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class AgentHTTPServer():
+    def __init__(self, host="0.0.0.0", port=8000, workers=1, threads=8, max_inflight=64, max_pipeline=16,
+                 keepalive_timeout=15.0, max_body_bytes=1 << 20, drain_seconds=30.0):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_inflight = max_inflight
+        self.max_pipeline = max_pipeline
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body_bytes = max_body_bytes
+        self.drain_seconds = drain_seconds
+
+        self.controller = None
+        self.pool = None
+        self.overload = None
+        self._executor = None
+        self.ready = False
+        self.draining = False
+        self.inflight = 0
+        self.connections = 0
+        self._server = None
+        self._stopped = None
+
+        self.requests = counter("http_requests_total", "HTTP requests by path and status", ("path", "status"))
+        self.rejected = counter("http_jobs_rejected_total", "Jobs refused because HTTP_MAX_INFLIGHT were running")
+        self.job_seconds = histogram("http_job_duration_seconds", REQUEST_SECONDS_BUCKETS, "Time to answer a job")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=os.environ.get("HTTP_HOST", "0.0.0.0"),
+            port=int(os.environ.get("HTTP_PORT", "8000")),
+            workers=int(os.environ.get("WORKERS", "1")),
+            threads=int(os.environ.get("WORKER_THREADS", "8")),
+            max_inflight=int(os.environ.get("HTTP_MAX_INFLIGHT", "64")),
+            max_pipeline=int(os.environ.get("HTTP_MAX_PIPELINE", "16")),
+            keepalive_timeout=float(os.environ.get("HTTP_KEEPALIVE_SECONDS", "15")),
+            max_body_bytes=int(os.environ.get("HTTP_MAX_BODY_BYTES", str(1 << 20))),
+            drain_seconds=float(os.environ.get("HTTP_DRAIN_SECONDS", "30")),
+        )
+
+    def load(self):
+        """Builds the agents (or the worker pool); /ready turns 200 when this returns."""
+        from agent_controller import AgentController
+        if self.workers > 1:
+            from worker_pool import WorkerPool
+            self.pool = WorkerPool(AgentController, self.workers, threads_per_worker=self.threads)
+        else:
+            self.controller = AgentController()
+            self.controller.preload()
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.threads, thread_name_prefix="job")
+        # Jobs waiting for a thread or a worker count as in flight for the overload controller. With
+        # workers, this process only sheds at the door; each worker degrades its own LLM usage
+        self.overload = get_overload_controller()
+        if self.overload is not None:
+            self.overload.inflight_source = lambda: self.inflight
+        self.ready = True
+        logger.info("Agents loaded, ready to serve")
+
+    async def serve(self):
+        configure_logging()
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, lambda: asyncio.ensure_future(self.shutdown()))
+
+        # Listen first so /health answers while the agents load
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=64 * 1024, backlog=1024)
+        logger.info("Listening on %s:%d", self.host, self.port)
+        loading = threading.Thread(target=self._load_or_exit, name="agent-loader", daemon=True)
+        loading.start()
+        await self._stopped.wait()
+
+    def _load_or_exit(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Loading the agents failed")
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    async def shutdown(self):
+        if self.draining:
+            return
+        self.draining = True
+        logger.info("Draining %d in-flight jobs", self.inflight)
+        self._server.close()
+        deadline = time.monotonic() + self.drain_seconds
+        while self.inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.pool.close)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._stopped.set()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        # Responses in request order; the bound makes the reader wait when a client pipelines
+        # more than max_pipeline requests ahead
+        responses = asyncio.Queue(self.max_pipeline)
+        writing = asyncio.ensure_future(self._write_responses(responses, writer))
+        try:
+            while not writing.done():
+                try:
+                    request = await self._read_request(reader, self.keepalive_timeout)
+                except HTTPError as e:
+                    await responses.put(self._error(e.status, str(e), close=True))
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                await responses.put(asyncio.ensure_future(self._respond(request)))
+                if not request.keep_alive:
+                    break
+        finally:
+            if not writing.done():
+                await responses.put(None)
+            try:
+                await writing
+            finally:
+                self.connections -= 1
+                writer.close()
+
+    async def _write_responses(self, responses, writer):
+        while True:
+            item = await responses.get()
+            if item is None:
+                return
+            status, headers, body, close = await item if isinstance(item, asyncio.Future) else item
+            head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}"]
+            head += [f"{name}: {value}" for name, value in headers.items()]
+            if close:
+                head.append("Connection: close")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                return
+            if close:
+                return
+
+    async def _read_request(self, reader, timeout):
+        """Next request on the connection, or None when the client closed it between requests."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(411, "chunked bodies are not supported, send Content-Length")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise HTTPError(413, f"body larger than {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method, path.split("?", 1)[0], version, headers, body)
+
+    def _error(self, status, message, close=False):
+        body = json.dumps({"status": "FAILED", "error": message}).encode()
+        return status, {"Content-Type": "application/json"}, body, close
+
+    async def _respond(self, request):
+        close = not request.keep_alive or self.draining
+        path = request.path
+        content_type = "application/json"
+        try:
+            if path == "/health":
+                status, body = 200, b'{"status": "ok"}'
+            elif path == "/ready":
+                ready = self.ready and not self.draining
+                status = 200 if ready else 503
+                body = json.dumps({"ready": ready, "draining": self.draining}).encode()
+            elif path == "/metrics":
+                status, body = 200, render_prometheus(self._gauges()).encode()
+                content_type = "text/plain; version=0.0.4"
+            elif path in JOB_PATHS:
+                if request.method != "POST":
+                    raise HTTPError(405, "use POST")
+                status, body = 200, await self._run_job(request.body)
+            else:
+                raise HTTPError(404, "not found")
+            response = status, {"Content-Type": content_type}, body, close
+        except HTTPError as e:
+            status = e.status
+            response = self._error(status, str(e), close)
+        except Exception:
+            # Anything else still gets an answer, so the connection's later responses are not lost
+            logger.exception("Request to %s failed", path)
+            status = 500
+            response = self._error(status, "internal error", close)
+        if not close and request.version == "HTTP/1.0":
+            # HTTP/1.0 clients close after each response unless it says the connection stays open
+            response[1]["Connection"] = "keep-alive"
+        self.requests.inc(path=path if path in JOB_PATHS + ("/health", "/ready", "/metrics") else "other",
+                          status=status)
+        return response
+
+    async def _run_job(self, body):
+        if not self.ready or self.draining:
+            raise HTTPError(503, "not ready")
+        try:
+            job = json.loads(body)
+            job["input"]["messages"]
+        except (ValueError, TypeError, KeyError):
+            raise HTTPError(400, 'expected {"input": {"messages": [...]}}')
+        if self.inflight >= self.max_inflight:
+            self.rejected.inc()
+            raise HTTPError(503, "too many jobs in flight, retry later")
+
+        self.inflight += 1
+        start = time.monotonic()
+        try:
+            if self.pool is not None and self.overload is not None:
+                with self.overload.admit() as level:
+                    output = retry_response() if level >= SHED else await self.pool.get_response_async(job)
+            elif self.pool is not None:
+                output = await self.pool.get_response_async(job)
+            else:
+                output = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.controller.get_response, job)
+        except Exception:
+            # The details stay in the log; clients only learn that the job failed
+            logger.exception("Job failed")
+            raise HTTPError(500, "job failed")
+        finally:
+            self.inflight -= 1
+            self.job_seconds.observe(time.monotonic() - start)
+        return json.dumps({"id": str(uuid.uuid4()), "status": "COMPLETED", "output": output}).encode()
+
+    def _gauges(self):
+        gauges = {
+            "http_ready": (int(self.ready and not self.draining), "1 when serving jobs"),
+            "http_jobs_inflight": (self.inflight, "Jobs being answered"),
+            "http_connections_open": (self.connections, "Open client connections"),
+        }
+        if self.pool is not None:
+            stats = self.pool.stats()
+            gauges["worker_pool_workers"] = (stats["workers"], "Worker processes")
+            gauges["worker_pool_busy_jobs"] = (stats["busy_jobs"], "Jobs running in workers")
+            gauges["worker_pool_queued_jobs"] = (stats["queued_jobs"], "Jobs waiting for a worker")
+            gauges["worker_pool_restarts"] = (stats["restarts"], "Workers replaced since start")
+        return gauges
+
+
+def serve():
+    asyncio.run(AgentHTTPServer.from_env().serve())
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,10 +1,29 @@
+import os
 from agent_controller import AgentController
 import runpod
 
 def main():
-    agent_controller = AgentController()
-    runpod.serverless.start({"handler": agent_controller.get_response})
+    # SERVING_MODE=http serves the same jobs from the built-in HTTP server (see http_server.py)
+    if os.environ.get("SERVING_MODE", "runpod") == "http":
+        from http_server import serve
+        serve()
+        return
+
+    # WORKERS > 1 serves jobs from forked worker processes sharing the preloaded agents
+    workers = int(os.environ.get("WORKERS", "1"))
+    if workers <= 1:
+        agent_controller = AgentController()
+        runpod.serverless.start({"handler": agent_controller.get_response})
+        return
+
+    from worker_pool import WorkerPool
+    pool = WorkerPool(AgentController, workers, threads_per_worker=int(os.environ.get("WORKER_THREADS", "8")))
+
+    async def handler(job):
+        return await pool.get_response_async(job)
+
+    runpod.serverless.start({"handler": handler, "concurrency_modifier": lambda current: pool.capacity})
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
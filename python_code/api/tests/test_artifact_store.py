@@ -0,0 +1,63 @@
+import pytest
+from agents.artifact_store import CompactArtifacts, ARTIFACT_FILE, convert
+from agents.recommendation_agent import RecommendationArtifacts, RecommendationAgent
+from agent_controller import rec_file1, rec_file2
+
+OBJECTS = rec_file1.parent
+
+
+@pytest.fixture(scope="module")
+def json_artifacts():
+    return RecommendationArtifacts(rec_file1, rec_file2)
+
+
+@pytest.fixture(scope="module")
+def compact_artifacts():
+    return CompactArtifacts(OBJECTS / ARTIFACT_FILE)
+
+
+def rule_tuples(rules):
+    return sorted((rule["product"], rule["product_category"], rule["confidence"]) for rule in rules)
+
+
+def test_committed_binary_matches_the_json_rules(json_artifacts, compact_artifacts):
+    json_rules = json_artifacts.apriori_recommendations
+    compact_rules = compact_artifacts.apriori_recommendations
+    assert set(compact_rules) == {product for product, rules in json_rules.items() if rules}
+    assert len(compact_rules) == len(set(compact_rules))
+    for product, rules in json_rules.items():
+        if not rules:
+            assert product not in compact_rules
+            continue
+        compact = compact_rules[product]
+        assert rule_tuples(compact) == rule_tuples(rules)
+        confidences = [rule["confidence"] for rule in compact]
+        assert confidences == sorted(confidences, reverse=True)
+    assert "Not a product" not in compact_rules
+
+
+def test_committed_binary_matches_the_popularity_table(json_artifacts, compact_artifacts):
+    def rows(artifacts):
+        frame = artifacts.popular_recommendations
+        return sorted(zip(frame["product"], frame["product_category"], frame["number_of_transactions"].tolist()))
+    assert rows(compact_artifacts) == rows(json_artifacts)
+    assert sorted(compact_artifacts.products) == sorted(json_artifacts.products)
+
+
+def test_converter_reproduces_the_committed_binary(tmp_path):
+    convert(rec_file1, rec_file2, tmp_path / ARTIFACT_FILE)
+    assert (tmp_path / ARTIFACT_FILE).read_bytes() == (OBJECTS / ARTIFACT_FILE).read_bytes()
+
+
+def test_agent_recommends_the_same_from_either_form(monkeypatch, json_artifacts, compact_artifacts):
+    monkeypatch.setenv("RUNPOD_TOKEN", "test")
+    monkeypatch.setenv("TRENDING", "false")
+    monkeypatch.delenv("RECOMMENDATION_ARTIFACTS", raising=False)
+    agent = RecommendationAgent(rec_file1, rec_file2)
+
+    def recommend(artifacts):
+        agent.artifacts = artifacts
+        return ([agent.get_apriori_recommendation([product]) for product in json_artifacts.products],
+                [agent.get_popular_recommendation(category) for category in [None, *set(json_artifacts.product_categories)]])
+
+    assert recommend(compact_artifacts) == recommend(json_artifacts)
@@ -0,0 +1,35 @@
+import pytest
+from agents.catalog import Catalog, DEFAULT_PRODUCTS_PATH
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return Catalog.load(DEFAULT_PRODUCTS_PATH)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Latte", "Latte"),
+    ("capucino", "Cappuccino"),
+    ("croisant", "Croissant"),
+    ("croissants", "Croissant"),
+    ("almond croisant", "Almond Croissant"),
+    ("oatmeal scones", "Oatmeal Scone"),
+    ("jumbo scone", "Jumbo Savory Scone"),
+    ("vanila syrup", "Sugar Free Vanilla syrup"),
+    ("hot choclate", "Dark chocolate"),
+    ("expresso", "Espresso shot"),
+])
+def test_misspelled_names_resolve(catalog, query, expected):
+    product, _ = catalog.resolve(query)
+    assert product is not None and product.name == expected
+
+
+@pytest.mark.parametrize("query", [
+    # Several products fit, none named in full
+    "scone", "biscotti", "chocolate",
+    # Off the menu: must not become a different product that shares a word
+    "Chai latte", "iced latte", "matcha latte", "flat white", "mocha",
+])
+def test_ambiguous_or_unknown_names_do_not_resolve(catalog, query):
+    product, _ = catalog.resolve(query)
+    assert product is None
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from agents.context_cube import RecommendationContext, ContextCubes, CUBES_FILE
+
+
+def test_missing_hour_uses_the_any_hour_bucket():
+    context = RecommendationContext.from_input({"context": {"outlet_id": "3", "in_store": 1}})
+    assert (context.outlet_id, context.hour, context.in_store) == (3, None, True)
+
+
+def test_hour_wraps_to_the_day():
+    assert RecommendationContext.from_input({"context": {"hour": 25}}).hour == 1
+
+
+def test_malformed_context_keeps_the_customer():
+    context = RecommendationContext.from_input({"context": {"hour": "noon"}, "customer_id": "7"})
+    assert (context.outlet_id, context.hour, context.customer_id) == (None, None, 7)
+
+
+DENSE_CELLS = [(0, 0, 0), (0, 0, 2), (0, 2, 2), (2, 0, 2), (2, 2, 2)]
+
+
+@pytest.fixture(scope="module")
+def cubes(tmp_path_factory):
+    # Outlets 3 and 5 (+ any), hour buckets [0, 12) and [12, 24) (+ any), in-store/take-away/any
+    shape = (3, 3, 3)
+    names, categories = ["Latte", "Scone", "Croissant"], ["Coffee", "Bakery", "Bakery"]
+    cell_lines = np.zeros(shape, dtype=np.uint32)
+    cell_baskets = np.zeros(shape, dtype=np.uint32)
+    for cell in DENSE_CELLS:
+        cell_lines[cell], cell_baskets[cell] = 100, 20
+    # Just under the line and basket thresholds: never served
+    cell_lines[1, 0, 0], cell_baskets[1, 0, 0] = 9, 20
+    cell_lines[1, 0, 2], cell_baskets[1, 0, 2] = 100, 4
+    popular_order = np.full(shape + (3,), -1, dtype=np.int16)
+    popular_order[...] = [0, 1, 2]
+    popular_order[0, 0, 0] = [1, 0, -1]
+    rule_items = np.full(shape + (3, 2), -1, dtype=np.int16)
+    rule_confidence = np.zeros(shape + (3, 2), dtype=np.float32)
+    rule_items[0, 0, 0, 0] = [1, -1]
+    rule_confidence[0, 0, 0, 0] = [0.5, 0.0]
+    path = tmp_path_factory.mktemp("cubes") / CUBES_FILE
+    np.savez(path, **{
+        "item_names": np.array(names), "item_categories": np.array(categories),
+        "outlet_ids": np.array([3, 5], dtype=np.int32), "hour_edges": np.array([0, 12, 24], dtype=np.int8),
+        "cell_lines": cell_lines, "cell_baskets": cell_baskets, "popular_order": popular_order,
+        "rule_items": rule_items, "rule_confidence": rule_confidence,
+    })
+    return ContextCubes(path, min_lines=10, min_baskets=5)
+
+
+@pytest.mark.parametrize("outlet_id, hour, in_store, expected", [
+    (3, 9, True, (0, 0, 0)),
+    # Take-away is sparse at outlet 3 in the morning: any channel there
+    (3, 9, False, (0, 0, 2)),
+    # Outlet 5 is sparse (too few lines, then too few baskets): any outlet, same hour bucket
+    (5, 9, True, (2, 0, 2)),
+    (99, 9, None, (2, 0, 2)),
+    # Even the any-outlet afternoon cell is sparse: the global tables
+    (5, 15, None, None),
+    # No hour: the any-hour bucket, not the server clock's
+    (3, None, None, (0, 2, 2)),
+    (5, None, True, (2, 2, 2)),
+    (None, None, None, None),
+])
+def test_lookup_relaxes_channel_then_outlet(cubes, outlet_id, hour, in_store, expected):
+    assert cubes.cell(RecommendationContext(outlet_id, hour, in_store)) == expected
+
+
+def test_job_without_hour_reads_the_any_hour_cell(cubes):
+    context = RecommendationContext.from_input({"context": {"outlet_id": 3}})
+    assert cubes.cell(context) == (0, 2, 2)
+
+
+def test_cell_tables(cubes):
+    context = RecommendationContext(3, 9, True)
+    assert cubes.popular(context) == [("Scone", "Bakery"), ("Latte", "Coffee")]
+    assert cubes.rules(context) == {"Latte": [{"product": "Scone", "product_category": "Bakery", "confidence": 0.5}]}
+    assert cubes.popular(RecommendationContext(5, 15, None)) is None
+    assert cubes.rules(RecommendationContext(5, 15, None)) is None
@@ -0,0 +1,32 @@
+import json
+from agents.cooccurrence_model import CooccurrenceModel, append_order, CURRENT_POINTER
+
+
+def test_lines_without_category_are_left_out():
+    model = CooccurrenceModel()
+    assert model.update([("Latte", "Coffee"), ("ROTI", ""), ("Croissant", "Bakery")])
+    assert not model.update([("Latte", "Coffee"), ("ROTI", "")])
+    assert ("ROTI", "") not in model.line_counts
+    assert all(rule["product_category"] for rules in model.apriori_recommendations(0, 0).values()
+               for rule in rules)
+
+
+def test_order_log_carries_categories(tmp_path):
+    log = tmp_path / "orders.jsonl"
+    append_order(log, ["Latte", "Scone"], ["Coffee", "Bakery"])
+    # Lines written before categories were logged fall back to the categories already known
+    with open(log, "a") as file:
+        file.write(json.dumps({"time": 0, "items": ["Latte", "Scone", "ROTI"]}) + "\n")
+    model = CooccurrenceModel()
+    assert model.update_from_order_log(log) == 2
+    assert model.line_counts[("Scone", "Bakery")] == 2
+    assert model.item_category == {"Latte": "Coffee", "Scone": "Bakery"}
+
+
+def test_publish_keeps_only_the_newest_snapshots(tmp_path):
+    model = CooccurrenceModel()
+    model.update([("Latte", "Coffee"), ("Croissant", "Bakery")])
+    published = [model.publish_snapshot(tmp_path, keep=2) for _ in range(4)]
+    remaining = sorted(path.name for path in tmp_path.iterdir() if path.is_dir())
+    assert remaining == sorted(path.name for path in published[-2:])
+    assert (tmp_path / CURRENT_POINTER).read_text() == published[-1].name
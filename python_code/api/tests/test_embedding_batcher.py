@@ -0,0 +1,93 @@
+import time
+import threading
+import pytest
+from types import SimpleNamespace
+from agents.embedding_batcher import EmbeddingBatcher
+
+
+class FakeEmbeddings():
+    """embeddings.create of a fake client: records each call's texts; [len, first char] vectors."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def create(self, input, model):
+        with self._lock:
+            self.calls.append(list(input))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.started.set()
+        self.release.wait(5)
+        with self._lock:
+            self.in_flight -= 1
+        if self.fail:
+            raise ConnectionError("embedding endpoint down")
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[len(text), ord(text[0])]) for text in input])
+
+
+def batcher_with(embeddings, **options):
+    client = SimpleNamespace(embeddings=embeddings, base_url="http://fake")
+    return EmbeddingBatcher(client, "model", **options)
+
+
+def test_full_batch_is_sent_without_waiting():
+    embeddings = FakeEmbeddings()
+    batcher = batcher_with(embeddings, max_batch_size=4, max_wait=5.0)
+    start = time.monotonic()
+    futures = [batcher.submit(f"question {i}") for i in range(8)]
+    assert [future.result(2) for future in futures] == [[10, ord("q")]] * 8
+    assert time.monotonic() - start < 1.0
+    assert [len(texts) for texts in embeddings.calls] == [4, 4]
+
+
+def test_partial_batch_is_sent_after_max_wait():
+    embeddings = FakeEmbeddings()
+    batcher = batcher_with(embeddings, max_batch_size=32, max_wait=0.05)
+    start = time.monotonic()
+    futures = [batcher.submit(text) for text in ("a", "bb", "ccc")]
+    [future.result(2) for future in futures]
+    assert time.monotonic() - start >= 0.04
+    assert embeddings.calls == [["a", "bb", "ccc"]]
+
+
+def test_identical_texts_are_embedded_once_and_each_caller_gets_its_own_vector():
+    embeddings = FakeEmbeddings()
+    batcher = batcher_with(embeddings, max_batch_size=32, max_wait=0.05)
+    texts = ["hours?", "menu", "hours?", "wifi", "menu"]
+    futures = [batcher.submit(text) for text in texts]
+    assert [future.result(2) for future in futures] == [[len(text), ord(text[0])] for text in texts]
+    assert embeddings.calls == [["hours?", "menu", "wifi"]]
+
+
+def test_requests_queue_while_every_batch_slot_is_busy():
+    embeddings = FakeEmbeddings()
+    embeddings.release.clear()
+    batcher = batcher_with(embeddings, max_batch_size=32, max_wait=0.001, max_concurrent_batches=1)
+    first = batcher.submit("first")
+    assert embeddings.started.wait(2)
+    waiting = [batcher.submit(f"later {i}") for i in range(5)]
+    abandoned = batcher.submit("gave up")
+    time.sleep(0.05)
+    # Nothing else went out while the only slot was taken; a cancelled request is dropped
+    assert len(embeddings.calls) == 1
+    assert abandoned.cancel()
+    embeddings.release.set()
+    assert first.result(2) == [5, ord("f")]
+    assert [future.result(2) for future in waiting] == [[7, ord("l")]] * 5
+    assert embeddings.calls == [["first"], [f"later {i}" for i in range(5)]]
+    assert embeddings.max_in_flight == 1
+
+
+def test_failed_call_fails_every_request_of_the_batch():
+    batcher = batcher_with(FakeEmbeddings(fail=True), max_batch_size=2, max_wait=1.0)
+    futures = [batcher.submit(text) for text in ("a", "a")]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(2)
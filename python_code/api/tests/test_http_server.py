@@ -0,0 +1,98 @@
+import json
+import time
+import asyncio
+import concurrent.futures
+import pytest
+from http_server import AgentHTTPServer
+
+
+class FakeController():
+    """Answers with the last message; "slow ..." takes a while, "fail" raises."""
+
+    def get_response(self, job):
+        content = job["input"]["messages"][-1]["content"]
+        if content == "fail":
+            raise RuntimeError("secret internal detail")
+        if content.startswith("slow"):
+            time.sleep(0.2)
+        return {"role": "assistant", "content": content}
+
+
+def job_request(content, version="HTTP/1.1", connection=None):
+    body = json.dumps({"input": {"messages": [{"role": "user", "content": content}]}}).encode()
+    head = [f"POST /run {version}", "Host: test", f"Content-Length: {len(body)}"]
+    if connection:
+        head.append(f"Connection: {connection}")
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+
+async def read_response(reader):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = {}
+    for line in head[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return int(head[0].split()[1]), headers, json.loads(body)
+
+
+def run_with_server(scenario):
+    async def main():
+        server = AgentHTTPServer(port=0, keepalive_timeout=2.0)
+        server.controller = FakeController()
+        server._executor = concurrent.futures.ThreadPoolExecutor(4)
+        server.ready = True
+        listener = await asyncio.start_server(server._handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            result = await scenario(reader, writer)
+            writer.close()
+            return result
+        finally:
+            listener.close()
+            server._executor.shutdown(wait=False)
+    return asyncio.run(main())
+
+
+def content(response):
+    return response[2]["output"]["content"]
+
+
+@pytest.mark.parametrize("version, connection, kept_alive, echoed", [
+    ("HTTP/1.0", "keep-alive", True, "keep-alive"),
+    ("HTTP/1.0", None, False, "close"),
+    ("HTTP/1.1", None, True, None),
+    ("HTTP/1.1", "close", False, "close"),
+])
+def test_connection_header_matches_what_the_server_does(version, connection, kept_alive, echoed):
+    async def scenario(reader, writer):
+        writer.write(job_request("first", version, connection))
+        first = await read_response(reader)
+        writer.write(job_request("second", version, connection))
+        try:
+            second = await asyncio.wait_for(read_response(reader), 1.0)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            second = None
+        return first, second
+
+    first, second = run_with_server(scenario)
+    assert first[0] == 200 and content(first) == "first"
+    assert first[1].get("connection") == echoed
+    if kept_alive:
+        assert content(second) == "second"
+    else:
+        assert second is None
+
+
+def test_pipelined_responses_come_back_in_request_order():
+    async def scenario(reader, writer):
+        writer.write(b"".join(job_request(text) for text in ("slow one", "fast two", "fail", "fast three")))
+        return [await read_response(reader) for _ in range(4)]
+
+    responses = run_with_server(scenario)
+    assert [status for status, _, _ in responses] == [200, 200, 500, 200]
+    assert [content(responses[i]) for i in (0, 1, 3)] == ["slow one", "fast two", "fast three"]
+    # The failure is answered without the exception's text
+    assert "secret" not in json.dumps(responses[2][2])
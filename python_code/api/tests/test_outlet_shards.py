@@ -0,0 +1,85 @@
+import json
+import pytest
+from agents import outlet_shards
+from agents.catalog import CatalogStore, DEFAULT_PRODUCTS_PATH
+from agents.outlet_shards import OutletShards, OutletCatalogStore, outlet_scope, PRODUCTS_FILE
+from agent_controller import rec_file1, rec_file2
+
+
+def write_menu(directory, latte_price):
+    directory.mkdir()
+    record = {"name": "Latte", "category": "Coffee", "description": "Espresso and steamed milk",
+              "ingredients": ["Espresso", "Steamed Milk"], "price": latte_price, "rating": 4.5}
+    (directory / PRODUCTS_FILE).write_text(json.dumps(record) + "\n")
+    return (directory / PRODUCTS_FILE).stat().st_size
+
+
+@pytest.fixture
+def root(tmp_path):
+    # Outlets 1-3 have menus of one size; 4 has only recommendation artifacts; 5 has nothing
+    sizes = {outlet: write_menu(tmp_path / outlet, price) for outlet, price in (("1", 11.5), ("2", 12.5), ("3", 13.5))}
+    assert len(set(sizes.values())) == 1
+    (tmp_path / "4").mkdir()
+    for source in (rec_file1, rec_file2):
+        (tmp_path / "4" / source.name).write_bytes(source.read_bytes())
+    (tmp_path / "5").mkdir()
+    return tmp_path
+
+
+def menu_size(root):
+    return (root / "1" / PRODUCTS_FILE).stat().st_size
+
+
+def test_shard_size_is_its_files_on_disk(root):
+    shards = OutletShards(root)
+    assert shards.get("1").nbytes == menu_size(root)
+    assert shards.get("4").nbytes == rec_file1.stat().st_size + rec_file2.stat().st_size
+    assert shards.get("4").catalog is None and shards.get("4").artifacts is not None
+    assert shards.stats() == {"loaded": 2, "bytes": menu_size(root) + shards.get("4").nbytes, "available": 5}
+
+
+def test_least_recently_used_shard_is_evicted_first(root):
+    shards = OutletShards(root, max_bytes=2 * menu_size(root))
+    first = shards.get("1")
+    shards.get("2")
+    assert shards.get("1") is first
+    shards.get("3")
+    assert sorted(shards._shards) == ["1", "3"]
+    assert shards.stats()["bytes"] == 2 * menu_size(root)
+    # Outlet 2 loads again on its next job, pushing out the now least recent outlet 1
+    assert shards.get("2") is not None
+    assert sorted(shards._shards) == ["2", "3"]
+
+
+def test_shard_larger_than_the_cap_still_serves(root):
+    shards = OutletShards(root, max_bytes=1)
+    assert shards.get("1") is not None
+    assert shards.get("2") is not None
+    assert list(shards._shards) == ["2"]
+
+
+def test_outlets_without_a_directory_are_found_after_a_rescan(root):
+    shards = OutletShards(root, rescan_seconds=0)
+    assert shards.get("6") is None
+    write_menu(root / "6", 16.5)
+    assert shards.get("6").catalog.get("Latte").price == 16.5
+
+
+def test_preload_from_the_environment(root, monkeypatch):
+    monkeypatch.setattr(outlet_shards, "_shards", None)
+    monkeypatch.setenv("OUTLET_SHARDS_DIR", str(root))
+    monkeypatch.setenv("OUTLET_PRELOAD", "2, 3,,77")
+    shards = outlet_shards.get_outlet_shards()
+    assert sorted(shards._shards) == ["2", "3"]
+    assert outlet_shards.get_outlet_shards() is shards
+
+
+def test_catalog_store_falls_back_to_the_shared_menu(root):
+    default_store = CatalogStore(DEFAULT_PRODUCTS_PATH)
+    store = OutletCatalogStore(OutletShards(root), default_store)
+    with outlet_scope(1):
+        assert store.current().get("Latte").price == 11.5
+    for outlet_id in (4, 5, 77, None):
+        with outlet_scope(outlet_id):
+            assert store.current() is default_store.current()
+    assert store.products_path == default_store.products_path
@@ -0,0 +1,108 @@
+import time
+import pytest
+from types import SimpleNamespace
+from agents import overload, utils
+from agents.overload import (OverloadController, current_level, NORMAL, SHORT_GENERATION, SKIP_GUARD,
+                             TEMPLATED_REPLIES, SHED)
+from agents.utils import LLMUnavailableError
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(overload, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def controller_with(load, **options):
+    controller = OverloadController(max_inflight=100, **options)
+    controller.inflight_source = lambda: load[0]
+    return controller
+
+
+def admitted_level(controller):
+    with controller.admit() as level:
+        assert current_level() == level
+        return level
+
+
+def test_levels_escalate_with_jobs_in_flight(clock):
+    load = [0]
+    controller = controller_with(load, max_tokens=256)
+    assert admitted_level(controller) == NORMAL
+    for inflight, level in ((50, SHORT_GENERATION), (70, SKIP_GUARD), (85, TEMPLATED_REPLIES), (100, SHED)):
+        load[0] = inflight
+        assert admitted_level(controller) == level
+    with controller.admit():
+        assert controller.generation_budget(2048) == 256
+    assert current_level() == NORMAL
+    assert controller.generation_budget(2048) == 2048
+
+
+def test_level_steps_down_only_after_the_cooldown(clock):
+    load = [100]
+    controller = controller_with(load, cooldown_seconds=10.0)
+    assert admitted_level(controller) == SHED
+    # Below SHED's recovery point (0.8) but above TEMPLATED_REPLIES' (0.68)
+    load[0] = 75
+    assert admitted_level(controller) == SHED
+    clock.now += 9.9
+    assert admitted_level(controller) == SHED
+    clock.now += 0.1
+    assert admitted_level(controller) == TEMPLATED_REPLIES
+    # Back over the threshold restarts the cooldown
+    load[0] = 0
+    assert admitted_level(controller) == TEMPLATED_REPLIES
+    load[0] = 90
+    assert admitted_level(controller) == TEMPLATED_REPLIES
+    load[0] = 0
+    clock.now += 5
+    assert admitted_level(controller) == TEMPLATED_REPLIES
+    clock.now += 10
+    assert admitted_level(controller) == NORMAL
+
+
+def test_pressure_just_under_the_threshold_keeps_the_level(clock):
+    load = [70]
+    controller = controller_with(load, cooldown_seconds=1.0)
+    assert admitted_level(controller) == SKIP_GUARD
+    load[0] = 60
+    for _ in range(5):
+        clock.now += 1
+        assert admitted_level(controller) == SKIP_GUARD
+
+
+def test_slow_llm_raises_the_level_and_fades_once_calls_stop(clock):
+    controller = OverloadController(latency_seconds=5.0, latency_alpha=1.0, latency_fade_seconds=10.0,
+                                    cooldown_seconds=10.0)
+    controller.record_latency(5.0)
+    assert controller.level == SHED
+    # No calls while shedding: the latency signal decays by itself
+    clock.now += 30
+    assert admitted_level(controller) == SHED
+    clock.now += 10
+    assert admitted_level(controller) == NORMAL
+
+
+def test_failed_llm_calls_count_toward_latency_pressure(monkeypatch):
+    controller = OverloadController(latency_seconds=0.05, latency_alpha=1.0)
+
+    class Failing():
+        def chat_completion(self, client, **request):
+            time.sleep(0.06)
+            raise TimeoutError("no answer")
+
+    monkeypatch.setattr(utils, "get_overload_controller", lambda: controller)
+    monkeypatch.setattr(utils, "get_resilient_caller", lambda: Failing())
+    with pytest.raises(LLMUnavailableError):
+        utils.get_chatbot_response(None, "model", [{"role": "user", "content": "hi"}])
+    assert controller.latency() >= 0.05
+    assert controller.level == SHED
@@ -0,0 +1,227 @@
+import time
+import asyncio
+import pytest
+from types import SimpleNamespace
+from agents import resilience
+from agents.load_balancer import CircuitBreaker, Endpoint, LoadBalancer
+from agents.resilience import ResilientCaller, CircuitOpenError, DeadlineExceededError, request_deadline
+
+
+class FakeCompletions():
+    """chat.completions of a fake AsyncOpenAI client: sleeps `delay`, then fails or answers."""
+
+    def __init__(self, delay=0.0, fail=False, answer="ok"):
+        self.delay = delay
+        self.fail = fail
+        self.answer = answer
+        self.calls = 0
+
+    async def create(self, timeout=None, **request):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("endpoint down")
+        return self.answer
+
+
+def fake_endpoint(name, **behaviour):
+    endpoint = Endpoint(f"http://{name}", "key")
+    endpoint.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    endpoint.completions = FakeCompletions(answer=name, **behaviour)
+    endpoint._async_client = SimpleNamespace(chat=SimpleNamespace(completions=endpoint.completions))
+    return endpoint
+
+
+def open_breaker(breaker, expired=True):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    if expired:
+        breaker._opened_at -= breaker.reset_seconds
+
+
+@pytest.fixture
+def caller():
+    return ResilientCaller()
+
+
+def call(caller, balancer, deadline=5.0):
+    caller._get_balancer = lambda client: balancer
+    with request_deadline(deadline):
+        return caller.chat_completion(client=None, messages=[])
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    assert not breaker.is_available()
+
+
+def test_breaker_lets_one_probe_through_after_reset():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    open_breaker(breaker)
+    assert breaker.is_available()
+    assert breaker.allow_request()
+    assert breaker.state == "half-open"
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker._opened_at -= 1
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+
+def test_abandoned_probe_can_be_retried_at_once():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    breaker.abandon_probe()
+    assert breaker.state == "open"
+    assert breaker.is_available()
+    assert breaker.allow_request()
+
+
+def test_retries_move_to_another_endpoint(caller, monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: 0.0)
+    down, up = fake_endpoint("down", fail=True), fake_endpoint("up")
+    # Least-loaded picking tries endpoints without measurements first, in pool order
+    balancer = LoadBalancer([down, up])
+    assert call(caller, balancer) == "up"
+    assert down.completions.calls == 1 and up.completions.calls == 1
+    assert down.ewma_latency == 1.0
+
+
+def test_no_available_endpoint_raises_circuit_open(caller):
+    endpoint = fake_endpoint("only")
+    open_breaker(endpoint.breaker, expired=False)
+    with pytest.raises(CircuitOpenError):
+        call(caller, LoadBalancer([endpoint]))
+    assert endpoint.completions.calls == 0
+
+
+def test_probe_cancelled_by_deadline_does_not_wedge_breaker(caller):
+    endpoint = fake_endpoint("only", delay=1.0)
+    open_breaker(endpoint.breaker)
+    balancer = LoadBalancer([endpoint])
+    with pytest.raises(DeadlineExceededError):
+        call(caller, balancer, deadline=0.1)
+    # The cancellation reaches the event loop shortly after the caller gives up
+    for _ in range(50):
+        if endpoint.breaker.state != "half-open":
+            break
+        time.sleep(0.01)
+    # Timed out (a failure) or cancelled (abandoned) depending on which fires first; never half-open
+    assert endpoint.breaker.state == "open"
+
+    endpoint.completions.delay = 0.0
+    time.sleep(endpoint.breaker.reset_seconds)
+    assert call(caller, balancer) == "only"
+    assert endpoint.breaker.state == "closed"
+
+
+def test_cancelled_probe_reopens_breaker():
+    endpoint = fake_endpoint("only", delay=1.0)
+    open_breaker(endpoint.breaker)
+    balancer = LoadBalancer([endpoint])
+
+    async def cancel_probe():
+        assert endpoint.breaker.allow_request()
+        task = asyncio.ensure_future(ResilientCaller._timed_call(None, balancer, endpoint, {}, 5.0))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert endpoint.breaker.state == "open" and endpoint.breaker.allow_request()
+    assert endpoint.outstanding == 0
+
+
+def test_expired_deadline_does_not_start_a_probe():
+    endpoint = fake_endpoint("only")
+    open_breaker(endpoint.breaker)
+    coroutine = ResilientCaller._call_with_retries(None, LoadBalancer([endpoint]), {}, time.monotonic() - 1, None)
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(coroutine)
+    assert endpoint.breaker.state == "open"
+    assert endpoint.completions.calls == 0
+
+
+def test_slow_call_is_hedged_to_another_endpoint(caller, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.01)
+    slow, fast = fake_endpoint("slow", delay=2.0), fake_endpoint("fast")
+    for _ in range(20):
+        slow.latency.record(0.02)
+    slow.ewma_latency = 0.0
+    fast.ewma_latency = 1.0
+    start = time.monotonic()
+    assert call(caller, LoadBalancer([slow, fast])) == "fast"
+    assert time.monotonic() - start < 1.0
+    assert slow.completions.calls == 1 and fast.completions.calls == 1
+
+
+def test_hedge_goes_through_the_breaker(caller, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.01)
+    slow, recovering = fake_endpoint("slow", delay=0.3), fake_endpoint("recovering", delay=1.0)
+    for _ in range(20):
+        slow.latency.record(0.02)
+    # The hedge is the recovering endpoint's probe; while it is out, nothing else may use it
+    open_breaker(recovering.breaker)
+    assert call(caller, LoadBalancer([slow, recovering])) == "slow"
+    assert recovering.completions.calls == 1
+    for _ in range(50):
+        if recovering.breaker.state != "half-open":
+            break
+        time.sleep(0.01)
+    # The losing probe was cancelled, so the circuit is open again rather than stuck half-open
+    assert recovering.breaker.state == "open" and recovering.breaker.is_available()
+
+
+def test_hedge_skipped_when_breaker_refuses(caller, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.01)
+    slow, refusing = fake_endpoint("slow", delay=0.2), fake_endpoint("refusing")
+    for _ in range(20):
+        slow.latency.record(0.02)
+    open_breaker(refusing.breaker)
+    # Another caller holds the probe: the endpoint is picked but allow_request says no
+    assert refusing.breaker.allow_request()
+    refusing.breaker.state = "open"
+    refusing.breaker.allow_request = lambda: False
+    assert call(caller, LoadBalancer([slow, refusing])) == "slow"
+    assert refusing.completions.calls == 0
+
+
+def test_failed_guard_call_never_lets_the_message_through(monkeypatch):
+    monkeypatch.setenv("RUNPOD_TOKEN", "test")
+    monkeypatch.setenv("PINECONE_API_KEY", "test")
+    monkeypatch.setenv("OVERLOAD_CONTROL", "false")
+    import agent_controller
+    from agents import utils
+
+    class Unavailable():
+        def chat_completion(self, client, **request):
+            raise CircuitOpenError("no endpoint available")
+
+    monkeypatch.setattr(utils, "get_resilient_caller", lambda: Unavailable())
+    controller = agent_controller.AgentController()
+    routed = []
+    monkeypatch.setattr(controller, "_get_agent", routed.append)
+    response = controller.get_response({"input": {"messages": [{"role": "user", "content": "Who works there?"}]}})
+    assert response["memory"]["retry"]
+    assert routed == []
@@ -0,0 +1,62 @@
+import os
+import json
+import numpy as np
+from agents.semantic_cache import SemanticCache
+from agents.lexical_index import KnowledgeManifest
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_paraphrase_hits_only_with_the_same_context():
+    cache = SemanticCache(similarity_threshold=0.9)
+    cache.store(vector(1, 0, 0), "8am to 6pm", context_key="opening")
+    assert cache.lookup(vector(1, 0.1, 0), "opening") == "8am to 6pm"
+    assert cache.lookup(vector(1, 0.1, 0), "after an order") is None
+    assert cache.lookup(vector(0, 1, 0), "opening") is None
+
+
+def test_changed_document_drops_only_its_answers():
+    cache = SemanticCache(similarity_threshold=0.9)
+    cache.store(vector(1, 0, 0), "hours", document_ids=["Coffee shop Old Kasturi about section"])
+    cache.store(vector(0, 1, 0), "latte price", document_ids=["Latte", "Menu Items"])
+    cache.store(vector(0, 0, 1), "scone price", document_ids=["Oatmeal Scone"])
+    assert cache.invalidate_documents({"Latte"}) == 1
+    assert len(cache) == 2
+    assert cache.lookup(vector(0, 1, 0)) is None
+    assert cache.lookup(vector(1, 0, 0)) == "hours"
+    assert cache.lookup(vector(0, 0, 1)) == "scone price"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(similarity_threshold=0.9, max_entries=2)
+    cache.store(vector(1, 0, 0), "a")
+    cache.store(vector(0, 1, 0), "b")
+    assert cache.lookup(vector(1, 0, 0)) == "a"
+    cache.store(vector(0, 0, 1), "c")
+    assert cache.lookup(vector(0, 1, 0)) is None
+    assert cache.lookup(vector(1, 0, 0)) == "a"
+
+
+def write_manifest(path, documents, mtime):
+    path.write_text(json.dumps({"documents": documents}))
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_manifest_reports_changed_documents(tmp_path):
+    path = tmp_path / "knowledge_index.json"
+    write_manifest(path, {"Latte": "1", "Scone": "1", "Mocha": "1"}, 1)
+    manifest = KnowledgeManifest(path, check_interval=0)
+    assert manifest.changed_documents() == ()
+    write_manifest(path, {"Latte": "2", "Scone": "1", "Cortado": "1"}, 2)
+    assert manifest.changed_documents() == {"Latte", "Mocha", "Cortado"}
+    assert manifest.changed_documents() == ()
+
+
+def test_manifest_appearing_after_startup_invalidates_everything(tmp_path):
+    path = tmp_path / "knowledge_index.json"
+    manifest = KnowledgeManifest(path, check_interval=0)
+    assert manifest.changed_documents() == ()
+    write_manifest(path, {"Latte": "1"}, 1)
+    assert manifest.changed_documents() is None
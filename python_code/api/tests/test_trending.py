@@ -0,0 +1,28 @@
+import time
+from agents.trending import TrendingCounters
+
+
+def test_process_that_recorded_nothing_does_not_write(tmp_path):
+    path = tmp_path / "trending.npz"
+    TrendingCounters(snapshot_path=path).save()
+    assert not path.exists()
+
+
+def test_saves_from_several_processes_add_up(tmp_path):
+    path = tmp_path / "trending.npz"
+    now = time.time()
+    # Two workers forked from a parent that resumed the same (empty) snapshot
+    first, second = TrendingCounters(snapshot_path=path), TrendingCounters(snapshot_path=path)
+    first.record([("Latte", "Coffee", 2)], outlet_id=1, now=now)
+    second.record([("Latte", "Coffee", 1), ("Scone", "Bakery", 1)], outlet_id=1, now=now + 60)
+    second.save()
+    first.save()
+    # Nothing new since: saving again must not count the same lines twice
+    first.save()
+
+    resumed = TrendingCounters(snapshot_path=path)
+    ranked, total = resumed.top(1, now=now + 60)
+    counts = dict(ranked)
+    assert ranked[0][0] == "Latte"
+    assert abs(counts["Latte"] - 3) < 0.05 and abs(counts["Scone"] - 1) < 0.05
+    assert abs(total - 4) < 0.05
@@ -0,0 +1,56 @@
+"""Incrementally updates the co-occurrence model and publishes a snapshot for running workers.
+
+    # bootstrap from the historical receipts
+    python update_recommendations.py --state state.json --snapshot-dir snapshots \\
+        --receipts "../dataset/201904 sales reciepts.csv" --product-csv ../dataset/product.csv
+
+    # then, periodically: new receipt batches and/or orders logged by OrderTakingAgent
+    python update_recommendations.py --state state.json --snapshot-dir snapshots \\
+        --order-log orders.jsonl
+
+Workers started with RECOMMENDATION_SNAPSHOT_DIR=snapshots hot-swap to each new snapshot, and
+RECOMMENDATION_ORDER_LOG=orders.jsonl makes them append finalized orders to the log.
+"""
+import json
+import argparse
+import logging
+import os
+import pathlib
+from agents.cooccurrence_model import CooccurrenceModel
+
+# Same menu subset as the offline trainer (training/receipts.py)
+PRODUCTS_TO_TAKE_PATH = pathlib.Path(__file__).resolve().parent / "recommendation_objects" / "products_to_take.json"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--state", required=True, help="co-occurrence counts, created if missing")
+    parser.add_argument("--snapshot-dir", required=True)
+    parser.add_argument("--receipts", nargs="*", default=[], help="receipt CSV batches to add")
+    parser.add_argument("--product-csv", default="../dataset/product.csv")
+    parser.add_argument("--order-log", help="order log appended to by the workers")
+    parser.add_argument("--min-support", type=float, default=0.05)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--keep-snapshots", type=int, default=3, help="snapshot versions kept on disk")
+    parser.add_argument("--products-to-take", default=PRODUCTS_TO_TAKE_PATH,
+                        help="JSON list of the products receipts are filtered to")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    model = CooccurrenceModel.load(args.state) if os.path.exists(args.state) else CooccurrenceModel()
+    with open(args.products_to_take) as file:
+        products_to_take = json.load(file)
+
+    for receipts_path in args.receipts:
+        baskets = model.update_from_receipts(receipts_path, args.product_csv, products_to_take)
+        logging.info(f"Added {baskets} multi-item baskets from {receipts_path}")
+    if args.order_log:
+        orders = model.update_from_order_log(args.order_log)
+        logging.info(f"Added {orders} multi-item orders from {args.order_log}")
+
+    model.save(args.state)
+    model.publish_snapshot(args.snapshot_dir, args.min_support, args.min_lift, args.keep_snapshots)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import os
+import gc
+import time
+import signal
+import asyncio
+import logging
+import itertools
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
+from multiprocessing.connection import wait
+
+logger = logging.getLogger("worker_pool")
+
+# A worker that dies sooner than this after starting is restarted after a pause, not in a loop
+MIN_WORKER_LIFETIME = 1.0
+
+
+class JobFailedError(Exception):
+    pass
+
+
+class WorkerCrashedError(JobFailedError):
+    pass
+
+
+def _serve(conn, controller_factory, controller, initializer, threads):
+    """Worker process: runs jobs received on conn on a few threads and sends their results back."""
+    # Ctrl-C goes to the whole process group; the parent shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer()
+    if controller is None:
+        controller = controller_factory()
+    send_lock = threading.Lock()
+    executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="job")
+
+    def run(job_id, job):
+        try:
+            result = (job_id, controller.get_response(job), None)
+        except Exception as e:
+            logger.exception("Job %d failed", job_id)
+            result = (job_id, None, repr(e))
+        with send_lock:
+            conn.send(result)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        executor.submit(run, *message)
+    executor.shutdown(wait=True)
+    # Forked workers leave with os._exit, which skips atexit hooks
+    if hasattr(controller, "close"):
+        controller.close()
+
+
+class _Worker():
+    __slots__ = ("process", "conn", "jobs", "started")
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = {}  # job id -> dispatch time
+        self.started = time.monotonic()
+
+
+class WorkerPool():
+    """Serves AgentController jobs from N worker processes.
+
+    With preload, the parent builds the controller (every agent, the catalog, recommendation
+    artifacts, lexical index) once, freezes it out of the garbage collector's reach and forks
+    the workers, which share those pages copy-on-write. Without it, workers are spawned fresh
+    and each builds its own, like N independent processes.
+
+    Each worker runs up to threads_per_worker jobs at once, since most of a job is waiting on
+    the LLM. Jobs go to the worker with the fewest in flight and queue in the parent when all
+    are full. A worker that exits or gets stuck past job_timeout is replaced, and the jobs it
+    held fail with WorkerCrashedError; they are not retried, since a job may already have had
+    side effects (e.g. a recorded order).
+    """
+
+    def __init__(self, controller_factory, workers=None, threads_per_worker=4, preload=True,
+                 initializer=None, job_timeout=None):
+        self.controller_factory = controller_factory
+        self.workers = workers or os.cpu_count()
+        self.threads_per_worker = threads_per_worker
+        self.initializer = initializer
+        if job_timeout is None:
+            job_timeout = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "60")) + 30
+        self.job_timeout = job_timeout
+
+        self._controller = None
+        if preload:
+            self._context = multiprocessing.get_context("fork")
+            if initializer is not None:
+                initializer()
+            self._controller = controller_factory()
+            if hasattr(self._controller, "preload"):
+                self._controller.preload()
+            # Collections would otherwise write to (and so copy) every shared object's page
+            gc.collect()
+            gc.freeze()
+        else:
+            self._context = multiprocessing.get_context("spawn")
+
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._pending = collections.deque()
+        self._job_ids = itertools.count()
+        self._closed = False
+        self.restarts = 0
+        self._workers = [self._start_worker() for _ in range(self.workers)]
+        self._thread = threading.Thread(target=self._collect_loop, name="worker-pool", daemon=True)
+        self._thread.start()
+
+    @property
+    def capacity(self):
+        """Jobs that can run at once."""
+        return self.workers * self.threads_per_worker
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve, name="agent-worker", daemon=True,
+            args=(child_conn, self.controller_factory, self._controller, self.initializer, self.threads_per_worker))
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def submit(self, job):
+        """Queues a job ({"input": {...}}); the returned future resolves to the response."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("worker pool is closed")
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._pending.append((job_id, job))
+            self._dispatch()
+        return future
+
+    def get_response(self, job):
+        return self.submit(job).result()
+
+    async def get_response_async(self, job):
+        return await asyncio.wrap_future(self.submit(job))
+
+    def _dispatch(self):
+        # Called with the lock held
+        while self._pending and self._workers:
+            worker = min(self._workers, key=lambda w: len(w.jobs))
+            if len(worker.jobs) >= self.threads_per_worker:
+                return
+            job_id, job = self._pending.popleft()
+            worker.jobs[job_id] = time.monotonic()
+            try:
+                worker.conn.send((job_id, job))
+            except OSError:
+                # The worker is gone; the job waits for its replacement
+                del worker.jobs[job_id]
+                self._pending.appendleft((job_id, job))
+                return
+
+    def _collect_loop(self):
+        while True:
+            with self._lock:
+                workers = list(self._workers)
+            # After close, keep collecting until the workers have finished their jobs and exited
+            if self._closed and not workers:
+                return
+            handles = {}
+            for worker in workers:
+                handles[worker.conn] = worker
+                handles[worker.process.sentinel] = worker
+            for handle in wait(list(handles), timeout=1.0):
+                worker = handles[handle]
+                if worker not in self._workers:
+                    continue
+                if handle is worker.conn:
+                    try:
+                        self._complete(worker, *worker.conn.recv())
+                    except (EOFError, OSError):
+                        self._replace(worker)
+                else:
+                    self._replace(worker)
+            self._kill_stuck_workers()
+
+    def _complete(self, worker, job_id, response, error):
+        with self._lock:
+            worker.jobs.pop(job_id, None)
+            future = self._futures.pop(job_id, None)
+            self._dispatch()
+        if future is None:
+            return
+        if error is None:
+            future.set_result(response)
+        else:
+            future.set_exception(JobFailedError(error))
+
+    def _replace(self, worker):
+        # Results the worker sent before exiting are still in the pipe
+        try:
+            while worker.conn.poll():
+                self._complete(worker, *worker.conn.recv())
+        except (EOFError, OSError):
+            pass
+        worker.process.join(timeout=1.0)
+        if self._closed:
+            with self._lock:
+                self._workers.remove(worker)
+            return
+        if time.monotonic() - worker.started < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+
+        with self._lock:
+            lost = [self._futures.pop(job_id) for job_id in worker.jobs if job_id in self._futures]
+            logger.warning("Worker %d exited with code %s, %d jobs lost; restarting",
+                           worker.process.pid, worker.process.exitcode, len(lost))
+            worker.conn.close()
+            self._workers[self._workers.index(worker)] = self._start_worker()
+            self.restarts += 1
+            self._dispatch()
+        for future in lost:
+            future.set_exception(WorkerCrashedError(f"worker {worker.process.pid} exited with code {worker.process.exitcode}"))
+
+    def _kill_stuck_workers(self):
+        now = time.monotonic()
+        with self._lock:
+            stuck = [w for w in self._workers if w.jobs and now - min(w.jobs.values()) > self.job_timeout]
+        for worker in stuck:
+            logger.error("Worker %d has had a job for over %.0fs, killing it", worker.process.pid, self.job_timeout)
+            worker.process.kill()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._workers),
+                "busy_jobs": sum(len(w.jobs) for w in self._workers),
+                "queued_jobs": len(self._pending),
+                "restarts": self.restarts,
+                "pids": [w.process.pid for w in self._workers],
+            }
+
+    def close(self, timeout=10.0):
+        """Lets in-flight jobs finish (up to timeout), then stops the workers."""
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._thread.join(timeout=2.0)
+        with self._lock:
+            unfinished = list(self._futures.values())
+            self._futures.clear()
+        for future in unfinished:
+            future.set_exception(WorkerCrashedError("worker pool closed"))
@@ -0,0 +1,66 @@
+"""Resized, recompressed variants of product images for the app.
+
+Each variant fits the source inside a max edge (never upscaling), applies the EXIF rotation and
+is re-encoded, WEBP by default, keeping transparency. JPEG sources are decoded straight at a
+reduced scale (Pillow's draft mode), so a 3000 px photo is not fully decoded to make a 1200 px
+variant, and smaller variants are resized from the larger ones.
+"""
+import io
+import json
+import hashlib
+from PIL import Image, ImageOps
+
+# name -> (max edge in px, encoder quality); list cards are ~200 dp and cart rows 64 dp wide at 3x
+VARIANTS = {
+    "detail": (1200, 80),
+    "list": (600, 75),
+    "thumbnail": (192, 70),
+}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# Bump when the encoding changes, so every image is rendered again
+ENCODING_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(source_digest, variants=VARIANTS, image_format="webp"):
+    """Identifies the rendered variants: it changes with the source bytes or with the settings."""
+    settings = json.dumps([ENCODING_VERSION, image_format, sorted(variants.items())])
+    return hashlib.sha256(f"{source_digest}:{settings}".encode()).hexdigest()
+
+
+def _encode(image, image_format, quality):
+    encoder, _ = FORMATS[image_format]
+    if encoder == "JPEG" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    if encoder == "JPEG":
+        image.save(buffer, encoder, quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, encoder, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(path, variants=VARIANTS, image_format="webp"):
+    """{variant: (encoded bytes, width, height)} for the image at path."""
+    largest = max(max_edge for max_edge, _ in variants.values())
+    with Image.open(path) as source:
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    rendered = {}
+    for name, (max_edge, quality) in sorted(variants.items(), key=lambda entry: -entry[1][0]):
+        image = image.copy()
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        rendered[name] = (_encode(image, image_format, quality), image.width, image.height)
+    return rendered
@@ -0,0 +1,212 @@
+"""Publishes product images as resized variants and writes their URLs into the product records.
+
+Replaces firebase_uploader.ipynb, which uploaded every full-size image one at a time on every
+run. Variants (see images.py) are rendered in a process pool and uploaded concurrently; images
+whose bytes and settings match the manifest of the previous run are neither rendered nor
+uploaded again, so a run costs about as much as the number of changed images:
+
+    python -m publishing.publish_images --storage firebase://coffee-shop-app-42b00.firebasestorage.app \\
+        --database-url https://coffee-shop-app-42b00-default-rtdb.firebaseio.com/
+
+    python -m publishing.publish_images --storage build/product_images --output build/products.jsonl
+
+Each record gets image_url (the detail variant), image_list_url and image_thumbnail_url.
+--database-url also replaces the database's /products with the records, as the notebook did.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import pathlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from PIL import UnidentifiedImageError
+from .images import VARIANTS, FORMATS, file_digest, fingerprint, render_variants
+from .storage import open_storage
+
+logger = logging.getLogger("publish_images")
+
+MANIFEST_VERSION = 1
+# Record field holding each variant's URL. image_url, which the app's detail screen already reads,
+# now points at the 1200 px detail variant rather than the full-size original
+VARIANT_FIELDS = {"detail": "image_url", "list": "image_list_url", "thumbnail": "image_thumbnail_url"}
+
+
+def read_records(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_json_atomic(path, write):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as file:
+        write(file)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path, storage_id):
+    """{image_path: entry} from the last run to the same storage; empty when there was none."""
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable image manifest %s: %s", path, e)
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("storage") != storage_id:
+        logger.info("Image manifest %s is for another storage or version; publishing every image", path)
+        return {}
+    return manifest["images"]
+
+
+def object_key(image_path, image_fingerprint, variant, image_format):
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "_", pathlib.PurePath(image_path).stem)
+    return f"product_images/{stem}.{image_fingerprint[:16]}.{variant}.{image_format}"
+
+
+def plan(image_paths, image_dir, previous, variants, image_format):
+    """Splits images into (changed {image_path: (source path, fingerprint, digest, stat)},
+    unchanged {image_path: manifest entry}, missing [image_path])."""
+    changed, unchanged, missing = {}, {}, []
+    for image_path in image_paths:
+        path = image_dir / image_path
+        try:
+            stat = path.stat()
+        except OSError:
+            missing.append(image_path)
+            continue
+        entry = previous.get(image_path)
+        # Only files whose size or modification time moved are hashed again
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            digest = entry["digest"]
+        else:
+            digest = file_digest(path)
+        image_fingerprint = fingerprint(digest, variants, image_format)
+        if entry is not None and entry["fingerprint"] == image_fingerprint:
+            unchanged[image_path] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        else:
+            changed[image_path] = (path, image_fingerprint, digest, stat)
+    return changed, unchanged, missing
+
+
+def publish(changed, storage, variants=VARIANTS, image_format="webp", workers=None, upload_workers=8):
+    """Renders and uploads the changed images; returns ({image_path: manifest entry}, [failed image_path])."""
+    _, content_type = FORMATS[image_format]
+    published, failed = {}, set()
+    with ProcessPoolExecutor(workers) as renderers, ThreadPoolExecutor(upload_workers) as uploaders:
+        renders = {renderers.submit(render_variants, path, variants, image_format): image_path
+                   for image_path, (path, _, _, _) in changed.items()}
+        uploads = {}
+        # Uploads of an image start as soon as it is rendered, while the others still render
+        for future in as_completed(renders):
+            image_path = renders[future]
+            path, image_fingerprint, digest, stat = changed[image_path]
+            try:
+                rendered = future.result()
+            except (OSError, UnidentifiedImageError) as e:
+                logger.error("Could not render %s: %s", path, e)
+                failed.add(image_path)
+                continue
+            published[image_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest,
+                                     "fingerprint": image_fingerprint, "urls": {}, "bytes": {}}
+            for variant, (data, _, _) in rendered.items():
+                key = object_key(image_path, image_fingerprint, variant, image_format)
+                uploads[uploaders.submit(storage.put, key, data, content_type)] = (image_path, variant, len(data))
+
+        for future in as_completed(uploads):
+            image_path, variant, size = uploads[future]
+            try:
+                url = future.result()
+            except Exception as e:
+                # Backends raise their own client errors; the image is retried on the next run
+                logger.error("Could not upload the %s variant of %s: %s", variant, image_path, e)
+                failed.add(image_path)
+                continue
+            published[image_path]["urls"][variant] = url
+            published[image_path]["bytes"][variant] = size
+    for image_path in failed:
+        published.pop(image_path, None)
+    return published, sorted(failed)
+
+
+def apply_urls(records, entries):
+    for record in records:
+        entry = entries.get(record.get("image_path"))
+        if entry is None:
+            continue
+        for variant, url in entry["urls"].items():
+            record[VARIANT_FIELDS.get(variant, f"image_{variant}_url")] = url
+    return records
+
+
+def sync_database(records, database_url):
+    """Replaces /products in the Firebase Realtime Database with the records, keyed by name."""
+    # Imported here: only --database-url needs firebase-admin
+    from firebase_admin import db
+    from .storage import initialize_firebase
+    initialize_firebase(database_url=database_url)
+    products = {}
+    for record in records:
+        product = {key: value for key, value in record.items() if key != "image_path"}
+        products[re.sub(r"[.$#\[\]/]", "_", record["name"])] = product
+    db.reference("products", url=database_url).set(products)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", default="products/products.jsonl")
+    parser.add_argument("--images", default="products/images")
+    parser.add_argument("--storage", required=True, help="firebase://<bucket>, or a local directory")
+    parser.add_argument("--base-url", default=None, help="URL prefix of a local --storage directory")
+    parser.add_argument("--output", default=None, help="products file with the URLs (default: --products)")
+    parser.add_argument("--manifest", default="products/image_manifest.json")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="webp")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--database-url", default=None, help="also replace /products in this Firebase database")
+    parser.add_argument("--force", action="store_true", help="render and upload every image again")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    records = read_records(args.products)
+    storage_id = args.storage if args.base_url is None else f"{args.storage} {args.base_url}"
+    previous = {} if args.force else read_manifest(args.manifest, storage_id)
+    image_paths = sorted({record["image_path"] for record in records if record.get("image_path")})
+
+    start = time.perf_counter()
+    changed, unchanged, missing = plan(image_paths, pathlib.Path(args.images), previous, VARIANTS, args.format)
+    for image_path in missing:
+        logger.error("Image %s of the products file is not in %s", image_path, args.images)
+    logger.info("%d images: %d changed, %d unchanged", len(image_paths), len(changed), len(unchanged))
+
+    storage = open_storage(args.storage, args.base_url, args.database_url)
+    published, failed = publish(changed, storage, VARIANTS, args.format, args.workers, args.upload_workers)
+    entries = dict(previous, **unchanged, **published)
+    entries = {image_path: entry for image_path, entry in entries.items() if image_path in image_paths}
+    write_json_atomic(args.manifest, lambda file: json.dump(
+        {"version": MANIFEST_VERSION, "storage": storage_id, "images": entries}, file, indent=1, sort_keys=True))
+
+    apply_urls(records, entries)
+    output = args.output or args.products
+    write_json_atomic(output, lambda file: file.writelines(json.dumps(record, ensure_ascii=False) + "\n"
+                                                             for record in records))
+    if args.database_url:
+        sync_database(records, args.database_url)
+
+    if published:
+        source_bytes = sum(changed[image_path][3].st_size for image_path in published)
+        logger.info("Sources %.0f KB -> %s", source_bytes / 1024, ", ".join(
+            "%s %.0f KB" % (variant, sum(entry["bytes"][variant] for entry in published.values()) / 1024)
+            for variant in VARIANTS))
+    logger.info("Published %d images in %.2fs, wrote %s", len(published), time.perf_counter() - start, output)
+    if missing or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
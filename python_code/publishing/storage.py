@@ -0,0 +1,90 @@
+"""Storage backends for published images.
+
+Object keys carry the content fingerprint, so an object never changes once written and can be
+cached forever. open_storage picks the backend from a target:
+
+    path or file:///path        LocalStorage, a directory (for development and dry runs)
+    firebase://<bucket>         FirebaseStorage, a Firebase Storage bucket with public objects
+
+A backend is any object with put(key, data, content_type), which stores the bytes under key and
+returns their public URL.
+"""
+import os
+import pathlib
+import threading
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class LocalStorage():
+    def __init__(self, root, base_url=None):
+        self.root = pathlib.Path(root).resolve()
+        self.base_url = (base_url or self.root.as_uri()).rstrip("/")
+
+    def put(self, key, data, content_type):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return self.url(key)
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+
+_firebase_lock = threading.Lock()
+
+
+def initialize_firebase(storage_bucket=None, database_url=None):
+    """The default firebase_admin app, initialized once from the FIREBASE_* environment variables
+    that firebase_uploader.ipynb used."""
+    # Imported here: only the Firebase backends need firebase-admin
+    import firebase_admin
+    from firebase_admin import credentials
+    with _firebase_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+        service_account_info = {
+            "type": os.getenv("FIREBASE_TYPE"),
+            "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+            "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
+            "private_key": os.getenv("FIREBASE_PRIVATE_KEY"),
+            "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+            "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+            "auth_uri": os.getenv("FIREBASE_AUTH_URI"),
+            "token_uri": os.getenv("FIREBASE_TOKEN_URI"),
+            "auth_provider_x509_cert_url": os.getenv("FIREBASE_AUTH_PROVIDER_X509_CERT_URL"),
+            "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL"),
+            "universe_domain": os.getenv("FIREBASE_UNIVERSE_DOMAIN"),
+        }
+        options = {}
+        if storage_bucket:
+            options["storageBucket"] = storage_bucket
+        if database_url:
+            options["databaseURL"] = database_url
+        return firebase_admin.initialize_app(credentials.Certificate(service_account_info), options)
+
+
+class FirebaseStorage():
+    def __init__(self, bucket_name, database_url=None):
+        from firebase_admin import storage
+        initialize_firebase(bucket_name, database_url)
+        self.bucket = storage.bucket(bucket_name)
+
+    def put(self, key, data, content_type):
+        blob = self.bucket.blob(key)
+        blob.cache_control = IMMUTABLE_CACHE_CONTROL
+        blob.upload_from_string(data, content_type=content_type)
+        blob.make_public()
+        return blob.public_url
+
+
+def open_storage(target, base_url=None, database_url=None):
+    if target.startswith("firebase://"):
+        return FirebaseStorage(target[len("firebase://"):].strip("/"), database_url)
+    if target.startswith("file://"):
+        target = target[len("file://"):]
+    return LocalStorage(target, base_url)
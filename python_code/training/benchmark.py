@@ -0,0 +1,53 @@
+"""Measures how recommendation training scales with months of receipts.
+
+Months are synthesized by replaying the April 2019 receipts with shifted transaction ids:
+
+    python -m training.benchmark --months 1 3 6 12
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from .train_recommendations import train
+
+
+def write_synthetic_months(receipts_path, months, directory):
+    receipts = pd.read_csv(receipts_path)
+    id_offset = int(receipts["transaction_id"].max()) + 1
+    paths = []
+    for month in range(months):
+        path = pathlib.Path(directory) / f"receipts_month_{month:02d}.csv"
+        shifted = receipts.copy()
+        shifted["transaction_id"] += month * id_offset
+        shifted.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", default="dataset/201904 sales reciepts.csv")
+    parser.add_argument("--products", default="dataset/product.csv")
+    parser.add_argument("--months", type=int, nargs="+", default=[1, 3, 6, 12])
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_synthetic_months(args.receipts, max(args.months), directory)
+        print(f"{'months':>6} {'rows':>9} {'encode s':>9} {'mine s':>8} {'total s':>8} {'peak MiB':>9}")
+        for months in args.months:
+            rows = sum(1 for path in paths[:months] for _ in open(path)) - months
+            tracemalloc.start()
+            start = time.perf_counter()
+            _, _, _, timings = train(paths[:months], args.products, chunksize=args.chunksize)
+            total = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{months:>6} {rows:>9} {timings['encode']:>9.2f} {timings['mine']:>8.3f} "
+                  f"{total:>8.2f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Popularity and item-to-item association tables per outlet x hour bucket x channel.
+
+Every axis has a trailing "any" slot (all outlets, all hours, both channels), so serving can
+relax a sparse cell one axis at a time before falling back to the global tables. Written as an
+uncompressed .npz of small arrays:
+
+    item_names, item_categories      (n_items,) str
+    outlet_ids                       (n_outlets,) int32, cube index = position (last = any)
+    hour_edges                       (n_buckets + 1,) int8, bucket b covers [edges[b], edges[b+1])
+    cell_lines                       (O+1, B+1, 3) uint32 receipt lines of menu items
+    cell_baskets                     (O+1, B+1, 3) uint32 baskets with more than one line
+    popularity                       (O+1, B+1, 3, n_items) uint32 lines per item
+    popular_order                    (O+1, B+1, 3, n_items) int16 items by lines, -1 when unsold
+    rule_items                       (O+1, B+1, 3, n_items, K) int16 consequents, best first, -1 pad
+    rule_confidence                  (O+1, B+1, 3, n_items, K) float32
+
+Channel index 0 is in-store, 1 take-away, 2 any.
+"""
+import numpy as np
+from .receipts import stream_receipts, transaction_keys
+
+CUBES_FILE = "recommendation_cubes.npz"
+# Before 8, 8-10 (morning peak), 10-12, 12-15 (lunch), 15-18, after 18
+HOUR_EDGES = [0, 8, 10, 12, 15, 18, 24]
+CHANNELS = {"Y": 0, "N": 1}
+
+
+def build_context_cubes(receipt_paths, lookup, item_category=None, hour_edges=HOUR_EDGES, rules_per_item=5,
+                        min_pair_baskets=3, chunksize=100_000):
+    """Streams receipts into the cube arrays described in the module docstring.
+
+    item_category overrides lookup.item_category (build_baskets picks each item's most sold one).
+
+    A basket is the lines sharing a transaction key, outlet and date, so it always falls in one
+    cell. Rules are single-item: confidence(a -> b) = baskets with a and b / baskets with a,
+    kept when at least min_pair_baskets baskets contain both.
+    """
+    key_chunks, day_chunks, outlet_chunks, bucket_chunks, channel_chunks, item_chunks = [], [], [], [], [], []
+    for chunk in stream_receipts(receipt_paths, lookup, chunksize):
+        hours = chunk["transaction_time"].str.slice(0, 2).astype(np.int64).values
+        key_chunks.append(transaction_keys(chunk))
+        day_chunks.append(chunk["transaction_date"].str.replace("-", "").astype(np.int64).values)
+        outlet_chunks.append(chunk["sales_outlet_id"].values.astype(np.int64))
+        bucket_chunks.append(np.searchsorted(hour_edges, hours, side="right") - 1)
+        channel_chunks.append(chunk["instore_yn"].astype(str).str.strip().map(CHANNELS).fillna(2).values.astype(np.int64))
+        item_chunks.append(chunk["item"].values.astype(np.int64))
+
+    n_items = len(lookup.item_names)
+    n_buckets = len(hour_edges) - 1
+    if key_chunks:
+        keys, days, outlets, buckets, channels, items = (
+            np.concatenate(parts) for parts in (key_chunks, day_chunks, outlet_chunks, bucket_chunks, channel_chunks, item_chunks))
+    else:
+        keys = days = outlets = buckets = channels = items = np.zeros(0, dtype=np.int64)
+    outlet_ids, outlet_index = np.unique(outlets, return_inverse=True)
+    shape = (len(outlet_ids) + 1, n_buckets + 1, 3)
+
+    def roll_up(values, dims):
+        """Adds every cell into the "any" slots above it, one axis at a time. Lines with no
+        channel start out in the "any" channel, hence += rather than =."""
+        for axis, size in enumerate(dims):
+            target = [slice(None)] * values.ndim
+            target[axis] = size - 1
+            source = [slice(None)] * values.ndim
+            source[axis] = slice(0, size - 1)
+            values[tuple(target)] += values[tuple(source)].sum(axis=axis)
+        return values
+
+    cell_of_line = (outlet_index * shape[1] + buckets) * shape[2] + channels
+    n_cells = shape[0] * shape[1] * shape[2]
+    popularity = np.bincount(cell_of_line * n_items + items, minlength=n_cells * n_items).reshape(*shape, n_items)
+    popularity = roll_up(popularity, shape)
+    cell_lines = popularity.sum(axis=-1)
+
+    # Baskets as an (n_baskets, n_items) incidence matrix; a basket's cell is that of its lines
+    basket_ids, basket_of_line = np.unique(np.stack([keys, outlets, days], axis=1), axis=0, return_inverse=True)
+    basket_of_line = basket_of_line.reshape(-1)
+    incidence = np.zeros((len(basket_ids), n_items), dtype=np.int32)
+    incidence[basket_of_line, items] = 1
+    basket_cell = np.zeros(len(basket_ids), dtype=np.int64)
+    basket_cell[basket_of_line] = cell_of_line
+    multi = incidence.sum(axis=1) > 1
+    incidence, basket_cell = incidence[multi], basket_cell[multi]
+
+    co_occurrence = np.zeros((n_cells, n_items, n_items), dtype=np.int64)
+    for cell in np.unique(basket_cell):
+        rows = incidence[basket_cell == cell]
+        co_occurrence[cell] = rows.T @ rows
+    co_occurrence = roll_up(co_occurrence.reshape(*shape, n_items, n_items), shape)
+    cell_baskets = roll_up(np.bincount(basket_cell, minlength=n_cells).reshape(shape), shape)
+
+    # Top consequents per antecedent; the diagonal holds each item's basket count
+    baskets_with = np.diagonal(co_occurrence, axis1=-2, axis2=-1)[..., None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence = np.where(baskets_with > 0, co_occurrence / baskets_with, 0.0)
+    confidence[co_occurrence < min_pair_baskets] = 0.0
+    diagonal = np.arange(n_items)
+    confidence[..., diagonal, diagonal] = 0.0
+    k = min(rules_per_item, n_items)
+    rule_items = np.argsort(-confidence, axis=-1, kind="stable")[..., :k]
+    rule_confidence = np.take_along_axis(confidence, rule_items, axis=-1)
+    rule_items[rule_confidence <= 0] = -1
+
+    popular_order = np.argsort(-popularity, axis=-1, kind="stable")
+    popular_order[np.take_along_axis(popularity, popular_order, axis=-1) == 0] = -1
+
+    return {
+        "item_names": np.array(lookup.item_names),
+        "item_categories": np.array([(item_category or lookup.item_category)[name] for name in lookup.item_names]),
+        "outlet_ids": outlet_ids.astype(np.int32),
+        "hour_edges": np.array(hour_edges, dtype=np.int8),
+        "cell_lines": cell_lines.astype(np.uint32),
+        "cell_baskets": cell_baskets.astype(np.uint32),
+        "popularity": popularity.astype(np.uint32),
+        "popular_order": popular_order.astype(np.int16),
+        "rule_items": rule_items.astype(np.int16),
+        "rule_confidence": rule_confidence.astype(np.float32),
+    }
+
+
+def write_cubes(path, cubes):
+    with open(path, "wb") as file:
+        np.savez(file, **cubes)
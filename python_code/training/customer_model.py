@@ -0,0 +1,115 @@
+"""Per-customer top-N recommendations from an item-item model over the customer x item matrix.
+
+Each customer's row holds log(1 + lines bought) per menu item, stored as CSR (indptr, indices,
+data). Item similarity is the cosine between item columns; a customer's score for an item is
+their row times its similarity column, and the best items they have not bought yet are kept.
+Written as an uncompressed .npz:
+
+    item_names, item_categories   (n_items,) str
+    customer_ids                  (n_customers,) int64, ascending
+    top_items                     (n_customers, N) int16 item indexes, best first, -1 pad
+
+Serving memory is about (8 + 2 * N) bytes per customer; --max-customers keeps only the most
+active ones when that has to be bounded further.
+"""
+import numpy as np
+from .receipts import stream_receipts
+
+CUSTOMER_MODEL_FILE = "customer_recommendations.npz"
+ANONYMOUS_CUSTOMER = 0
+
+
+class CustomerItemMatrix():
+    """Customers x items in CSR form; row r is customer_ids[r]."""
+
+    def __init__(self, customer_ids, indptr, indices, data, n_items):
+        self.customer_ids = customer_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_items = n_items
+
+    def dense_rows(self, start, stop):
+        rows = np.zeros((stop - start, self.n_items), dtype=np.float32)
+        begin, end = self.indptr[start], self.indptr[stop]
+        row_of_entry = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        rows[row_of_entry, self.indices[begin:end]] = self.data[begin:end]
+        return rows
+
+
+def customer_item_matrix(receipt_paths, lookup, max_customers=None, chunksize=100_000):
+    """Streams receipts into a CustomerItemMatrix; anonymous lines (customer 0) are skipped."""
+    n_items = len(lookup.item_names)
+    key_chunks = []
+    for chunk in stream_receipts(receipt_paths, lookup, chunksize, columns=["customer_id", "product_id"]):
+        customers = chunk["customer_id"].values.astype(np.int64)
+        known = customers != ANONYMOUS_CUSTOMER
+        key_chunks.append(customers[known] * n_items + chunk["item"].values[known])
+    keys = np.concatenate(key_chunks) if key_chunks else np.zeros(0, dtype=np.int64)
+
+    # One entry per (customer, item) with its line count, sorted by customer then item
+    pairs, lines = np.unique(keys, return_counts=True)
+    customers, items = np.divmod(pairs, n_items)
+    customer_ids, row_of_pair = np.unique(customers, return_inverse=True)
+
+    if max_customers is not None and len(customer_ids) > max_customers:
+        activity = np.bincount(row_of_pair, weights=lines)
+        keep_rows = np.sort(np.argsort(-activity, kind="stable")[:max_customers])
+        keep = np.isin(row_of_pair, keep_rows)
+        customer_ids = customer_ids[keep_rows]
+        row_of_pair = np.searchsorted(keep_rows, row_of_pair[keep])
+        items, lines = items[keep], lines[keep]
+
+    indptr = np.zeros(len(customer_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_of_pair, minlength=len(customer_ids)), out=indptr[1:])
+    return CustomerItemMatrix(customer_ids, indptr, items.astype(np.int32),
+                              np.log1p(lines).astype(np.float32), n_items)
+
+
+def item_similarity(matrix, block_rows=65_536):
+    """(n_items, n_items) cosine similarity between item columns, zero diagonal."""
+    gram = np.zeros((matrix.n_items, matrix.n_items), dtype=np.float64)
+    for start in range(0, len(matrix.customer_ids), block_rows):
+        rows = matrix.dense_rows(start, min(start + block_rows, len(matrix.customer_ids)))
+        gram += rows.T.astype(np.float64) @ rows
+    norms = np.sqrt(np.diagonal(gram))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = np.where(np.outer(norms, norms) > 0, gram / np.outer(norms, norms), 0.0)
+    np.fill_diagonal(similarity, 0.0)
+    return similarity.astype(np.float32)
+
+
+def top_items_per_customer(matrix, similarity, top_n=10, block_rows=65_536):
+    """(n_customers, top_n) int16 best unbought items per customer, -1 where nothing scores."""
+    top_n = min(top_n, matrix.n_items)
+    top_items = np.full((len(matrix.customer_ids), top_n), -1, dtype=np.int16)
+    for start in range(0, len(matrix.customer_ids), block_rows):
+        stop = min(start + block_rows, len(matrix.customer_ids))
+        rows = matrix.dense_rows(start, stop)
+        scores = rows @ similarity
+        scores[rows > 0] = 0.0
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_n]
+        order[np.take_along_axis(scores, order, axis=1) <= 0] = -1
+        top_items[start:stop] = order
+    return top_items
+
+
+def build_customer_model(receipt_paths, lookup, item_category=None, top_n=10, max_customers=None,
+                         chunksize=100_000):
+    """Arrays of the model file described in the module docstring.
+
+    item_category overrides lookup.item_category (build_baskets picks each item's most sold one).
+    """
+    matrix = customer_item_matrix(receipt_paths, lookup, max_customers, chunksize)
+    similarity = item_similarity(matrix)
+    return {
+        "item_names": np.array(lookup.item_names),
+        "item_categories": np.array([(item_category or lookup.item_category)[name] for name in lookup.item_names]),
+        "customer_ids": matrix.customer_ids.astype(np.int64),
+        "top_items": top_items_per_customer(matrix, similarity, top_n),
+    }
+
+
+def write_customer_model(path, model):
+    with open(path, "wb") as file:
+        np.savez(file, **model)
@@ -0,0 +1,61 @@
+from itertools import combinations
+import numpy as np
+from .receipts import popcount
+
+
+def mine_frequent_itemsets(item_bitsets, n_transactions, min_support=0.05):
+    """Level-wise (apriori) mining with vertical bitsets.
+
+    Candidates of size k are joined from frequent (k-1)-itemsets sharing a prefix and pruned
+    by their subsets; the support of a whole level is one vectorized AND + popcount over the
+    parent bitsets. Returns {sorted item index tuple: support}.
+    """
+    if n_transactions == 0:
+        return {}
+    min_count = min_support * n_transactions
+
+    counts = popcount(item_bitsets)
+    level = {(item,): item_bitsets[item] for item in np.flatnonzero(counts >= min_count).tolist()}
+    frequent = {itemset: counts[itemset[0]] / n_transactions for itemset in level}
+
+    while len(level) > 1:
+        itemsets = sorted(level)
+        candidates = []
+        for i, left in enumerate(itemsets):
+            for right in itemsets[i + 1:]:
+                if left[:-1] != right[:-1]:
+                    break
+                candidate = left + right[-1:]
+                if all(subset in level for subset in combinations(candidate, len(candidate) - 1)):
+                    candidates.append(candidate)
+        if not candidates:
+            break
+
+        parents = np.stack([level[candidate[:-1]] for candidate in candidates])
+        last_items = item_bitsets[[candidate[-1] for candidate in candidates]]
+        candidate_bitsets = parents & last_items
+        candidate_counts = popcount(candidate_bitsets)
+
+        level = {}
+        for candidate, bitset, count in zip(candidates, candidate_bitsets, candidate_counts):
+            if count >= min_count:
+                level[candidate] = bitset
+                frequent[candidate] = count / n_transactions
+
+    return frequent
+
+
+def association_rules(frequent_itemsets, min_lift=1.0):
+    """Returns (antecedent, consequent, confidence, lift) for every split of every frequent itemset."""
+    rules = []
+    for itemset, support in frequent_itemsets.items():
+        if len(itemset) < 2:
+            continue
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                consequent = tuple(item for item in itemset if item not in antecedent)
+                confidence = support / frequent_itemsets[antecedent]
+                lift = confidence / frequent_itemsets[consequent]
+                if lift >= min_lift:
+                    rules.append((antecedent, consequent, confidence, lift))
+    return rules
@@ -0,0 +1,141 @@
+import json
+import pathlib
+import numpy as np
+import pandas as pd
+
+# Menu items the shop sells, as named in product.csv once the size suffix is stripped
+# The menu subset recommendations are trained on; update_recommendations.py reads the same file
+PRODUCTS_TO_TAKE_PATH = pathlib.Path(__file__).resolve().parent.parent / "api" / "recommendation_objects" / "products_to_take.json"
+PRODUCTS_TO_TAKE = json.loads(PRODUCTS_TO_TAKE_PATH.read_text())
+SIZE_SUFFIXES = [" Rg", " Lg", " Sm"]
+RECEIPT_COLUMNS = ["transaction_id", "transaction_date", "transaction_time", "sales_outlet_id",
+                   "customer_id", "instore_yn", "product_id"]
+
+
+class ProductLookup():
+    """Maps product_id to dense item and category indexes for the products we train on."""
+
+    def __init__(self, product_csv_path, products_to_take=PRODUCTS_TO_TAKE):
+        product = pd.read_csv(product_csv_path, usecols=["product_id", "product_category", "product"])
+        for suffix in SIZE_SUFFIXES:
+            product["product"] = product["product"].str.replace(suffix, "")
+        product = product[product["product"].isin(products_to_take)]
+
+        self.item_names = sorted(product["product"].unique())
+        self.category_names = sorted(product["product_category"].unique())
+        item_index = {name: i for i, name in enumerate(self.item_names)}
+        category_index = {name: i for i, name in enumerate(self.category_names)}
+
+        # Dense arrays indexed by product_id; -1 marks products that are not on the menu
+        size = int(pd.read_csv(product_csv_path, usecols=["product_id"])["product_id"].max()) + 1
+        self.item_of_product = np.full(size, -1, dtype=np.int32)
+        self.category_of_product = np.full(size, -1, dtype=np.int32)
+        self.item_of_product[product["product_id"].values] = product["product"].map(item_index).values
+        self.category_of_product[product["product_id"].values] = product["product_category"].map(category_index).values
+
+        # Fallback category per item; build_baskets prefers the category it sells most under
+        self.item_category = dict(zip(product["product"], product["product_category"]))
+
+
+class Baskets():
+    """Transactions encoded as one packed bitset per item (vertical layout).
+
+    Bit t of item_bitsets[i] is set when transaction t contains item i, so the support of an
+    itemset is the popcount of the AND of its items' rows.
+    """
+
+    def __init__(self, item_names, item_category, category_names, item_bitsets, n_transactions, popularity):
+        self.item_names = item_names
+        self.item_category = item_category
+        self.category_names = category_names
+        self.item_bitsets = item_bitsets
+        self.n_transactions = n_transactions
+        # (n_items, n_categories) line counts, matching the notebook's groupby count
+        self.popularity = popularity
+
+
+def stream_receipts(receipt_paths, lookup, chunksize=100_000, columns=RECEIPT_COLUMNS):
+    """Yields receipt chunks restricted to menu items, with item and category indexes added."""
+    for path in receipt_paths:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            product_ids = chunk["product_id"].values
+            in_range = product_ids < len(lookup.item_of_product)
+            chunk = chunk[in_range]
+            items = lookup.item_of_product[chunk["product_id"].values]
+            keep = items >= 0
+            chunk = chunk[keep].copy()
+            chunk["item"] = items[keep]
+            chunk["category"] = lookup.category_of_product[chunk["product_id"].values]
+            yield chunk
+
+
+def transaction_keys(chunk):
+    # The notebook keys transactions on "<transaction_id>_<customer_id>"; pack both into one int64
+    return (chunk["transaction_id"].values.astype(np.int64) << 32) | chunk["customer_id"].values.astype(np.int64)
+
+
+def popcount(bitsets):
+    """Number of set bits along the last axis of a uint8 array."""
+    return _POPCOUNT_TABLE[bitsets].sum(axis=-1, dtype=np.int64)
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def build_baskets(receipt_paths, lookup, chunksize=100_000):
+    """Streams receipts into a Baskets encoding.
+
+    Only (transaction, item, category) triples of menu items are kept while streaming, never the
+    full rows. Transactions with a single line are dropped, as in the notebook.
+    """
+    key_chunks, item_chunks, category_chunks = [], [], []
+    for chunk in stream_receipts(receipt_paths, lookup, chunksize):
+        key_chunks.append(transaction_keys(chunk))
+        item_chunks.append(chunk["item"].values.astype(np.int16))
+        category_chunks.append(chunk["category"].values.astype(np.int16))
+
+    n_items = len(lookup.item_names)
+    n_categories = len(lookup.category_names)
+    if not key_chunks:
+        return Baskets(lookup.item_names, lookup.item_category, lookup.category_names,
+                       np.zeros((n_items, 0), dtype=np.uint8), 0, np.zeros((n_items, n_categories), dtype=np.int64))
+
+    keys = np.concatenate(key_chunks)
+    items = np.concatenate(item_chunks)
+    categories = np.concatenate(category_chunks)
+    del key_chunks, item_chunks, category_chunks
+
+    transactions, transaction_of_line = np.unique(keys, return_inverse=True)
+    lines_per_transaction = np.bincount(transaction_of_line, minlength=len(transactions))
+    valid = lines_per_transaction > 1
+
+    # Re-index the surviving transactions densely
+    new_index = np.cumsum(valid) - 1
+    line_valid = valid[transaction_of_line]
+    transaction_of_line = new_index[transaction_of_line[line_valid]]
+    items = items[line_valid]
+    categories = categories[line_valid]
+    n_transactions = int(valid.sum())
+
+    popularity = np.bincount(items.astype(np.int64) * n_categories + categories,
+                             minlength=n_items * n_categories).reshape(n_items, n_categories)
+
+    # An item listed under several categories (e.g. Dark chocolate) is recommended under the
+    # category most of its lines were sold in
+    item_category = dict(lookup.item_category)
+    for item, name in enumerate(lookup.item_names):
+        if popularity[item].any():
+            item_category[name] = lookup.category_names[int(np.argmax(popularity[item]))]
+
+    # Group lines by item once so each item's bitset is built from a contiguous slice
+    order = np.argsort(items, kind="stable")
+    bounds = np.searchsorted(items[order], np.arange(n_items + 1))
+    item_bitsets = np.zeros((n_items, (n_transactions + 7) // 8), dtype=np.uint8)
+    present = np.zeros(n_transactions, dtype=bool)
+    for item in range(n_items):
+        present[:] = False
+        present[transaction_of_line[order[bounds[item]:bounds[item + 1]]]] = True
+        item_bitsets[item] = np.packbits(present)
+
+    return Baskets(lookup.item_names, item_category, lookup.category_names,
+                   item_bitsets, n_transactions, popularity)
@@ -0,0 +1,142 @@
+"""Trains the apriori and popularity recommendation artifacts from sales receipts.
+
+Replaces recommendation_engine_training.ipynb and writes the same two files the API reads, plus
+the per outlet x hour bucket tables of context_cubes.py (skip them with --no-cubes) and the
+per-customer lists of customer_model.py (skip them with --no-customers):
+
+    python -m training.train_recommendations \\
+        --receipts "dataset/201904 sales reciepts.csv" \\
+        --products dataset/product.csv \\
+        --output-dir api/recommendation_objects
+
+Several --receipts files (e.g. one per month) are streamed one after another.
+"""
+import argparse
+import json
+import pathlib
+import time
+import logging
+import pandas as pd
+from .receipts import ProductLookup, build_baskets
+from .frequent_itemsets import mine_frequent_itemsets, association_rules
+from .context_cubes import build_context_cubes, write_cubes, CUBES_FILE
+from .customer_model import build_customer_model, write_customer_model, CUSTOMER_MODEL_FILE
+
+logger = logging.getLogger("train_recommendations")
+
+APRIORI_FILE = "apriori_recommendations.json"
+POPULARITY_FILE = "popularity_recommendation.csv"
+
+
+def popularity_table(baskets):
+    rows = []
+    for item, name in enumerate(baskets.item_names):
+        for category, category_name in enumerate(baskets.category_names):
+            count = int(baskets.popularity[item, category])
+            if count:
+                rows.append({"product": name, "product_category": category_name, "number_of_transactions": count})
+    return pd.DataFrame(rows, columns=["product", "product_category", "number_of_transactions"])
+
+
+def apriori_recommendations(baskets, rules):
+    """Groups rules by antecedent, best confidence first, one entry per recommended product."""
+    rules_by_antecedent = {}
+    for antecedent, consequent, confidence, _ in rules:
+        rules_by_antecedent.setdefault(antecedent, []).append((confidence, consequent))
+
+    recommendations = {}
+    for antecedent, antecedent_rules in rules_by_antecedent.items():
+        key = "_".join(baskets.item_names[item] for item in antecedent)
+        recommendations[key] = []
+        seen = set()
+        for confidence, consequent in sorted(antecedent_rules, key=lambda rule: (-rule[0], rule[1])):
+            for item in consequent:
+                if item in seen:
+                    continue
+                seen.add(item)
+                name = baskets.item_names[item]
+                recommendations[key].append({
+                    "product": name,
+                    "product_category": baskets.item_category[name],
+                    "confidence": float(confidence),
+                })
+    return recommendations
+
+
+def train(receipt_paths, product_path, min_support=0.05, min_lift=1.0, chunksize=100_000, context_cubes=False,
+          customer_model=False, top_n=10, max_customers=None):
+    """Returns (apriori recommendations dict, popularity DataFrame, extras, timings).
+
+    extras holds the optional models that were asked for, by name ("cubes", "customers").
+    """
+    timings = {}
+    start = time.perf_counter()
+    lookup = ProductLookup(product_path)
+    baskets = build_baskets(receipt_paths, lookup, chunksize)
+    timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frequent = mine_frequent_itemsets(baskets.item_bitsets, baskets.n_transactions, min_support)
+    rules = association_rules(frequent, min_lift)
+    timings["mine"] = time.perf_counter() - start
+
+    logger.info("%d transactions, %d frequent itemsets, %d rules",
+                baskets.n_transactions, len(frequent), len(rules))
+
+    extras = {}
+    if context_cubes:
+        start = time.perf_counter()
+        extras["cubes"] = build_context_cubes(receipt_paths, lookup, baskets.item_category, chunksize=chunksize)
+        timings["cubes"] = time.perf_counter() - start
+    if customer_model:
+        start = time.perf_counter()
+        extras["customers"] = build_customer_model(receipt_paths, lookup, baskets.item_category, top_n,
+                                                   max_customers, chunksize)
+        timings["customers"] = time.perf_counter() - start
+    return apriori_recommendations(baskets, rules), popularity_table(baskets), extras, timings
+
+
+def write_artifacts(output_dir, recommendations, popularity, extras=None):
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / APRIORI_FILE, 'w') as json_file:
+        json.dump(recommendations, json_file)
+    popularity.to_csv(output_dir / POPULARITY_FILE, index=False)
+    extras = extras or {}
+    if "cubes" in extras:
+        write_cubes(output_dir / CUBES_FILE, extras["cubes"])
+    if "customers" in extras:
+        write_customer_model(output_dir / CUSTOMER_MODEL_FILE, extras["customers"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receipts", nargs="+", default=["dataset/201904 sales reciepts.csv"])
+    parser.add_argument("--products", default="dataset/product.csv")
+    parser.add_argument("--output-dir", default="api/recommendation_objects")
+    parser.add_argument("--min-support", type=float, default=0.05)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--no-cubes", action="store_true", help="skip the outlet x hour bucket tables")
+    parser.add_argument("--no-customers", action="store_true", help="skip the per-customer recommendations")
+    parser.add_argument("--top-n", type=int, default=10, help="recommendations kept per customer")
+    parser.add_argument("--max-customers", type=int, default=None,
+                        help="keep only the most active customers, bounding the model's size")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    recommendations, popularity, extras, timings = train(args.receipts, args.products, args.min_support,
+                                                         args.min_lift, args.chunksize, not args.no_cubes,
+                                                         not args.no_customers, args.top_n, args.max_customers)
+    write_artifacts(args.output_dir, recommendations, popularity, extras)
+    logger.info("Wrote %s and %s to %s (encode %.2fs, mine %.2fs)", APRIORI_FILE, POPULARITY_FILE,
+                args.output_dir, timings["encode"], timings["mine"])
+    if "cubes" in extras:
+        logger.info("Wrote %s (%.2fs)", CUBES_FILE, timings["cubes"])
+    if "customers" in extras:
+        logger.info("Wrote %s for %d customers (%.2fs)", CUSTOMER_MODEL_FILE,
+                    len(extras["customers"]["customer_ids"]), timings["customers"])
+
+
+if __name__ == "__main__":
+    main()